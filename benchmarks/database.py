@@ -0,0 +1,153 @@
+"""
+Creates databases with the same tables as the live one, filled with synthetic users, for benchmarks that go through the real queries.
+The tables are created by the bot's own migrations.
+"""
+
+import datetime
+import math
+import os
+import random
+import sqlite3
+from typing import Iterator
+
+from classes.beatmap_store import BEATMAP_COLUMNS, BEATMAPSET_COLUMNS
+from classes.exp import ExpBarName
+from classes.upgrade import upgrade_manager
+from init.currency_init import init_currency
+from other.migrations import migrate_database
+
+DATABASE_PATH = "./data/database.db"
+
+# Share of a user's exp that goes to each mod's exp bar, before being randomised per user. Overall is the sum of the other bars.
+EXP_BAR_SHARES: dict[str, float] = {'NM': 0.5, 'HD': 0.2, 'HR': 0.1, 'DT': 0.15, 'HT': 0.05}
+MEDIAN_TOTAL_EXP = 20_000
+TOTAL_EXP_SPREAD = 1.6  # sigma of the lognormal distribution. Most players are casual, a few have millions of exp.
+MAX_TOTAL_EXP = 50_000_000
+ACTIVE_USER_FRACTION = 0.1  # Users with scores in submitted_scores
+MEAN_SCORES_PER_ACTIVE_USER = 30
+SCORE_HISTORY_HOURS = 48  # Half of the scores are past the 24 hour retention window, so that the cleanup query has rows to delete
+NUM_BEATMAPS = 20_000
+INSERT_BATCH_SIZE = 10_000
+
+
+def discord_id_of(osu_id: int) -> int:
+    """Synthetic users' Discord IDs, kept apart from their osu! IDs so that mixing the two up shows in the results."""
+    return 10**17 + osu_id
+
+def osu_username_of(osu_id: int) -> str:
+    return f"load_test_{osu_id}"
+
+def create_database(osu_ids: list[int], database_path: str = DATABASE_PATH):
+    """Creates the database at <database_path> (replacing any existing one) with a freshly verified user for every osu! ID."""
+
+    os.makedirs(os.path.dirname(database_path), exist_ok=True)
+    if os.path.exists(database_path):
+        os.remove(database_path)
+
+    with sqlite3.connect(database_path) as conn:
+        migrate_database(conn)
+        conn.executemany("INSERT INTO exp_table (osu_username, osu_id, discord_id) VALUES (?, ?, ?)",
+                         [(osu_username_of(osu_id), osu_id, discord_id_of(osu_id)) for osu_id in osu_ids])
+        conn.executemany("INSERT INTO currency (osu_id) VALUES (?)", [(osu_id,) for osu_id in osu_ids])
+        conn.executemany("INSERT INTO upgrades (osu_id) VALUES (?)", [(osu_id,) for osu_id in osu_ids])
+    conn.close()
+
+
+def level_of(total_exp: int) -> int:
+    """Closed form of ExpBar's level calculation: the highest level L where 25 * L * (L-1) <= total exp."""
+    return (math.isqrt((4 * total_exp + 25) // 25) + 1) // 2
+
+def generate_user_rows(rng: random.Random, osu_id: int, upgrade_max_levels: dict[str, int], currency_names: list[str]) -> tuple[tuple, tuple, tuple]:
+    """Returns the user's exp_table, currency and upgrades rows."""
+
+    total_exp = min(int(rng.lognormvariate(math.log(MEDIAN_TOTAL_EXP), TOTAL_EXP_SPREAD)), MAX_TOTAL_EXP)
+    weights = {exp_bar_name: rng.gammavariate(share * 10, 1) for exp_bar_name, share in EXP_BAR_SHARES.items()}
+    total_weight = sum(weights.values())
+    exp_bars = {exp_bar_name: int(total_exp * weight / total_weight) for exp_bar_name, weight in weights.items()}
+    exp_bars['Overall'] = sum(exp_bars.values())
+
+    exp_values = []
+    for exp_bar_name in ExpBarName.list_as_str():
+        exp_values += [exp_bars[exp_bar_name], level_of(exp_bars[exp_bar_name])]
+    exp_row = (discord_id_of(osu_id), osu_id, osu_username_of(osu_id), *exp_values)
+
+    # Players with more exp have earned more currency, and spent more of it on upgrades
+    progress = min(total_exp / 5_000_000, 1)
+    currency_row = (osu_id, *(rng.randint(0, 50 + total_exp // 100) for _ in currency_names))
+    upgrades_row = (osu_id, *(int(min(max_level, 500) * progress * rng.uniform(0.5, 1)) for max_level in upgrade_max_levels.values()))
+
+    return exp_row, currency_row, upgrades_row
+
+def generate_score_rows(rng: random.Random, osu_ids: list[int], now: datetime.datetime) -> Iterator[tuple]:
+    for osu_id in osu_ids:
+        if rng.random() >= ACTIVE_USER_FRACTION:
+            continue
+
+        for _ in range(int(rng.expovariate(1 / MEAN_SCORES_PER_ACTIVE_USER))):
+            # Popular beatmaps are played much more than the rest
+            beatmap_id = min(int(rng.paretovariate(1.2)), NUM_BEATMAPS)
+            timestamp = now - datetime.timedelta(seconds=rng.randint(0, SCORE_HISTORY_HOURS * 3600))
+
+            # Stored the same way aiosqlite stores the datetime passed to it by add_score_to_database
+            yield (osu_id, beatmap_id, beatmap_id, str(timestamp.replace(microsecond=0)))
+
+def generate_beatmap_rows(rng: random.Random) -> tuple[list[tuple], list[tuple]]:
+    beatmap_rows = []
+    beatmapset_rows = []
+    for beatmap_id in range(1, NUM_BEATMAPS + 1):
+        beatmap = {
+            'id': beatmap_id, 'beatmapset_id': beatmap_id, 'url': f"https://osu.ppy.sh/beatmaps/{beatmap_id}", 'mode': "taiko",
+            'difficulty_name': f"Synthetic {beatmap_id}", 'od': 5.0, 'hp': 5.0, 'num_notes': rng.randint(100, 4000), 'num_sliders': 0,
+            'num_spinners': 0, 'drain_time': rng.randint(30, 600), 'status': "ranked", 'checksum': f"{rng.getrandbits(128):032x}",
+        }
+        beatmapset = {
+            'id': beatmap_id, 'artist': "Synthetic Artist", 'artist_unicode': "Synthetic Artist", 'title': f"Synthetic Song {beatmap_id}",
+            'title_unicode': f"Synthetic Song {beatmap_id}", 'creator': "Synthetic Mapper",
+        }
+        beatmap_rows.append(tuple(beatmap[column] for column in BEATMAP_COLUMNS))
+        beatmapset_rows.append(tuple(beatmapset[column] for column in BEATMAPSET_COLUMNS))
+    return beatmap_rows, beatmapset_rows
+
+def batched(rows: Iterator[tuple], batch_size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate_large_database(num_users: int, database_path: str, seed: int = 0):
+    """
+    Creates a database at <database_path> (replacing any existing one) with <num_users> users, their recent scores and a set of beatmaps.
+    The same seed always generates the same database, apart from score timestamps being relative to now.
+    """
+
+    rng = random.Random(seed)
+    upgrade_max_levels = {upgrade_id: upgrade.max_level for upgrade_id, upgrade in upgrade_manager.upgrades.items()}
+    currency_names = list(init_currency().keys())
+    osu_ids = list(range(1, num_users + 1))
+
+    os.makedirs(os.path.dirname(database_path) or ".", exist_ok=True)
+    if os.path.exists(database_path):
+        os.remove(database_path)
+
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("PRAGMA synchronous=OFF")  # Only for this connection. It is a throwaway database, so durability doesn't matter.
+        migrate_database(conn)
+
+        for batch_start in range(0, num_users, INSERT_BATCH_SIZE):
+            user_rows = [generate_user_rows(rng, osu_id, upgrade_max_levels, currency_names) for osu_id in osu_ids[batch_start:batch_start + INSERT_BATCH_SIZE]]
+            conn.executemany(f"INSERT INTO exp_table VALUES ({', '.join('?' * len(user_rows[0][0]))})", [rows[0] for rows in user_rows])
+            conn.executemany(f"INSERT INTO currency VALUES ({', '.join('?' * len(user_rows[0][1]))})", [rows[1] for rows in user_rows])
+            conn.executemany(f"INSERT INTO upgrades VALUES ({', '.join('?' * len(user_rows[0][2]))})", [rows[2] for rows in user_rows])
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for batch in batched(generate_score_rows(rng, osu_ids, now), INSERT_BATCH_SIZE):
+            conn.executemany("INSERT INTO submitted_scores VALUES (?, ?, ?, ?)", batch)
+
+        beatmap_rows, beatmapset_rows = generate_beatmap_rows(rng)
+        conn.executemany(f"INSERT INTO beatmaps ({', '.join(BEATMAP_COLUMNS)}) VALUES ({', '.join('?' * len(BEATMAP_COLUMNS))})", beatmap_rows)
+        conn.executemany(f"INSERT INTO beatmapsets ({', '.join(BEATMAPSET_COLUMNS)}) VALUES ({', '.join('?' * len(BEATMAPSET_COLUMNS))})", beatmapset_rows)
+    conn.close()
@@ -0,0 +1,330 @@
+"""
+Shows how a change to the reward formulas (the upgrades in init/upgrade_init.py, the exp formula in ExpManager, level up bonuses, ...)
+would affect the player base, before it is deployed.
+
+Every user's scores are replayed from scratch twice: once with the code of a baseline git revision, and once with a candidate source tree
+(the working tree by default). Both runs go through the bot's own ExpManager and CurrencyManager, so any change to the reward code is picked up
+without having to describe it to the simulator. The before/after distributions of levels and Taiko Tokens and the change in leaderboard order are printed.
+
+Scores are either generated (deterministically from the seed, so both runs see the same scores) or read from the score archive.
+They are replayed in /submit-sized sessions. After each session, the level up bonus is paid and the user buys the cheapest upgrade levels they
+can afford, as long as they can afford any. Users are split across a process pool, each process importing the reward code from its tree.
+
+Usage (from the repo root): python -m benchmarks.economy_simulator [--baseline HEAD] [--candidate .] [--corpus synthetic|archive]
+                            [--users N] [--scores-per-user N] [--session-size N] [--workers N] [--seed N]
+"""
+
+# Only the standard library is imported here. Worker processes import this module before they put their tree on sys.path,
+# so importing the bot's modules here would make both runs use the same code.
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, NamedTuple, Optional
+
+HD_BITMASK = 1 << 3
+HR_BITMASK = 1 << 4
+DT_BITMASK = 1 << 6
+HT_BITMASK = 1 << 8
+
+# Mod combinations of generated scores, with their share of plays
+SYNTHETIC_MOD_SHARES: dict[int, float] = {0: 0.55, HD_BITMASK: 0.18, HR_BITMASK: 0.06, DT_BITMASK: 0.08, HD_BITMASK | DT_BITMASK: 0.06,
+                                          HD_BITMASK | HR_BITMASK: 0.05, HT_BITMASK: 0.02}
+SCORES_PER_USER_SPREAD = 1.2  # sigma of the lognormal distribution. Most users submit a little, a few submit a lot.
+PASS_RATE = 0.85
+USERS_PER_TASK = 50
+TOP_N = 100  # Size of the leaderboard top compared between runs
+NUM_MOVERS_SHOWN = 5
+RUNAWAY_LEVEL = 10_000  # Overall level no real player gets to. Past it, a user's rewards are compounding on themselves and they stop being simulated.
+
+
+class ScoreStats(NamedTuple):
+    """What the reward code needs to know about a score. od and drain time are already adjusted for mods."""
+
+    mods_bitmask: int
+    is_pass: bool
+    num_300s: int
+    num_100s: int
+    num_misses: int
+    num_notes: int
+    sr: float
+    od: float
+    drain_time: int
+
+
+class UserResult(NamedTuple):
+    osu_id: int
+    num_scores: int
+    overall_exp: int
+    overall_level: int
+    tokens_held: int
+    tokens_earned: int
+    upgrade_levels: int
+    is_runaway: bool  # Stopped being simulated past RUNAWAY_LEVEL, or once their exp got too big for a float
+
+
+def generate_user_scores(osu_id: int, seed: int, mean_scores_per_user: float) -> list[ScoreStats]:
+    """A user's scores, oldest first. The same osu! ID and seed always generate the same scores."""
+
+    rng = random.Random(f"{seed}-{osu_id}")
+    num_scores = max(1, int(rng.lognormvariate(math.log(mean_scores_per_user) - SCORES_PER_USER_SPREAD ** 2 / 2, SCORES_PER_USER_SPREAD)))
+    skill = rng.uniform(1.5, 6.5)  # Star rating the user is comfortable at
+    improvement = rng.uniform(0, 2) / num_scores  # Players get better the more they play
+    mod_combinations = list(SYNTHETIC_MOD_SHARES.keys())
+    mod_weights = [share * rng.uniform(0.2, 3) for share in SYNTHETIC_MOD_SHARES.values()]  # Every player has their own favourite mods
+
+    scores = []
+    for _ in range(num_scores):
+        mods_bitmask = rng.choices(mod_combinations, mod_weights)[0]
+        sr = max(0.5, rng.gauss(skill, 0.8))
+        num_notes = rng.randint(150, 2500)
+        drain_time = int(num_notes * rng.uniform(0.15, 0.3))
+        od = rng.uniform(4, 9)
+        if mods_bitmask & HR_BITMASK:
+            od = min(od * 1.4, 10)
+        if mods_bitmask & DT_BITMASK:
+            drain_time = int(drain_time / 1.5)
+        elif mods_bitmask & HT_BITMASK:
+            drain_time = int(drain_time / 0.75)
+
+        # Harder maps than the user is used to are failed and quit out of more, and played less accurately
+        difficulty = sr - skill
+        is_pass = rng.random() < PASS_RATE - max(difficulty, 0) * 0.2
+        num_judged = num_notes if is_pass or rng.random() < 0.3 else int(num_notes * rng.uniform(0.05, 1))
+        miss_rate = min(max(rng.gauss(0.02 + difficulty * 0.02, 0.01), 0), 0.5)
+        ok_rate = min(max(rng.gauss(0.08 + difficulty * 0.03, 0.03), 0), 1 - miss_rate)
+        num_misses = int(num_judged * miss_rate)
+        num_100s = int(num_judged * ok_rate)
+        scores.append(ScoreStats(mods_bitmask, is_pass, num_judged - num_misses - num_100s, num_100s, num_misses, num_notes, round(sr, 2), od, drain_time))
+        skill += improvement
+
+    return scores
+
+def load_archive_scores() -> dict[int, list[ScoreStats]]:
+    """Every user's archived scores, oldest first. The whole corpus is kept in memory, as ScoreStats take a fraction of the size of Scores."""
+
+    from classes.score_archive import iter_chunks
+
+    columns = ["osu_id", "timestamp"] + list(ScoreStats._fields)
+    user_scores: dict[int, list[tuple[int, ScoreStats]]] = {}
+    for chunk in iter_chunks(columns):
+        for osu_id, timestamp, *stats in zip(*chunk.values()):
+            user_scores.setdefault(osu_id, []).append((timestamp, ScoreStats(*stats)))
+
+    return {osu_id: [stats for _, stats in sorted(scores, key=lambda score: score[0])] for osu_id, scores in user_scores.items()}
+
+# Modules of the tree that the worker process simulates, set by initialise_worker
+reward_code: dict[str, Any] = {}
+
+def initialise_worker(tree_directory: str):
+    """Makes the reward code be imported from <tree_directory>. Runs once in every worker process, before anything from the bot is imported."""
+
+    sys.path.insert(0, tree_directory)
+    import other.utility  # classes/ has circular imports that only resolve in the order the bot imports them
+    from classes.beatmap import Beatmap, BeatmapAttributes
+    from classes.currency import CurrencyManager
+    from classes.exp import ExpBar, ExpBarName, ExpManager
+    from classes.mod import MOD_BITMASKS, intern_mods
+    from classes.score import Score
+    from classes.upgrade import upgrade_manager
+    from init.currency_init import init_currency
+
+    reward_code.update(Beatmap=Beatmap, BeatmapAttributes=BeatmapAttributes, CurrencyManager=CurrencyManager, ExpBar=ExpBar, ExpBarName=ExpBarName,
+                       ExpManager=ExpManager, MOD_BITMASKS=MOD_BITMASKS, intern_mods=intern_mods, Score=Score, upgrade_manager=upgrade_manager,
+                       init_currency=init_currency, mods_by_bitmask={})
+
+def create_score(osu_id: int, stats: ScoreStats) -> Any:
+    mods = reward_code['mods_by_bitmask'].get(stats.mods_bitmask, None)
+    if mods is None:
+        acronyms = [acronym for acronym, bitmask in reward_code['MOD_BITMASKS'].items() if bitmask and stats.mods_bitmask & bitmask]
+        mods = reward_code['mods_by_bitmask'][stats.mods_bitmask] = reward_code['intern_mods']([{'acronym': acronym} for acronym in acronyms])
+
+    # od and drain time are already mod-adjusted, so they are stored on the beatmap and the attributes are given no mods to adjust them by
+    beatmap = reward_code['Beatmap'](0, 0, "", "taiko", "", stats.od, 0, stats.num_notes, 0, 0, stats.drain_time, "ranked", None)
+    beatmap_attributes = reward_code['BeatmapAttributes'](beatmap, 0, stats.sr)
+    accuracy = (stats.num_300s + stats.num_100s / 2) / max(stats.num_300s + stats.num_100s + stats.num_misses, 1) * 100
+    return reward_code['Score'](f"simulated_{osu_id}", osu_id, 0, stats.num_300s, stats.num_100s, stats.num_misses, accuracy,
+                                mods, None, stats.is_pass, beatmap, beatmap_attributes, None)
+
+def buy_cheapest_upgrades(upgrade_levels: dict[str, int], currency: dict[str, int]) -> int:
+    """Buys the cheapest upgrade level the user can afford until they can't afford any. Returns the number of levels bought."""
+
+    upgrades = reward_code['upgrade_manager'].upgrades
+    num_bought = 0
+    while True:
+        affordable = [(upgrade.cost(upgrade_levels[upgrade.id] + 1), upgrade) for upgrade in upgrades.values()
+                      if upgrade_levels[upgrade.id] < upgrade.max_level and upgrade.cost(upgrade_levels[upgrade.id] + 1) <= currency[upgrade.cost_currency_unit]]
+        if not affordable:
+            return num_bought
+        cost, upgrade = min(affordable, key=lambda affordable_upgrade: affordable_upgrade[0])
+        currency[upgrade.cost_currency_unit] -= cost
+        upgrade_levels[upgrade.id] += 1
+        num_bought += 1
+
+def simulate_user(osu_id: int, scores: list[ScoreStats], session_size: int) -> UserResult:
+    exp_bars = {exp_bar_name: reward_code['ExpBar'](0) for exp_bar_name in reward_code['ExpBarName'].list_as_str()}
+    currency = {currency_name: 0 for currency_name in reward_code['init_currency']().keys()}
+    upgrade_levels = {upgrade_id: 0 for upgrade_id in reward_code['upgrade_manager'].upgrades.keys()}
+    tokens_earned = 0
+    num_scores = 0
+    is_runaway = False
+
+    for session_start in range(0, len(scores), session_size):
+        # Same as a /submit: the managers start from the user's current state, and the level up bonus is paid at the end
+        exp_manager = reward_code['ExpManager'](exp_bars, upgrade_levels)
+        currency_manager = reward_code['CurrencyManager'](currency, upgrade_levels)
+        try:
+            for stats in scores[session_start:session_start + session_size]:
+                score = create_score(osu_id, stats)
+                exp_manager.calculate_one_score(score)
+                tokens_earned += currency_manager.calculate_one_score(score).get('taiko_tokens', 0)
+                num_scores += 1
+            tokens_earned += currency_manager.calculate_levelup_bonus(exp_manager).get('taiko_tokens', 0)
+        except OverflowError:
+            is_runaway = True
+
+        exp_bars = exp_manager.current_user_exp_bars
+        currency = currency_manager.current_user_currency
+        if is_runaway or exp_bars['Overall'].level > RUNAWAY_LEVEL:
+            is_runaway = True
+            break
+        buy_cheapest_upgrades(upgrade_levels, currency)
+
+    return UserResult(osu_id, num_scores, exp_bars['Overall'].total_exp, exp_bars['Overall'].level, currency.get('taiko_tokens', 0), tokens_earned,
+                      sum(upgrade_levels.values()), is_runaway)
+
+def simulate_users(users: list[tuple[int, Optional[list[ScoreStats]]]], session_size: int, seed: int, mean_scores_per_user: float) -> list[UserResult]:
+    """Simulates a batch of users in a worker. Users without scores get generated ones."""
+
+    results = []
+    for osu_id, scores in users:
+        if scores is None:
+            scores = generate_user_scores(osu_id, seed, mean_scores_per_user)
+        results.append(simulate_user(osu_id, scores, session_size))
+    return results
+
+def batched(users: Iterator[tuple[int, Optional[list[ScoreStats]]]], batch_size: int) -> Iterator[list[tuple[int, Optional[list[ScoreStats]]]]]:
+    batch = []
+    for user in users:
+        batch.append(user)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_simulation(name: str, tree_directory: str, users: list[tuple[int, Optional[list[ScoreStats]]]], args: argparse.Namespace) -> dict[int, UserResult]:
+    # Forked workers would inherit the modules already imported by this process, instead of importing them from their own tree
+    context = multiprocessing.get_context("spawn")
+    results: dict[int, UserResult] = {}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=initialise_worker, initargs=(os.path.abspath(tree_directory),)) as executor:
+        futures = [executor.submit(simulate_users, batch, args.session_size, args.seed, args.scores_per_user) for batch in batched(iter(users), USERS_PER_TASK)]
+        for index, future in enumerate(futures):
+            for result in future.result():
+                results[result.osu_id] = result
+            if (index + 1) % max(len(futures) // 10, 1) == 0:
+                print(f"  {name}: {len(results)}/{len(users)} users, {time.perf_counter() - start:.0f}s", file=sys.stderr)
+
+    num_scores = sum(result.num_scores for result in results.values())
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {len(results)} users, {num_scores} scores in {elapsed:.1f}s ({num_scores / elapsed:,.0f} scores/s)")
+    runaway_users = [result for result in results.values() if result.is_runaway]
+    if runaway_users:
+        first_runaway = min(runaway_users, key=lambda result: result.num_scores)
+        print(f"  {len(runaway_users)} users went past level {RUNAWAY_LEVEL:,} and were stopped, the first after {first_runaway.num_scores} scores. "
+              f"They are left out of the distributions below.")
+    return results
+
+def export_git_revision(revision: str, directory: str):
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def print_distributions(baseline: dict[int, UserResult], candidate: dict[int, UserResult]):
+    fractions = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+    print(f"\n{'':<24}{'':<11}" + "".join(f"{f'p{fraction * 100:g}':>11}" for fraction in fractions) + f"{'max':>11}{'mean':>11}")
+
+    for field, label in [("overall_level", "Overall level"), ("overall_exp", "Overall exp"), ("tokens_earned", "Taiko Tokens earned"),
+                         ("tokens_held", "Taiko Tokens held"), ("upgrade_levels", "Upgrade levels bought")]:
+        for run_name, results in [("baseline", baseline), ("candidate", candidate)]:
+            values = sorted(getattr(result, field) for result in results.values() if not result.is_runaway)
+            if not values:
+                print(f"{label if run_name == 'baseline' else '':<24}{run_name:<11}every user ran away")
+                continue
+            row = [percentile(values, fraction) for fraction in fractions] + [values[-1], sum(values) / len(values)]
+            print(f"{label if run_name == 'baseline' else '':<24}{run_name:<11}" + "".join(f"{value:>11,.0f}" for value in row))
+
+def get_ranks(results: dict[int, UserResult]) -> dict[int, int]:
+    """Leaderboard rank of every user by Overall exp, 1 being the top. Runaway users are at the top. Ties are broken by osu! ID."""
+
+    ordered = sorted(results.values(), key=lambda result: (not result.is_runaway, -result.overall_exp, result.osu_id))
+    return {result.osu_id: rank for rank, result in enumerate(ordered, start=1)}
+
+def print_leaderboard_changes(baseline: dict[int, UserResult], candidate: dict[int, UserResult]):
+    baseline_ranks = get_ranks(baseline)
+    candidate_ranks = get_ranks(candidate)
+    num_users = len(baseline_ranks)
+    rank_changes = {osu_id: baseline_ranks[osu_id] - candidate_ranks[osu_id] for osu_id in baseline_ranks}  # Positive means the user went up
+
+    spearman = 1 - 6 * sum(change ** 2 for change in rank_changes.values()) / (num_users * (num_users ** 2 - 1)) if num_users > 1 else 1
+    baseline_top = {osu_id for osu_id, rank in baseline_ranks.items() if rank <= TOP_N}
+    candidate_top = {osu_id for osu_id, rank in candidate_ranks.items() if rank <= TOP_N}
+
+    print("\nOverall leaderboard")
+    print(f"  Spearman rank correlation: {spearman:.4f}")
+    print(f"  Users still in the top {TOP_N}: {len(baseline_top & candidate_top)}/{min(TOP_N, num_users)}")
+    print(f"  Mean rank change: {sum(abs(change) for change in rank_changes.values()) / num_users:.1f}")
+    print(f"  Users whose rank changed: {sum(1 for change in rank_changes.values() if change)}/{num_users}")
+
+    movers = sorted(rank_changes.items(), key=lambda item: item[1])
+    for label, users in [("Biggest risers", reversed(movers[-NUM_MOVERS_SHOWN:])), ("Biggest fallers", movers[:NUM_MOVERS_SHOWN])]:
+        print(f"  {label}: " + ", ".join(f"{osu_id} (#{baseline_ranks[osu_id]} -> #{candidate_ranks[osu_id]})" for osu_id, change in users if change))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default="HEAD", help="git revision whose reward code is the baseline")
+    parser.add_argument("--candidate", default=".", help="Directory of the source tree with the candidate reward code")
+    parser.add_argument("--corpus", choices=["synthetic", "archive"], default="synthetic")
+    parser.add_argument("--users", type=int, default=10_000, help="Synthetic users to simulate")
+    parser.add_argument("--scores-per-user", type=float, default=1000, help="Mean number of scores of a synthetic user")
+    parser.add_argument("--session-size", type=int, default=50, help="Scores per /submit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.corpus == "archive":
+        import benchmarks.offline
+        users: list[tuple[int, Optional[list[ScoreStats]]]] = list(load_archive_scores().items())
+    else:
+        users = [(osu_id, None) for osu_id in range(1, args.users + 1)]
+    if not users:
+        sys.exit("No scores to simulate")
+
+    # Worker processes import the bot's modules, which read these
+    from benchmarks.offline import PLACEHOLDER_ENVIRONMENT_VARIABLES
+    for name, value in PLACEHOLDER_ENVIRONMENT_VARIABLES.items():
+        os.environ.setdefault(name, value)
+
+    with tempfile.TemporaryDirectory() as baseline_directory:
+        export_git_revision(args.baseline, baseline_directory)
+        baseline = run_simulation(f"baseline ({args.baseline})", baseline_directory, users, args)
+    candidate = run_simulation(f"candidate ({args.candidate})", args.candidate, users, args)
+
+    print_distributions(baseline, candidate)
+    print_leaderboard_changes(baseline, candidate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Stand-ins for the parts of discord.py that /submit uses, recording every message instead of sending it.
+Sends take a configurable amount of time, since Discord's latency is part of how long /submit takes.
+"""
+
+import asyncio
+import time
+from typing import Any, Optional
+
+# Discord invalidates an interaction that isn't responded to within this many seconds
+INTERACTION_RESPONSE_DEADLINE = 3.0
+
+
+class FakeUser:
+    id: int
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class SentMessageRecorder:
+    """Shared by every fake sender of one interaction, so that all messages are recorded in order."""
+
+    send_latency: float
+    messages: list[tuple[float, Optional[str], Any]]  # (seconds since the interaction was created, content, embed)
+    start_time: float
+
+    def __init__(self, send_latency: float):
+        self.send_latency = send_latency
+        self.messages = []
+        self.start_time = time.perf_counter()
+
+    async def record(self, content: Optional[str], embed: Any):
+        await asyncio.sleep(self.send_latency)
+        self.messages.append((time.perf_counter() - self.start_time, content, embed))
+
+
+class FakeMessage:
+    recorder: SentMessageRecorder
+
+    def __init__(self, recorder: SentMessageRecorder):
+        self.recorder = recorder
+
+    async def edit(self, content: Optional[str] = None, embed: Any = None, **kwargs):
+        await self.recorder.record(content, embed)
+
+
+class FakeInteractionResponse:
+    recorder: SentMessageRecorder
+    response_time: Optional[float]  # Seconds until the initial response, which has to be under INTERACTION_RESPONSE_DEADLINE
+
+    def __init__(self, recorder: SentMessageRecorder):
+        self.recorder = recorder
+        self.response_time = None
+
+    async def send_message(self, content: Optional[str] = None, embed: Any = None, **kwargs):
+        await self.recorder.record(content, embed)
+        self.response_time = time.perf_counter() - self.recorder.start_time
+
+    def is_done(self) -> bool:
+        return self.response_time is not None
+
+
+class FakeWebhook:
+    recorder: SentMessageRecorder
+
+    def __init__(self, recorder: SentMessageRecorder):
+        self.recorder = recorder
+
+    async def send(self, content: Optional[str] = None, embed: Any = None, **kwargs):
+        await self.recorder.record(content, embed)
+
+
+class FakeInteraction:
+    """Has the attributes of discord.Interaction that /submit uses."""
+
+    user: FakeUser
+    recorder: SentMessageRecorder
+    response: FakeInteractionResponse
+    followup: FakeWebhook
+
+    def __init__(self, discord_id: int, send_latency: float):
+        self.user = FakeUser(discord_id)
+        self.recorder = SentMessageRecorder(send_latency)
+        self.response = FakeInteractionResponse(self.recorder)
+        self.followup = FakeWebhook(self.recorder)
+
+    async def original_response(self) -> FakeMessage:
+        return FakeMessage(self.recorder)
+
+    def timed_out(self) -> bool:
+        return self.response.response_time is None or self.response.response_time > INTERACTION_RESPONSE_DEADLINE
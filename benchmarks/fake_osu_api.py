@@ -0,0 +1,183 @@
+"""
+A local stand-in for the osu! endpoints the bot uses, for load testing without touching osu! or its rate limits.
+Beatmaps and scores are generated deterministically from their ids, so every run of the simulator sees the same data.
+
+Point the bot at it by setting OSU_WEBSITE_URL before the bot's modules are imported.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import random
+from collections import Counter
+from typing import Any
+
+from aiohttp import web
+
+NUM_BEATMAPS = 300  # Small enough that users share beatmaps, like they do in practice
+MOD_COMBINATIONS = [[], [], [], ["HD"], ["HD"], ["HR"], ["HD", "HR"], ["DT"], ["HD", "DT"], ["HT"], ["NC"], ["FL"]]
+
+
+class FakeOsuApiConfig:
+    latency: float  # Seconds added to every response
+    latency_jitter: float  # Up to this many extra seconds, chosen randomly
+    rate_limit_probability: float  # Chance that a request gets a 429 instead of a response
+
+    def __init__(self, latency: float = 0.05, latency_jitter: float = 0.05, rate_limit_probability: float = 0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_probability = rate_limit_probability
+
+
+class FakeOsuApi:
+    """Serves generated beatmaps and scores, and counts every request per route."""
+
+    config: FakeOsuApiConfig
+    request_counts: Counter[str]
+    rate_limited_counts: Counter[str]
+    osu_files: dict[int, bytes]  # beatmap_id: .osu file, generated when first needed
+    rng: random.Random
+
+    def __init__(self, config: FakeOsuApiConfig, seed: int = 0):
+        self.config = config
+        self.request_counts = Counter()
+        self.rate_limited_counts = Counter()
+        self.osu_files = {}
+        self.rng = random.Random(seed)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.simulate_network])
+        app.router.add_post("/oauth/token", self.token)
+        app.router.add_get("/api/v2/users/{user_id}/scores/recent", self.recent_scores)
+        app.router.add_get("/api/v2/users", self.users)
+        app.router.add_get("/api/v2/scores/taiko/{score_id}", self.score)
+        app.router.add_post("/api/v2/beatmaps/{beatmap_id}/attributes", self.beatmap_attributes)
+        app.router.add_get("/api/v2/beatmaps/lookup", self.beatmap_lookup)
+        app.router.add_get("/osu/{beatmap_id}", self.osu_file)
+        return app
+
+    @web.middleware
+    async def simulate_network(self, request: web.Request, handler) -> web.StreamResponse:
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource is not None else request.path
+        self.request_counts[route] += 1
+
+        await asyncio.sleep(self.config.latency + self.rng.uniform(0, self.config.latency_jitter))
+
+        if self.rng.random() < self.config.rate_limit_probability:
+            self.rate_limited_counts[route] += 1
+            return web.json_response({'error': "Too Many Attempts."}, status=429, headers={'Retry-After': "60"})
+
+        return await handler(request)
+
+    async def token(self, request: web.Request) -> web.Response:
+        return web.json_response({'token_type': "Bearer", 'expires_in': 86400, 'access_token': "fake-access-token"})
+
+    async def recent_scores(self, request: web.Request) -> web.Response:
+        user_id = int(request.match_info['user_id'])
+        limit = min(int(request.query.get('limit', 100)), 100)
+        return web.json_response([self.score_info(user_id, score_index) for score_index in range(limit)])
+
+    async def score(self, request: web.Request) -> web.Response:
+        user_id, score_index = divmod(int(request.match_info['score_id']), 1000)  # Inverse of the ids given by score_info
+        return web.json_response(self.score_info(user_id, score_index))
+
+    async def users(self, request: web.Request) -> web.Response:
+        from benchmarks.database import osu_username_of  # Imports the bot's modules, which need benchmarks.offline's environment first
+
+        user_ids = [int(user_id) for user_id in request.query.getall('ids[]', [])][:50]
+        return web.json_response({'users': [{'id': user_id, 'username': osu_username_of(user_id)} for user_id in user_ids]})
+
+    async def beatmap_attributes(self, request: web.Request) -> web.Response:
+        beatmap_id = int(request.match_info['beatmap_id'])
+        return web.json_response({'attributes': {'star_rating': random.Random(beatmap_id).uniform(1, 8), 'max_combo': 1000}})
+
+    async def beatmap_lookup(self, request: web.Request) -> web.Response:
+        checksum = request.query.get('checksum', "")
+        for beatmap_id in range(1, NUM_BEATMAPS + 1):
+            if self.beatmap_checksum(beatmap_id) == checksum:
+                return web.json_response(self.beatmap_info(beatmap_id) | {'beatmapset': self.beatmapset_info(beatmap_id)})
+        return web.json_response({'error': None}, status=404)
+
+    async def osu_file(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.get_osu_file(int(request.match_info['beatmap_id'])), content_type="text/plain")
+
+    def get_osu_file(self, beatmap_id: int) -> bytes:
+        """A taiko beatmap of single notes at a random BPM, with a random mix of centre and rim hits."""
+
+        osu_file = self.osu_files.get(beatmap_id, None)
+        if osu_file is None:
+            rng = random.Random(beatmap_id)
+            beat_length = 60000 / rng.randint(120, 240)
+            snap = rng.choice([2, 4])
+
+            lines = ["osu file format v14", "", "[General]", "Mode: 1", "", "[Difficulty]", "OverallDifficulty:5", "HPDrainRate:5",
+                     "SliderMultiplier:1.4", "SliderTickRate:1", "", "[TimingPoints]", f"0,{beat_length},4,1,0,100,1,0", "", "[HitObjects]"]
+            for note_index in range(self.num_notes(beatmap_id)):
+                hit_sound = rng.choice([0, 0, 2, 8])
+                lines.append(f"256,192,{int(1000 + note_index * beat_length / snap)},1,{hit_sound},0:0:0:0:")
+
+            osu_file = "\n".join(lines).encode()
+            self.osu_files[beatmap_id] = osu_file
+        return osu_file
+
+    def num_notes(self, beatmap_id: int) -> int:
+        return random.Random(-beatmap_id).randint(200, 1500)
+
+    def beatmap_checksum(self, beatmap_id: int) -> str:
+        return hashlib.md5(self.get_osu_file(beatmap_id)).hexdigest()
+
+    def beatmap_info(self, beatmap_id: int) -> dict[str, Any]:
+        return {
+            'id': beatmap_id,
+            'beatmapset_id': beatmap_id,
+            'url': f"https://osu.ppy.sh/beatmaps/{beatmap_id}",
+            'mode': "taiko",
+            'version': f"Load Test {beatmap_id}",
+            'accuracy': 5,
+            'drain': 5,
+            'count_circles': self.num_notes(beatmap_id),
+            'count_sliders': 0,
+            'count_spinners': 0,
+            'hit_length': self.num_notes(beatmap_id) // 4,
+            'status': "ranked",
+            'checksum': self.beatmap_checksum(beatmap_id),
+        }
+
+    def beatmapset_info(self, beatmap_id: int) -> dict[str, Any]:
+        return {
+            'id': beatmap_id,
+            'artist': "Load Test Artist",
+            'artist_unicode': "Load Test Artist",
+            'title': f"Load Test Song {beatmap_id}",
+            'title_unicode': f"Load Test Song {beatmap_id}",
+            'creator': "Load Test Mapper",
+        }
+
+    def score_info(self, user_id: int, score_index: int) -> dict[str, Any]:
+        """The <score_index>th most recent score of a user, in the format of the osu! API (x-api-version 20220705)."""
+
+        rng = random.Random(user_id * 1000 + score_index)
+        beatmap_id = rng.randint(1, NUM_BEATMAPS)
+        num_notes = self.num_notes(beatmap_id)
+        num_misses = rng.randint(0, num_notes // 20)
+        num_100s = rng.randint(0, (num_notes - num_misses) // 5)
+        num_300s = num_notes - num_misses - num_100s
+        ended_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5 * score_index + 1)
+
+        return {
+            'id': user_id * 1000 + score_index,
+            'accuracy': (num_300s + 0.5 * num_100s) / num_notes,
+            'ended_at': ended_at.replace(microsecond=0).isoformat().replace("+00:00", "Z"),
+            'passed': rng.random() < 0.9,
+            'mods': [{'acronym': mod_acronym} for mod_acronym in rng.choice(MOD_COMBINATIONS)],
+            'statistics': {'great': num_300s, 'ok': num_100s, 'miss': num_misses},
+            'user': {'id': user_id, 'username': f"load_test_{user_id}"},
+            'beatmap': self.beatmap_info(beatmap_id),
+            'beatmapset': self.beatmapset_info(beatmap_id),
+        }
+
+async def start_fake_osu_api(fake_osu_api: FakeOsuApi, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(fake_osu_api.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
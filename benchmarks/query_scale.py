@@ -0,0 +1,280 @@
+"""
+Times every query path of the bot against synthetic databases of increasing size, and shows the query plan SQLite picks for each.
+Used to decide which indexes and caches pay off before changing the live database.
+
+Usage (from the repo root):
+    python -m benchmarks.query_scale [--sizes 10000,100000,1000000] [--regenerate] [--create-index "CREATE INDEX ..."] [--output report.md]
+
+Databases are generated once per size (see benchmarks/database.py) and reused by later runs.
+--create-index adds indexes for the duration of the run only, so the same databases can be compared with and without them.
+Writes are rolled back after every iteration so that every iteration sees the same data, which means commit (fsync) time isn't included.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from typing import Callable
+
+import benchmarks.offline  # Has to be imported before the bot's modules
+from benchmarks.database import NUM_BEATMAPS, discord_id_of, generate_large_database, osu_username_of
+from classes.beatmap_store import BEATMAP_COLUMNS
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_DATABASE_DIRECTORY = "./data/benchmark_databases"
+MAX_ITERATIONS = 200
+TIME_BUDGET_PER_QUERY_PATH = 2.0  # Seconds. Slow paths (full scans on big databases) stop early, after at least MIN_ITERATIONS.
+MIN_ITERATIONS = 3
+EXP_BAR_COLUMNS = ["overall", "nm", "hd", "hr", "dt", "ht"]
+
+
+class QueryPath:
+    """The statements run by one function of the bot, in order, with a way to pick realistic parameters for them."""
+
+    name: str
+    source: str  # Where the statements come from. Update the statements here when changing them there.
+    statements: list[str]
+    make_parameters: Callable[[random.Random, int], list[tuple]]  # (rng, num_users) -> parameters of each statement
+    is_write: bool
+
+    def __init__(self, name: str, source: str, statements: list[str], make_parameters: Callable[[random.Random, int], list[tuple]], is_write: bool = False):
+        self.name = name
+        self.source = source
+        self.statements = statements
+        self.make_parameters = make_parameters
+        self.is_write = is_write
+
+
+def random_osu_id(rng: random.Random, num_users: int) -> int:
+    return rng.randint(1, num_users)
+
+def leaderboard_page_query(lb_type: str) -> str:
+    return f"""
+        SELECT dense_rank() OVER (ORDER BY {lb_type}_exp DESC) AS ranking, osu_username, {lb_type}_level, {lb_type}_exp
+        FROM exp_table ORDER BY {lb_type}_exp DESC LIMIT 10 OFFSET ?
+        """
+
+def leaderboard_user_query(lb_type: str) -> str:
+    return f"""
+        WITH data AS (
+            SELECT dense_rank() OVER (ORDER BY {lb_type}_exp DESC) AS ranking, osu_username, {lb_type}_level, {lb_type}_exp, discord_id
+            FROM exp_table ORDER BY {lb_type}_exp DESC)
+        SELECT ranking, osu_username, {lb_type}_level, {lb_type}_exp FROM data WHERE discord_id = ?
+        """
+
+def recent_timestamp(rng: random.Random) -> str:
+    return f"2024-01-01 {rng.randint(0, 23):02}:{rng.randint(0, 59):02}:{rng.randint(0, 59):02}+00:00"
+
+QUERY_PATHS: list[QueryPath] = [
+    QueryPath("is_verified", "other/utility.py is_verified",
+              ["SELECT 1 FROM exp_table WHERE discord_id=?"],
+              lambda rng, n: [(discord_id_of(random_osu_id(rng, n)),)]),
+    QueryPath("user_is_in_database(osu_username)", "other/utility.py user_is_in_database",
+              ["SELECT 1 FROM exp_table WHERE osu_username=? COLLATE NOCASE"],
+              lambda rng, n: [(osu_username_of(random_osu_id(rng, n)),)]),
+    QueryPath("get_osu_id(discord_id)", "other/utility.py get_osu_id",
+              ["SELECT osu_id FROM exp_table WHERE discord_id=?"],
+              lambda rng, n: [(discord_id_of(random_osu_id(rng, n)),)]),
+    QueryPath("get_osu_id(osu_username)", "other/utility.py get_osu_id",
+              ["SELECT osu_id FROM exp_table WHERE osu_username=? COLLATE NOCASE"],
+              lambda rng, n: [(osu_username_of(random_osu_id(rng, n)),)]),
+    QueryPath("get_discord_id(osu_id)", "other/utility.py get_discord_id",
+              ["SELECT discord_id FROM exp_table WHERE osu_id=?"],
+              lambda rng, n: [(random_osu_id(rng, n),)]),
+    QueryPath("get_osu_username(discord_id)", "other/utility.py get_osu_username",
+              ["SELECT osu_username FROM exp_table WHERE discord_id=?"],
+              lambda rng, n: [(discord_id_of(random_osu_id(rng, n)),)]),
+    QueryPath("get_user_exp_bars(discord_id)", "other/utility.py get_user_exp_bars",
+              [f"SELECT {column}_exp FROM exp_table WHERE discord_id=?" for column in EXP_BAR_COLUMNS],
+              lambda rng, n: [(discord_id_of(random_osu_id(rng, n)),)] * len(EXP_BAR_COLUMNS)),
+    QueryPath("get_user_exp_bars(osu_id)", "other/utility.py get_user_exp_bars",
+              [f"SELECT {column}_exp FROM exp_table WHERE osu_id=?" for column in EXP_BAR_COLUMNS],
+              lambda rng, n: [(random_osu_id(rng, n),)] * len(EXP_BAR_COLUMNS)),
+    QueryPath("get_user_currency(osu_id)", "other/utility.py get_user_currency",
+              ["SELECT * FROM currency WHERE osu_id=?"],
+              lambda rng, n: [(random_osu_id(rng, n),)]),
+    QueryPath("get_user_upgrade_levels(osu_id)", "other/utility.py get_user_upgrade_levels",
+              ["SELECT * FROM upgrades WHERE osu_id=?"],
+              lambda rng, n: [(random_osu_id(rng, n),)]),
+    QueryPath("leaderboard: number of pages", "cogs/leaderboard.py get_num_pages_in_lb",
+              ["SELECT COUNT(*) FROM exp_table"],
+              lambda rng, n: [()]),
+    QueryPath("leaderboard: first page (overall)", "cogs/leaderboard.py populate_leaderboard",
+              [leaderboard_page_query("overall")],
+              lambda rng, n: [(0,)]),
+    QueryPath("leaderboard: random page (nm)", "cogs/leaderboard.py populate_leaderboard",
+              [leaderboard_page_query("nm")],
+              lambda rng, n: [(rng.randrange(0, n, 10),)]),
+    QueryPath("leaderboard: user's rank (overall)", "cogs/leaderboard.py add_user_to_leaderboard",
+              [leaderboard_user_query("overall")],
+              lambda rng, n: [(discord_id_of(random_osu_id(rng, n)),)]),
+    QueryPath("Score.is_already_submitted", "classes/score.py is_already_submitted",
+              ["SELECT * FROM submitted_scores WHERE osu_id=? AND beatmap_id=? AND beatmapset_id=? AND timestamp=?"],
+              lambda rng, n: [(random_osu_id(rng, n), beatmap_id := rng.randint(1, 100), beatmap_id, recent_timestamp(rng))]),
+    QueryPath("add_score_to_database", "cogs/submit.py add_score_to_database",
+              ["INSERT INTO submitted_scores VALUES (?, ?, ?, ?)"],
+              lambda rng, n: [(random_osu_id(rng, n), beatmap_id := rng.randint(1, 100), beatmap_id, recent_timestamp(rng))],
+              is_write=True),
+    QueryPath("ExpManager: update exp bars", "classes/exp.py __update_user_exp_in_database",
+              [f"UPDATE exp_table SET {column}_exp=?, {column}_level=? WHERE osu_id=?" for column in EXP_BAR_COLUMNS],
+              lambda rng, n: [(rng.randint(0, 10**6), rng.randint(1, 200), osu_id) for osu_id in [random_osu_id(rng, n)] * len(EXP_BAR_COLUMNS)],
+              is_write=True),
+    QueryPath("CurrencyManager: update currency", "classes/currency.py __update_user_currency_in_database",
+              ["UPDATE currency SET taiko_tokens=taiko_tokens+? WHERE osu_id=?"],
+              lambda rng, n: [(rng.randint(0, 100), random_osu_id(rng, n))],
+              is_write=True),
+    QueryPath("upgrade purchase", "classes/upgrade.py __update_database_from_purchase",
+              ["UPDATE currency SET taiko_tokens=taiko_tokens-? WHERE osu_id=? AND taiko_tokens>=?",
+               "UPDATE upgrades SET tt_gain_multiplier=tt_gain_multiplier+1 WHERE osu_id=? AND tt_gain_multiplier=?"],
+              lambda rng, n: [(cost := rng.randint(1, 100), osu_id := random_osu_id(rng, n), cost), (osu_id, rng.randint(0, 50))],
+              is_write=True),
+    QueryPath("verify new user", "cogs/verification.py verify",
+              ["SELECT osu_id FROM exp_table WHERE osu_id=?", "INSERT INTO exp_table (osu_username, osu_id, discord_id) VALUES (?, ?, ?)",
+               "INSERT INTO currency (osu_id) VALUES (?)", "INSERT INTO upgrades (osu_id) VALUES (?)"],
+              lambda rng, n: [(n + 1,), (osu_username_of(n + 1), n + 1, discord_id_of(n + 1)), (n + 1,), (n + 1,)],
+              is_write=True),
+    QueryPath("update_username", "cogs/verification.py update_username",
+              ["UPDATE exp_table SET osu_username=? WHERE discord_id=?"],
+              lambda rng, n: [(f"renamed_{rng.randint(0, 10**6)}", discord_id_of(random_osu_id(rng, n)))],
+              is_write=True),
+    QueryPath("update_discord_account", "cogs/verification.py update_discord_account",
+              ["SELECT 1 FROM exp_table WHERE osu_id=?", "UPDATE exp_table SET discord_id=? WHERE osu_id=?"],
+              lambda rng, n: [(osu_id := random_osu_id(rng, n),), (rng.randint(10**17, 10**18), osu_id)],
+              is_write=True),
+    QueryPath("regularly_clean_score_database", "other/utility.py regularly_clean_score_database",
+              ["DELETE FROM submitted_scores WHERE timestamp <= datetime('now', '-24 hours')"],
+              lambda rng, n: [()],
+              is_write=True),
+    QueryPath("BeatmapStore: load beatmap by id", "classes/beatmap_store.py __load_beatmap_from_database",
+              [f"SELECT {', '.join(BEATMAP_COLUMNS)} FROM beatmaps WHERE id=?"],
+              lambda rng, n: [(rng.randint(1, NUM_BEATMAPS),)]),
+    QueryPath("BeatmapStore: load beatmap by checksum", "classes/beatmap_store.py __load_beatmap_from_database",
+              [f"SELECT {', '.join(BEATMAP_COLUMNS)} FROM beatmaps WHERE checksum=?"],
+              lambda rng, n: [(f"{rng.getrandbits(128):032x}",)]),
+]
+
+
+class QueryPathResult:
+    query_path: QueryPath
+    latencies: list[float]
+    query_plans: list[str]  # One per statement
+
+    def __init__(self, query_path: QueryPath, latencies: list[float], query_plans: list[str]):
+        self.query_path = query_path
+        self.latencies = sorted(latencies)
+        self.query_plans = query_plans
+
+    def mean(self) -> float:
+        return sum(self.latencies) / len(self.latencies)
+
+    def percentile(self, fraction: float) -> float:
+        return self.latencies[min(int(len(self.latencies) * fraction), len(self.latencies) - 1)]
+
+
+def get_query_plan(conn: sqlite3.Connection, statement: str, parameters: tuple) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return " | ".join(row[-1] for row in rows)
+
+def benchmark_query_path(conn: sqlite3.Connection, query_path: QueryPath, rng: random.Random, num_users: int) -> QueryPathResult:
+    latencies: list[float] = []
+    started_at = time.perf_counter()
+    query_plans = [get_query_plan(conn, statement, parameters) for statement, parameters in zip(query_path.statements, query_path.make_parameters(rng, num_users))]
+
+    while len(latencies) < MAX_ITERATIONS and (len(latencies) < MIN_ITERATIONS or time.perf_counter() - started_at < TIME_BUDGET_PER_QUERY_PATH):
+        all_parameters = query_path.make_parameters(rng, num_users)
+
+        if query_path.is_write:
+            conn.execute("SAVEPOINT query_path")
+
+        start = time.perf_counter()
+        for statement, parameters in zip(query_path.statements, all_parameters):
+            conn.execute(statement, parameters).fetchall()
+        latencies.append(time.perf_counter() - start)
+
+        if query_path.is_write:
+            conn.execute("ROLLBACK TO query_path")
+            conn.execute("RELEASE query_path")
+
+    return QueryPathResult(query_path, latencies, query_plans)
+
+def benchmark_connection_open(database_path: str) -> QueryPathResult:
+    """Every query path opens its own connection with aiosqlite.connect, which costs at least this much (plus starting a thread)."""
+
+    latencies = []
+    for _ in range(MAX_ITERATIONS):
+        start = time.perf_counter()
+        sqlite3.connect(database_path).close()
+        latencies.append(time.perf_counter() - start)
+    return QueryPathResult(QueryPath("open and close a connection", "every aiosqlite.connect", [], lambda rng, n: []), latencies, [])
+
+def benchmark_database(database_path: str, num_users: int, indexes: list[str], seed: int) -> list[QueryPathResult]:
+    rng = random.Random(seed)
+    results = [benchmark_connection_open(database_path)]
+
+    conn = sqlite3.connect(database_path, isolation_level=None)  # Transactions are managed manually
+    try:
+        # Indexes are created inside a transaction that is rolled back at the end, so that the generated database stays reusable
+        if indexes:
+            conn.execute("BEGIN")
+            for index in indexes:
+                conn.execute(index)
+            conn.execute("ANALYZE")
+
+        for query_path in QUERY_PATHS:
+            results.append(benchmark_query_path(conn, query_path, rng, num_users))
+
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+
+    return results
+
+def print_results(num_users: int, results: list[QueryPathResult]):
+    print(f"\n{num_users:,} users")
+    print(f"{'Query path':<45} {'mean':>10} {'p50':>10} {'p99':>10} {'runs':>5}  Query plan")
+    for result in results:
+        print(f"{result.query_path.name:<45} {result.mean() * 1000:>8.3f}ms {result.percentile(0.5) * 1000:>8.3f}ms "
+              f"{result.percentile(0.99) * 1000:>8.3f}ms {len(result.latencies):>5}  {' || '.join(result.query_plans)}")
+
+def write_markdown_report(output_path: str, indexes: list[str], all_results: dict[int, list[QueryPathResult]]):
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.write("# Query scale benchmark\n\n")
+        file.write(f"Extra indexes: {', '.join(f'`{index}`' for index in indexes) if indexes else 'none'}\n")
+
+        for num_users, results in all_results.items():
+            file.write(f"\n## {num_users:,} users\n\n")
+            file.write("| Query path | Source | Mean (ms) | p50 (ms) | p99 (ms) | Query plan |\n")
+            file.write("| --- | --- | ---: | ---: | ---: | --- |\n")
+            for result in results:
+                file.write(f"| {result.query_path.name} | {result.query_path.source} | {result.mean() * 1000:.3f} | {result.percentile(0.5) * 1000:.3f} | "
+                           f"{result.percentile(0.99) * 1000:.3f} | {'<br>'.join(f'`{plan}`' for plan in result.query_plans)} |\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Times every query path of the bot against synthetic databases of increasing size.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Comma separated numbers of users")
+    parser.add_argument("--database-directory", default=DEFAULT_DATABASE_DIRECTORY)
+    parser.add_argument("--regenerate", action="store_true", help="Generate the databases again even if they exist")
+    parser.add_argument("--create-index", action="append", default=[], help="CREATE INDEX statement to try out. Can be repeated.")
+    parser.add_argument("--output", help="Also write the results and query plans to this markdown file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    all_results: dict[int, list[QueryPathResult]] = {}
+    for num_users in [int(size) for size in args.sizes.split(",")]:
+        database_path = os.path.join(args.database_directory, f"users_{num_users}.db")
+        if args.regenerate or not os.path.exists(database_path):
+            print(f"Generating {database_path}...")
+            start = time.perf_counter()
+            generate_large_database(num_users, database_path, args.seed)
+            print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+        all_results[num_users] = benchmark_database(database_path, num_users, args.create_index, args.seed)
+        print_results(num_users, all_results[num_users])
+
+    if args.output:
+        write_markdown_report(args.output, args.create_index, all_results)
+
+if __name__ == "__main__":
+    main()
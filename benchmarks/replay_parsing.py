@@ -0,0 +1,58 @@
+"""
+Measures how many .osr files per second can be parsed, serially and in a process pool.
+Replays aren't shipped with the repo, so point it at any directory of .osr files.
+
+Usage (from the repo root): python -m benchmarks.replay_parsing <directory of .osr files> [number of workers]
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from classes.replay import InvalidReplayError, parse_replay
+
+
+def parse_all_serially(replay_files: list[bytes]) -> int:
+    num_parsed = 0
+    for replay_file in replay_files:
+        try:
+            parse_replay(replay_file)
+            num_parsed += 1
+        except InvalidReplayError:
+            pass
+    return num_parsed
+
+def parse_all_in_process_pool(replay_files: list[bytes], num_workers: int | None) -> int:
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # Start the workers before timing, since the bot's pool is already warm when replays are submitted
+        executor.submit(int).result()
+
+        start = time.perf_counter()
+        futures = [executor.submit(parse_replay, replay_file) for replay_file in replay_files]
+        num_parsed = sum(1 for future in futures if future.exception() is None)
+        print_result("Process pool", num_parsed, time.perf_counter() - start)
+    return num_parsed
+
+def print_result(name: str, num_parsed: int, elapsed: float):
+    print(f"{name}: {num_parsed} replays in {elapsed:.3f}s ({num_parsed / elapsed:.1f} replays/s)")
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    replay_files = [path.read_bytes() for path in sorted(Path(sys.argv[1]).glob("*.osr"))]
+    num_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if not replay_files:
+        print("No .osr files found")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    num_parsed = parse_all_serially(replay_files)
+    print_result("Serial", num_parsed, time.perf_counter() - start)
+
+    parse_all_in_process_pool(replay_files, num_workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Measures how fast the score archive writes and scans millions of scores, and how much memory a full scan takes.
+The archive is written to a temporary directory, so the live one is never touched.
+
+Usage (from the repo root): python -m benchmarks.score_archive [--scores N] [--days N] [--chunks-per-day N]
+"""
+
+import argparse
+import array
+import datetime
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import benchmarks.offline
+from classes.score_archive import compact_old_partitions, get_columns, iter_chunks, write_chunk
+
+
+def generate_day(rng: random.Random, day: datetime.date, num_scores: int) -> dict[str, array.array]:
+    columns = {column: array.array(typecode) for column, typecode in get_columns().items()}
+    day_start = int(datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc).timestamp())
+    for _ in range(num_scores):
+        num_notes = rng.randint(200, 2000)
+        num_misses = rng.randint(0, num_notes // 20)
+        num_100s = rng.randint(0, num_notes // 5)
+        for column, values in columns.items():
+            values.append(0)
+        columns['timestamp'][-1] = day_start + rng.randrange(86400)
+        columns['osu_id'][-1] = rng.randint(1, 50_000)
+        columns['score_id'][-1] = rng.randint(1, 5_000_000_000)
+        columns['beatmap_id'][-1] = min(int(rng.paretovariate(1.2)), 20_000)
+        columns['mods_bitmask'][-1] = rng.choice([0, 0, 0, 8, 16, 64])
+        columns['is_pass'][-1] = rng.random() < 0.8
+        columns['num_300s'][-1] = num_notes - num_misses - num_100s
+        columns['num_100s'][-1] = num_100s
+        columns['num_misses'][-1] = num_misses
+        columns['num_notes'][-1] = num_notes
+        columns['accuracy'][-1] = round((num_notes - num_misses - num_100s / 2) / num_notes * 100, 2)
+        columns['sr'][-1] = round(rng.uniform(1, 8), 2)
+        columns['od'][-1] = round(rng.uniform(3, 10), 1)
+        columns['drain_time'][-1] = rng.randint(30, 400)
+        columns['exp_overall'][-1] = rng.randint(0, 500)
+        columns['currency_taiko_tokens'][-1] = num_notes // 50
+    return columns
+
+def split(columns: dict[str, array.array], num_parts: int) -> list[dict[str, array.array]]:
+    num_rows = len(columns['timestamp'])
+    bounds = [num_rows * part // num_parts for part in range(num_parts + 1)]
+    return [{column: values[start:end] for column, values in columns.items()} for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def sum_exp_by_user(columns: list[str] | None, directory: str) -> int:
+    """A typical analytics scan. Returns the number of scores scanned."""
+
+    total_exp: dict[int, int] = {}
+    num_scanned = 0
+    for chunk in iter_chunks(columns, directory=directory):
+        for osu_id, exp in zip(chunk['osu_id'], chunk['exp_overall']):
+            total_exp[osu_id] = total_exp.get(osu_id, 0) + exp
+        num_scanned += len(chunk['osu_id'])
+    return num_scanned
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scores", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--chunks-per-day", type=int, default=20, help="Chunks written per day before compaction, like the flushes of a busy day")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first_day = datetime.date.today() - datetime.timedelta(days=args.days + 2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_seconds = 0.0
+        for day_index in range(args.days):
+            day = first_day + datetime.timedelta(days=day_index)
+            columns = generate_day(rng, day, args.scores // args.days)
+            start = time.perf_counter()
+            for part in split(columns, args.chunks_per_day):
+                write_chunk(f"{directory}/{day.isoformat()}", part)
+            write_seconds += time.perf_counter() - start
+
+        num_bytes = sum(os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(directory) for filename in filenames)
+        num_scores = args.scores // args.days * args.days
+        print(f"Wrote {num_scores} scores in {write_seconds:.2f}s ({num_scores / write_seconds:,.0f} scores/s), {num_bytes / num_scores:.1f} bytes/score")
+
+        start = time.perf_counter()
+        num_compacted = compact_old_partitions(directory)
+        num_bytes = sum(os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(directory) for filename in filenames)
+        print(f"Compacted {num_compacted} days in {time.perf_counter() - start:.2f}s, {num_bytes / num_scores:.1f} bytes/score after")
+
+        for columns in (["osu_id", "exp_overall"], None):
+            start = time.perf_counter()
+            num_scanned = sum_exp_by_user(columns, directory)
+            elapsed = time.perf_counter() - start
+
+            # Measured in a second scan, since tracemalloc slows every allocation down
+            tracemalloc.start()
+            sum_exp_by_user(columns, directory)
+            _, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Scanned {num_scanned} scores ({'all columns' if columns is None else ', '.join(columns)}) in {elapsed:.2f}s "
+                  f"({num_scanned / elapsed:,.0f} scores/s), peak memory {peak_size / 1024 / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
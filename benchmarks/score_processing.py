@@ -0,0 +1,174 @@
+"""
+Benchmarks the reward calculation of /submit on synthetic scores: ExpManager, CurrencyManager, ExpBar construction and every upgrade effect.
+Nothing is written to the database (only the managers' calculate_one_score is used), and nothing is fetched from the osu! API.
+
+Usage (from the repo root):
+    python -m benchmarks.score_processing [--scores N] [--seed N] [--save results.json]
+    python -m benchmarks.score_processing --compare baseline.json [--threshold 0.1]
+
+Comparison mode exits with status 1 if any case's throughput dropped by more than the threshold, so it can gate a change to init/upgrade_init.py.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from benchmarks.synthetic import (USER_TOTAL_EXP_RANGES, generate_scores, generate_user_currency, generate_user_exp_bars,
+                                  generate_user_total_exp, generate_user_upgrade_levels)
+from classes.currency import CurrencyManager
+from classes.exp import ExpBar, ExpManager
+from classes.upgrade import upgrade_manager
+
+DEFAULT_NUM_SCORES = 2000
+DEFAULT_SEED = 727
+DEFAULT_REGRESSION_THRESHOLD = 0.1  # Fraction of throughput lost before comparison mode fails
+
+
+def build_cases(rng: random.Random, num_scores: int) -> dict[str, list[Callable[[], Any]]]:
+    """Returns every benchmark case as a list of operations. Each operation processes one score (or builds one exp bar)."""
+
+    cases: dict[str, list[Callable[[], Any]]] = {}
+    scores = generate_scores(rng, user_osu_id=1, num_scores=num_scores)
+
+    for kind in USER_TOTAL_EXP_RANGES.keys():
+        user_upgrade_levels = generate_user_upgrade_levels(rng, kind)
+
+        # One manager per kind of user, reused for every score like a /submit of <num_scores> scores
+        exp_manager = ExpManager(generate_user_exp_bars(rng, kind), user_upgrade_levels)
+        cases[f"ExpManager.calculate_one_score[{kind}]"] = [lambda score=score, exp_manager=exp_manager: exp_manager.calculate_one_score(score) for score in scores]
+
+        currency_manager = CurrencyManager(generate_user_currency(rng), user_upgrade_levels)
+        cases[f"CurrencyManager.calculate_one_score[{kind}]"] = [lambda score=score, currency_manager=currency_manager: currency_manager.calculate_one_score(score) for score in scores]
+
+        all_total_exp = [total_exp for _ in range(num_scores // len(USER_TOTAL_EXP_RANGES)) for total_exp in generate_user_total_exp(rng, kind).values()]
+        cases[f"ExpBar[{kind}]"] = [lambda total_exp=total_exp: ExpBar(total_exp) for total_exp in all_total_exp]
+
+    # Upgrade effects are benchmarked with the most expensive user, since their exp bars have the highest levels
+    user_exp_bars = generate_user_exp_bars(rng, 'high_level')
+    user_upgrade_levels = generate_user_upgrade_levels(rng, 'high_level')
+    for upgrade_id, upgrade in upgrade_manager.upgrades.items():
+        cases[f"apply_upgrade_effect[{upgrade_id}]"] = [
+            lambda score=score, upgrade=upgrade: upgrade_manager.apply_upgrade_effect(
+                upgrade=upgrade, upgrade_level=user_upgrade_levels[upgrade.id], score=score, user_exp_bars=user_exp_bars,
+                exp_bar_exp_gain={exp_bar_name: 100 for exp_bar_name in user_exp_bars.keys()}, currency_gain={'taiko_tokens': 10},
+            )
+            for score in scores
+        ]
+
+    return cases
+
+def measure_latency(operations: list[Callable[[], Any]]) -> dict[str, float]:
+    # Warm up caches (interned strings, enum lookups) so that the first few operations don't skew the results
+    for operation in operations[:50]:
+        operation()
+
+    latencies_ns: list[int] = []
+    for operation in operations:
+        start = time.perf_counter_ns()
+        operation()
+        latencies_ns.append(time.perf_counter_ns() - start)
+
+    latencies_ns.sort()
+    total_seconds = sum(latencies_ns) / 1e9
+    return {
+        'ops_per_second': len(operations) / total_seconds if total_seconds else float("inf"),
+        'mean_us': statistics.fmean(latencies_ns) / 1000,
+        'p50_us': latencies_ns[len(latencies_ns) // 2] / 1000,
+        'p99_us': latencies_ns[min(int(len(latencies_ns) * 0.99), len(latencies_ns) - 1)] / 1000,
+    }
+
+def measure_allocations(operations: list[Callable[[], Any]]) -> dict[str, float]:
+    """Measured separately from latency, since tracemalloc slows down every allocation."""
+
+    peak_bytes: list[int] = []
+    retained_bytes: list[int] = []
+
+    tracemalloc.start()
+    for operation in operations:
+        tracemalloc.reset_peak()
+        memory_before, _ = tracemalloc.get_traced_memory()
+        result = operation()
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        del result
+
+        peak_bytes.append(memory_peak - memory_before)
+        retained_bytes.append(memory_after - memory_before)
+    tracemalloc.stop()
+
+    return {
+        'peak_bytes': statistics.fmean(peak_bytes),
+        'retained_bytes': statistics.fmean(retained_bytes),
+    }
+
+def run_benchmarks(num_scores: int, seed: int) -> dict[str, Any]:
+    # Latency and allocations each get their own set of operations, since processing a score changes the manager's exp bars
+    latency_cases = build_cases(random.Random(seed), num_scores)
+    allocation_cases = build_cases(random.Random(seed), num_scores)
+
+    results: dict[str, dict[str, float]] = {}
+    for case_name, operations in latency_cases.items():
+        results[case_name] = measure_latency(operations) | measure_allocations(allocation_cases[case_name])
+        print_result(case_name, results[case_name])
+
+    return {
+        'python_version': platform.python_version(),
+        'num_scores': num_scores,
+        'seed': seed,
+        'results': results,
+    }
+
+def print_result(case_name: str, result: dict[str, float]):
+    print(f"{case_name:<60} {result['ops_per_second']:>12,.0f} ops/s  "
+          f"p50 {result['p50_us']:>8.2f}us  p99 {result['p99_us']:>8.2f}us  "
+          f"peak {result['peak_bytes'] / 1024:>7.2f}KiB  retained {result['retained_bytes']:>8.1f}B")
+
+def compare_with_baseline(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> bool:
+    """Prints the throughput change of every case. Returns False if any case regressed by more than <threshold>."""
+
+    if (current['num_scores'], current['seed']) != (baseline['num_scores'], baseline['seed']):
+        print("Warning: the baseline was generated with a different number of scores or seed, so the inputs differ")
+
+    passed = True
+    print(f"\nCompared with baseline (fails below -{threshold:.0%}):")
+    for case_name, result in current['results'].items():
+        baseline_result = baseline['results'].get(case_name, None)
+        if baseline_result is None:
+            print(f"{case_name:<60} new case")
+            continue
+
+        change = result['ops_per_second'] / baseline_result['ops_per_second'] - 1
+        regressed = change < -threshold
+        passed = passed and not regressed
+        print(f"{case_name:<60} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks reward calculation on synthetic scores.")
+    parser.add_argument("--scores", type=int, default=DEFAULT_NUM_SCORES, help="Number of synthetic scores per case")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--save", help="Write the results to this JSON file, to be used as a baseline later")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="Allowed fraction of throughput lost, eg 0.1 for 10%%")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.scores, args.seed)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(current, file, indent=4)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare_with_baseline(current, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Load test for /submit: fires many simulated users through SubmitCog.submit at once, against a local stand-in for the osu! API and fake Discord interactions.
+Runs in a temporary directory with its own database, so the live database and beatmap cache are never touched.
+
+Usage (from the repo root):
+    python -m benchmarks.submit_load [--users N] [--scores N] [--api-latency S] [--rate-limit-probability P] [--display-each-score] [--workers N]
+
+Reports /submit latency percentiles, how many interactions missed Discord's response deadline, throughput, database time and osu! API calls.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Optional
+
+from benchmarks.fake_discord import INTERACTION_RESPONSE_DEADLINE, FakeInteraction
+from benchmarks.fake_osu_api import FakeOsuApi, FakeOsuApiConfig, start_fake_osu_api
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8727
+SLOW_STATEMENT_THRESHOLD = 0.05  # Seconds. Statements slower than this were almost certainly waiting on another connection's lock.
+
+
+class DatabaseTimer:
+    """Times every statement run through aiosqlite. aiosqlite runs everything through Connection._execute, so that is what gets wrapped."""
+
+    statement_times: list[float]
+
+    def __init__(self):
+        self.statement_times = []
+
+    def install(self):
+        import aiosqlite
+
+        original_execute = aiosqlite.Connection._execute
+        statement_times = self.statement_times
+
+        async def timed_execute(self, fn, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original_execute(self, fn, *args, **kwargs)
+            finally:
+                statement_times.append(time.perf_counter() - start)
+
+        aiosqlite.Connection._execute = timed_execute
+
+
+class SubmitResult:
+    latency: float
+    interaction: FakeInteraction
+    error: Optional[str]
+
+    def __init__(self, latency: float, interaction: FakeInteraction, error: Optional[str]):
+        self.latency = latency
+        self.interaction = interaction
+        self.error = error
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+async def simulate_user(submit_cog: Any, osu_id: int, start_delay: float, args: argparse.Namespace) -> SubmitResult:
+    from benchmarks.database import discord_id_of
+    from discord.app_commands import Choice
+
+    await asyncio.sleep(start_delay)
+
+    interaction = FakeInteraction(discord_id_of(osu_id), args.discord_latency)
+    display_each_score = Choice(name="Yes", value=1) if args.display_each_score else Choice(name="No", value=0)
+
+    start = time.perf_counter()
+    error = None
+    try:
+        await submit_cog.submit.callback(submit_cog, interaction, display_each_score, args.scores)
+    except Exception as exception:
+        error = f"{type(exception).__name__}: {exception}"
+
+    return SubmitResult(time.perf_counter() - start, interaction, error)
+
+async def run_load_test(args: argparse.Namespace, working_directory: str):
+    # The bot's modules are imported here, since OSU_WEBSITE_URL has to be set before they are imported
+    import benchmarks.offline
+    import other.utility
+    from benchmarks.database import create_database
+    from classes.http_session import http_session
+    from classes.process_pool import process_pool
+    from classes.submit_workers import submit_worker_pool
+    from classes.user_lock import user_lock_manager
+    from cogs.submit import SubmitCog
+
+    fake_osu_api = FakeOsuApi(FakeOsuApiConfig(args.api_latency, args.api_latency_jitter, args.rate_limit_probability), args.seed)
+    runner = await start_fake_osu_api(fake_osu_api, HOST, args.port)
+
+    # Everything the bot reads and writes is relative to the working directory
+    os.chdir(working_directory)
+    osu_ids = list(range(1, args.users + 1))
+    create_database(osu_ids)
+    open("./data/sensitive.env", "a").close()
+
+    database_timer = DatabaseTimer()
+    database_timer.install()
+
+    await http_session.start_http_session()
+    try:
+        await other.utility.regularly_refresh_osu_api_access_token()
+        user_lock_manager.regularly_renew_leases.start()
+        if args.workers:
+            await submit_worker_pool.start(args.workers)
+            while len(submit_worker_pool.workers) < args.workers:  # Starting the workers isn't part of what is measured
+                await asyncio.sleep(0.1)
+
+        submit_cog = SubmitCog(bot=None)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(simulate_user(submit_cog, osu_id, args.ramp_up * index / args.users, args) for index, osu_id in enumerate(osu_ids)))
+        elapsed = time.perf_counter() - start
+
+    finally:
+        user_lock_manager.regularly_renew_leases.cancel()
+        await submit_worker_pool.stop()
+        await http_session.close_http_session()
+        process_pool.shutdown()
+        await runner.cleanup()
+
+    with sqlite3.connect("./data/database.db") as conn:
+        num_scores_submitted = conn.execute("SELECT COUNT(*) FROM submitted_scores").fetchone()[0]
+    conn.close()
+
+    print_report(args, results, elapsed, num_scores_submitted, database_timer, fake_osu_api)
+
+def print_report(args: argparse.Namespace, results: list[SubmitResult], elapsed: float, num_scores_submitted: int,
+                 database_timer: DatabaseTimer, fake_osu_api: FakeOsuApi):
+    latencies = sorted(result.latency for result in results)
+    response_times = sorted(result.interaction.response.response_time for result in results if result.interaction.response.response_time is not None)
+    num_timed_out = sum(1 for result in results if result.interaction.timed_out())
+    errors = Counter(result.error for result in results if result.error is not None)
+    statement_times = sorted(database_timer.statement_times)
+    slow_statement_times = [statement_time for statement_time in statement_times if statement_time > SLOW_STATEMENT_THRESHOLD]
+
+    print(f"{args.users} users x {args.scores} scores, ramp-up {args.ramp_up}s, osu! API latency {args.api_latency}s (+{args.api_latency_jitter}s jitter), "
+          f"429 probability {args.rate_limit_probability}, Discord latency {args.discord_latency}s, {args.workers or 'no'} submit workers")
+    print(f"Elapsed: {elapsed:.2f}s")
+
+    print("\n/submit latency")
+    print(f"  p50 {percentile(latencies, 0.5):.3f}s  p95 {percentile(latencies, 0.95):.3f}s  p99 {percentile(latencies, 0.99):.3f}s  max {latencies[-1]:.3f}s")
+    print(f"  Initial response: p50 {percentile(response_times, 0.5):.3f}s  p99 {percentile(response_times, 0.99):.3f}s  "
+          f"over the {INTERACTION_RESPONSE_DEADLINE:.0f}s deadline: {num_timed_out}")
+
+    print("\nThroughput")
+    print(f"  {len(results) / elapsed:.2f} submissions/s, {num_scores_submitted / elapsed:.1f} scores/s ({num_scores_submitted} scores submitted)")
+
+    print("\nDatabase" + (" (gateway only, the submit workers' statements aren't timed)" if args.workers else ""))
+    print(f"  {len(statement_times)} statements, {sum(statement_times):.2f}s total, p99 {percentile(statement_times, 0.99) * 1000:.1f}ms")
+    print(f"  Lock waits (statements over {SLOW_STATEMENT_THRESHOLD * 1000:.0f}ms): {len(slow_statement_times)}, {sum(slow_statement_times):.2f}s total")
+
+    print("\nosu! API calls")
+    for route, count in sorted(fake_osu_api.request_counts.items()):
+        print(f"  {route}: {count} ({fake_osu_api.rate_limited_counts[route]} rate limited)")
+
+    if errors:
+        print(f"\nFailed submissions: {sum(errors.values())}")
+        for error, count in errors.most_common():
+            print(f"  {count}x {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for /submit against a local osu! API stand-in.")
+    parser.add_argument("--users", type=int, default=20, help="Number of users running /submit")
+    parser.add_argument("--scores", type=int, default=100, help="Scores fetched per /submit (capped at 100, like the command)")
+    parser.add_argument("--ramp-up", type=float, default=0, help="Seconds over which the users start, 0 to start them all at once")
+    parser.add_argument("--display-each-score", action="store_true", help="Send an embed for every score, like display_each_score=Yes")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds added to every osu! API response")
+    parser.add_argument("--api-latency-jitter", type=float, default=0.05)
+    parser.add_argument("--rate-limit-probability", type=float, default=0, help="Chance of a 429 for every osu! API request")
+    parser.add_argument("--discord-latency", type=float, default=0.1, help="Seconds taken by every Discord message")
+    parser.add_argument("--workers", type=int, default=0, help="Run /submit in this many submit worker processes, like SUBMIT_WORKERS")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port of the local osu! API stand-in")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory (database and .osu files) afterwards")
+    args = parser.parse_args()
+    args.scores = min(args.scores, 100)
+
+    os.environ['OSU_WEBSITE_URL'] = f"http://{HOST}:{args.port}"
+    original_directory = os.getcwd()
+    working_directory = tempfile.mkdtemp(prefix="submit_load_")
+
+    try:
+        asyncio.run(run_load_test(args, working_directory))
+    finally:
+        os.chdir(original_directory)
+        if args.keep:
+            print(f"\nKept {working_directory}")
+        else:
+            shutil.rmtree(working_directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Generators for synthetic scores and users, so that reward calculation can be benchmarked without the osu! API or the database.
+Everything is generated from a seeded random.Random, so runs with the same seed process exactly the same scores.
+"""
+
+import datetime
+import random
+
+import benchmarks.offline  # Has to be imported before the bot's modules
+from classes.beatmap import Beatmap, BeatmapAttributes, Beatmapset
+from classes.beatmap_store import DIFFICULTY_CHANGING_MODS_BITMASK
+from classes.exp import ExpBar, ExpBarName
+from classes.mod import intern_mods
+from classes.score import Score
+from classes.upgrade import upgrade_manager
+from init.currency_init import init_currency
+
+# Roughly what gets submitted: mostly NM and HD, with every exp bar mod and some disallowed mods represented
+MOD_COMBINATIONS: list[tuple[list[str], int]] = [
+    ([], 40),
+    (["HD"], 20),
+    (["HR"], 8),
+    (["HD", "HR"], 8),
+    (["DT"], 6),
+    (["HD", "DT"], 5),
+    (["NC"], 3),
+    (["HT"], 2),
+    (["DC"], 1),
+    (["EZ"], 1),
+    (["FL"], 1),
+    (["NF", "HD"], 1),
+    (["HD", "HR", "DT", "FL"], 1),
+    (["RX"], 1),
+]
+
+# Total exp of every exp bar for each kind of user. Levels are solved in closed form, so the ranges only change how much the rewards scale.
+USER_TOTAL_EXP_RANGES: dict[str, tuple[int, int]] = {
+    'new': (0, 5_000),
+    'regular': (50_000, 500_000),
+    'high_level': (2_000_000, 20_000_000),
+}
+
+def generate_beatmap(rng: random.Random, beatmap_id: int) -> tuple[Beatmap, Beatmapset]:
+    beatmapset_id = beatmap_id + 1_000_000
+    beatmap = Beatmap(
+        id = beatmap_id,
+        beatmapset_id = beatmapset_id,
+        url = f"https://osu.ppy.sh/beatmaps/{beatmap_id}",
+        mode = rng.choice(["taiko", "taiko", "taiko", "osu"]),
+        difficulty_name = f"Synthetic {beatmap_id}",
+        od = round(rng.uniform(3, 10), 1),
+        hp = round(rng.uniform(3, 10), 1),
+        num_notes = rng.randint(100, 4000),
+        num_sliders = rng.randint(0, 50),
+        num_spinners = rng.randint(0, 10),
+        drain_time = rng.randint(30, 600),
+        status = rng.choice(["ranked", "loved", "graveyard"]),
+        checksum = f"{beatmap_id:032x}",
+    )
+    beatmapset = Beatmapset({
+        'id': beatmapset_id,
+        'artist': "Synthetic Artist",
+        'artist_unicode': "Synthetic Artist",
+        'title': f"Synthetic Song {beatmap_id}",
+        'title_unicode': f"Synthetic Song {beatmap_id}",
+        'creator': "Synthetic Mapper",
+    })
+    return beatmap, beatmapset
+
+def generate_score(rng: random.Random, user_osu_id: int, beatmap: Beatmap, beatmapset: Beatmapset) -> Score:
+    mod_acronyms = rng.choices([mod_combination for mod_combination, _ in MOD_COMBINATIONS], weights=[weight for _, weight in MOD_COMBINATIONS])[0]
+    mods = intern_mods([{'acronym': mod_acronym} for mod_acronym in mod_acronyms])
+
+    # Most scores are full runs, the rest are restarts or quits at a random point
+    map_completion = 1.0 if rng.random() < 0.7 else rng.uniform(0.01, 0.99)
+    num_notes_judged = max(int(beatmap.num_notes * map_completion), 1)
+    num_misses = int(num_notes_judged * rng.uniform(0, 0.08))
+    num_100s = int((num_notes_judged - num_misses) * rng.uniform(0, 0.25))
+    num_300s = num_notes_judged - num_misses - num_100s
+
+    mods_bitmask = 0
+    for mod in mods:
+        mods_bitmask |= mod.bitmask
+
+    return Score(
+        username = f"user{user_osu_id}",
+        user_osu_id = user_osu_id,
+        score_id = rng.randint(1, 2**40),
+        num_300s = num_300s,
+        num_100s = num_100s,
+        num_misses = num_misses,
+        accuracy = (num_300s + 0.5 * num_100s) / num_notes_judged * 100,
+        mods = mods,
+        timestamp = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=rng.randint(0, 10**7)),
+        is_pass = rng.random() < 0.9,
+        beatmap = beatmap,
+        beatmap_attributes = BeatmapAttributes(beatmap, mods_bitmask & DIFFICULTY_CHANGING_MODS_BITMASK, round(rng.uniform(1, 11), 2)),
+        beatmapset = beatmapset,
+    )
+
+def generate_scores(rng: random.Random, user_osu_id: int, num_scores: int, num_beatmaps: int = 500) -> list[Score]:
+    beatmaps = [generate_beatmap(rng, beatmap_id) for beatmap_id in range(1, num_beatmaps + 1)]
+    return [generate_score(rng, user_osu_id, *rng.choice(beatmaps)) for _ in range(num_scores)]
+
+def generate_user_total_exp(rng: random.Random, kind: str) -> dict[str, int]:
+    """Returns the total exp of each exp bar, before being turned into ExpBar objects."""
+
+    lowest_total_exp, highest_total_exp = USER_TOTAL_EXP_RANGES[kind]
+    user_total_exp = {exp_bar_name: rng.randint(lowest_total_exp, highest_total_exp) // 4 for exp_bar_name in ExpBarName.list_as_str()}
+    user_total_exp['Overall'] = sum(user_total_exp.values())
+    return user_total_exp
+
+def generate_user_exp_bars(rng: random.Random, kind: str) -> dict[str, ExpBar]:
+    return {exp_bar_name: ExpBar(total_exp) for exp_bar_name, total_exp in generate_user_total_exp(rng, kind).items()}
+
+def generate_user_upgrade_levels(rng: random.Random, kind: str) -> dict[str, int]:
+    """New users have few upgrades, high level users have every upgrade maxed out (the infinite one capped to something reachable)."""
+
+    user_upgrade_levels = {}
+    for upgrade_id, upgrade in upgrade_manager.upgrades.items():
+        max_level = min(upgrade.max_level, 500)
+        if kind == 'new':
+            user_upgrade_levels[upgrade_id] = rng.randint(0, min(max_level, 2))
+        elif kind == 'regular':
+            user_upgrade_levels[upgrade_id] = rng.randint(0, max_level // 2)
+        else:
+            user_upgrade_levels[upgrade_id] = max_level
+    return user_upgrade_levels
+
+def generate_user_currency(rng: random.Random) -> dict[str, int]:
+    return {currency_name: rng.randint(0, 100_000) for currency_name in init_currency().keys()}
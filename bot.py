@@ -1,20 +1,55 @@
+import time
+
+STARTUP_START_TIME = time.perf_counter()  # Taken before the other imports, so that importing counts towards the startup time
+
+import asyncio
+import contextlib
+import logging
 import os
 import sys
 
 import other.utility
 from classes.http_session import http_session
+from classes.media_catalog import media_catalog
+from classes.message_dispatcher import message_dispatcher
+from classes.metrics import metrics
+from classes.score_archive import score_archive
+from classes.score_trace import score_trace_store
+from classes.submit_workers import submit_worker_pool
+from classes.user_lock import user_lock_manager
+from classes.username_refresh import username_refresher
+from classes.watchdog import event_loop_watchdog
 from other.error_handling import *
+from other.logging_config import setup_logging
+from other.migrations import MigrationError, migrate_database_file
+
+logger = logging.getLogger(__name__)
+
+# Seconds taken by each phase of startup, reported once the bot is ready
+startup_phase_seconds: dict[str, float] = {}
+startup_phase_start_time = STARTUP_START_TIME
+
 
+@contextlib.contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    yield
+    startup_phase_seconds[name] = time.perf_counter() - start
 
 @bot.event
 async def setup_hook():
     """This is run once when the bot starts."""
     
+    startup_phase_seconds['login'] = time.perf_counter() - startup_phase_start_time
+    
     await http_session.start_http_session()
-    await load_all_cogs()
-    await bot.tree.sync()  # Syncs slash commands
     
-    await other.utility.database_sanity_check()
+    # Cogs don't touch the database when loaded, so the two can be prepared at the same time
+    await asyncio.gather(load_all_cogs(), migrate_database())
+    
+    with startup_phase("command_sync"):
+        num_synced = await other.utility.sync_command_tree()
+    logger.info("Command tree unchanged, sync skipped" if num_synced is None else f"Synced {num_synced} commands")
     
     # Backup only the live database
     if not os.getcwd().endswith("test"):
@@ -22,22 +57,70 @@ async def setup_hook():
     
     other.utility.regularly_clean_score_database.start()
     other.utility.regularly_refresh_osu_api_access_token.start()
+    user_lock_manager.regularly_renew_leases.start()
+    media_catalog.regularly_refresh.start()
+    
+    if USERNAME_REFRESH_API_BUDGET:
+        username_refresher.regularly_refresh_usernames.start()
+    
+    if SCORE_TRACES_ENABLED:
+        score_trace_store.regularly_flush.start()
     
+    if SCORE_ARCHIVE_ENABLED:
+        score_archive.regularly_flush.start()
+        score_archive.regularly_compact.start()
+    
+    if SUBMIT_WORKERS:
+        await submit_worker_pool.start(SUBMIT_WORKERS)
+    
+    metrics.start_monitoring_event_loop_lag()
+    event_loop_watchdog.start()
+    if METRICS_PORT:
+        await metrics.start_server(METRICS_PORT)
+
 async def load_all_cogs():
-    """Load bot commands stored in the cogs folder."""
+    """Load bot commands stored in the cogs folder. Cogs don't depend on each other, so they are loaded concurrently."""
+    
+    with startup_phase("cogs"):
+        await asyncio.gather(*(load_cog(filename) for filename in os.listdir("./cogs") if filename.endswith(".py")))
+    message_dispatcher.build(bot.cogs.values())
 
-    for filename in os.listdir("./cogs"):
-        if filename.endswith(".py"):
-            try:
-                await bot.load_extension(f"cogs.{filename[:-3]}")
-            except Exception as error:
-                await other.utility.send_in_all_channels(f"**Failed to load {filename}: {error}**")
+async def load_cog(filename: str):
+    try:
+        await bot.load_extension(f"cogs.{filename[:-3]}")
+    except Exception as error:
+        logger.error(f"Failed to load {filename}", exc_info=error)
+        await other.utility.send_in_all_channels(f"**Failed to load {filename}: {error}**")
+
+async def migrate_database():
+    """Brings the database's schema up to date with the code. Force exits if it can't be."""
     
+    with startup_phase("database"):
+        try:
+            await asyncio.to_thread(migrate_database_file)
+        except MigrationError as error:
+            logger.critical(str(error))
+            sys.exit(-1)
+
 @bot.event
 async def on_ready():
-    """Runs after setup_hook()."""
+    """Runs after setup_hook(), and again after every reconnect."""
+    
+    if 'connect' not in startup_phase_seconds:
+        startup_phase_seconds['connect'] = time.perf_counter() - STARTUP_START_TIME - sum(startup_phase_seconds.values())
+        startup_phase_seconds['total'] = time.perf_counter() - STARTUP_START_TIME
+        for phase, seconds in startup_phase_seconds.items():
+            metrics.set_gauge("startup_phase_seconds", seconds, phase=phase)
+        logger.info("Startup finished", extra={'phases': {phase: round(seconds, 3) for phase, seconds in startup_phase_seconds.items()}})
     
     await other.utility.send_in_all_channels("Bot is now ready")
 
-sys.stderr = open("./logs.log", "w")  # Redirect stderr to log file
-bot.run(BOT_TOKEN)
\ No newline at end of file
+# Cogs respond to messages through message triggers instead of their own on_message listeners, so a message is only scanned once
+bot.add_listener(message_dispatcher.dispatch, "on_message")
+
+# Submit workers are spawned processes, which import this module again without running it
+if __name__ == "__main__":
+    setup_logging()
+    startup_phase_seconds['imports'] = time.perf_counter() - STARTUP_START_TIME
+    startup_phase_start_time = time.perf_counter()
+    bot.run(BOT_TOKEN, log_handler=None)  # discord.py logs through the handlers set up by setup_logging
\ No newline at end of file
@@ -1,74 +1,147 @@
-from typing import TYPE_CHECKING, Any
+from typing import Any, Optional
 
-if TYPE_CHECKING:
-    from classes.score import Score
+from classes.mod import MOD_BITMASKS
 
 
 class Beatmap:
-    """Class representing a beatmap, which is a singular difficulty. Not to be confused with beatmapset."""
-    
+    """
+    Class representing a beatmap, which is a singular difficulty. Not to be confused with beatmapset.
+    Beatmaps are shared between every score set on them (see BeatmapStore), so they must not be modified after creation.
+    Values that change with mods are in BeatmapAttributes instead.
+    """
+
+    __slots__ = ("id", "beatmapset_id", "url", "mode", "difficulty_name", "od", "hp", "num_notes", "num_sliders", "num_spinners", "drain_time", "status", "checksum")
+
     id: int
+    beatmapset_id: int
     url: str
     mode: str
     difficulty_name: str
-    sr: float
-    od: float
-    hp: float
+    od: float  # Without mods
+    hp: float  # Without mods
     num_notes: int
     num_sliders: int
     num_spinners: int
-    drain_time: int
+    drain_time: int  # Without mods
     status: str
-    
-    def __init__(self, beatmap_info: dict[str, Any], beatmap_attributes: dict[str, Any], score: 'Score'):
-        
-        self.id = beatmap_info['id']
-        self.url = beatmap_info['url']
-        self.mode = beatmap_info['mode']
-        self.difficulty_name = beatmap_info['version']
-        self.sr = beatmap_attributes['star_rating']
-        self.__init_od(beatmap_info, score)
-        self.__init_hp(beatmap_info, score)
-        self.num_notes = beatmap_info['count_circles']  # Inaccurate for converts
-        self.num_sliders = beatmap_info['count_sliders']  # Inaccurate for converts
-        self.num_spinners = beatmap_info['count_spinners']
-        self.__init_drain_time(beatmap_info, score)
-        self.status = beatmap_info['status']
-    
-    def __init_od(self, beatmap_info: dict[str, Any], score: 'Score'):
-        self.od = beatmap_info['accuracy']
-        if score.mod_is_in_score("HR"):
-            self.od *= 1.4
-        elif score.mod_is_in_score("EZ"):
-            self.od *= 0.5
-        self.od = min(self.od, 10)
-    
-    def __init_hp(self, beatmap_info: dict[str, Any], score: 'Score'):
-        self.hp = beatmap_info['drain']
-        if score.mod_is_in_score("HR"):
-            self.hp *= 1.4
-        elif score.mod_is_in_score("EZ"):
-            self.hp *= 0.5
-        self.hp = min(self.hp, 10)
-    
-    def __init_drain_time(self, beatmap_info: dict[str, Any], score: 'Score'):
-        self.drain_time = beatmap_info['hit_length']
-        if score.mod_is_in_score("DT"):
-            self.drain_time = int(self.drain_time / 1.5)
-        elif score.mod_is_in_score("HT"):
-            self.drain_time = int(self.drain_time / 0.75)
+    checksum: Optional[str]  # MD5 of the .osu file
+
+    def __init__(self, id: int, beatmapset_id: int, url: str, mode: str, difficulty_name: str, od: float, hp: float,
+                 num_notes: int, num_sliders: int, num_spinners: int, drain_time: int, status: str, checksum: Optional[str]):
+        self.id = id
+        self.beatmapset_id = beatmapset_id
+        self.url = url
+        self.mode = mode
+        self.difficulty_name = difficulty_name
+        self.od = od
+        self.hp = hp
+        self.num_notes = num_notes
+        self.num_sliders = num_sliders
+        self.num_spinners = num_spinners
+        self.drain_time = drain_time
+        self.status = status
+        self.checksum = checksum
+
+    @classmethod
+    def from_beatmap_info(cls, beatmap_info: dict[str, Any], object_counts: Optional[dict[str, Any]]):
+        """
+        Creates a beatmap from the osu! API's beatmap info.
+        <object_counts> replaces the API's counts, eg with the counts the beatmap was stored with. The API's counts are used if it is None.
+        """
+
+        if object_counts is None:
+            object_counts = {
+                'num_notes': beatmap_info['count_circles'],
+                'num_drumrolls': beatmap_info['count_sliders'],
+                'num_swells': beatmap_info['count_spinners'],
+            }
+
+        return cls(
+            id = beatmap_info['id'],
+            beatmapset_id = beatmap_info['beatmapset_id'],
+            url = beatmap_info['url'],
+            mode = beatmap_info['mode'],
+            difficulty_name = beatmap_info['version'],
+            od = beatmap_info['accuracy'],
+            hp = beatmap_info['drain'],
+            num_notes = object_counts['num_notes'],
+            num_sliders = object_counts['num_drumrolls'],
+            num_spinners = object_counts['num_swells'],
+            drain_time = beatmap_info['hit_length'],
+            status = beatmap_info['status'],
+            checksum = beatmap_info.get('checksum', None),
+        )
+
+
+class BeatmapAttributes:
+    """
+    Values of a beatmap that depend on the mods used.
+    Shared between all scores on the same beatmap with the same difficulty changing mods. od, hp and drain time are only calculated when first needed.
+    """
+
+    __slots__ = ("beatmap", "mods_bitmask", "sr", "__od", "__hp", "__drain_time")
+
+    beatmap: Beatmap
+    mods_bitmask: int  # Only mods that change the difficulty, see BeatmapStore
+    sr: float
+
+    def __init__(self, beatmap: Beatmap, mods_bitmask: int, sr: float):
+        self.beatmap = beatmap
+        self.mods_bitmask = mods_bitmask
+        self.sr = sr
+        self.__od = None
+        self.__hp = None
+        self.__drain_time = None
+
+    @property
+    def od(self) -> float:
+        if self.__od is None:
+            od = self.beatmap.od
+            if self.mods_bitmask & MOD_BITMASKS["HR"]:
+                od *= 1.4
+            elif self.mods_bitmask & MOD_BITMASKS["EZ"]:
+                od *= 0.5
+            self.__od = min(od, 10)
+        return self.__od
+
+    @property
+    def hp(self) -> float:
+        if self.__hp is None:
+            hp = self.beatmap.hp
+            if self.mods_bitmask & MOD_BITMASKS["HR"]:
+                hp *= 1.4
+            elif self.mods_bitmask & MOD_BITMASKS["EZ"]:
+                hp *= 0.5
+            self.__hp = min(hp, 10)
+        return self.__hp
+
+    @property
+    def drain_time(self) -> int:
+        if self.__drain_time is None:
+            drain_time = self.beatmap.drain_time
+            if self.mods_bitmask & MOD_BITMASKS["DT"]:
+                drain_time = int(drain_time / 1.5)
+            elif self.mods_bitmask & MOD_BITMASKS["HT"]:
+                drain_time = int(drain_time / 0.75)
+            self.__drain_time = drain_time
+        return self.__drain_time
 
 
 class Beatmapset:
-    """Class representing a beatmapset (known as "set"), which is a collection of difficulties. Not to be confused with beatmap."""
-    
+    """
+    Class representing a beatmapset (known as "set"), which is a collection of difficulties. Not to be confused with beatmap.
+    Shared between every score set on the beatmapset, so it must not be modified after creation.
+    """
+
+    __slots__ = ("id", "artist", "artist_unicode", "title", "title_unicode", "creator")
+
     id: int
     artist: str
     artist_unicode: str
     title: str
     title_unicode: str
     creator: str
-    
+
     def __init__(self, beatmapset_info: dict[str, Any]):
         self.id = beatmapset_info['id']
         self.artist = beatmapset_info['artist']
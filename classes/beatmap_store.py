@@ -0,0 +1,189 @@
+from typing import Any, Optional
+
+import aiosqlite
+import other.utility
+from classes.beatmap import Beatmap, BeatmapAttributes, Beatmapset
+from classes.metrics import metrics
+from classes.mod import CLASSIC_MODS_MASK, Mod, mods_to_bitmask
+
+# Mods that change a beatmap's star rating, od, hp or drain time
+DIFFICULTY_CHANGING_MODS_BITMASK = mods_to_bitmask(["EZ", "HR", "DT", "NC", "HT", "DC"])
+
+# The least recently used beatmaps are dropped from memory past this point. They are still in the database.
+MAX_BEATMAPS_IN_MEMORY = 20000
+
+BEATMAP_COLUMNS = ["id", "beatmapset_id", "url", "mode", "difficulty_name", "od", "hp", "num_notes", "num_sliders", "num_spinners", "drain_time", "status", "checksum"]
+BEATMAPSET_COLUMNS = ["id", "artist", "artist_unicode", "title", "title_unicode", "creator"]
+
+
+class BeatmapStore:
+    """
+    Canonical store of beatmap and beatmapset metadata, so that scores on the same beatmap share the same objects instead of parsing their own.
+    Beatmaps are kept in memory and backed by the beatmaps / beatmapsets tables in the database, which keeps object counts across restarts.
+    """
+
+    beatmaps: dict[int, Beatmap]  # beatmap_id: beatmap
+    beatmapsets: dict[int, Beatmapset]  # beatmapset_id: beatmapset
+    beatmap_ids_by_checksum: dict[str, int]  # checksum: beatmap_id, used to find the beatmap of a replay
+    beatmap_attributes: dict[tuple[int, int], BeatmapAttributes]  # (beatmap_id, difficulty changing mods bitmask): attributes
+    unsaved_beatmaps: dict[int, Beatmap]
+    unsaved_beatmapsets: dict[int, Beatmapset]
+
+    def __init__(self):
+        self.beatmaps = {}
+        self.beatmapsets = {}
+        self.beatmap_ids_by_checksum = {}
+        self.beatmap_attributes = {}
+        self.unsaved_beatmaps = {}
+        self.unsaved_beatmapsets = {}
+
+    async def get_beatmap(self, beatmap_info: dict[str, Any]) -> Beatmap:
+        """Returns the shared beatmap described by the osu! API's <beatmap_info>, creating it if it isn't stored or is outdated."""
+
+        beatmap_id: int = beatmap_info['id']
+        checksum: Optional[str] = beatmap_info.get('checksum', None)
+
+        beatmap = self.beatmaps.get(beatmap_id, None)
+        cache_result = "memory"
+        if beatmap is None:
+            beatmap = await self.__load_beatmap_from_database("id", beatmap_id)
+            cache_result = "database"
+
+        # Reuse the stored beatmap as long as the .osu file hasn't changed
+        if beatmap is not None and beatmap.checksum == checksum:
+            metrics.increment("cache_lookups_total", cache="beatmaps", result=cache_result)
+            if beatmap.status != beatmap_info['status']:
+                beatmap = Beatmap.from_beatmap_info(beatmap_info, {'num_notes': beatmap.num_notes, 'num_drumrolls': beatmap.num_sliders, 'num_swells': beatmap.num_spinners})
+                self.unsaved_beatmaps[beatmap_id] = beatmap
+            self.__remember_beatmap(beatmap)
+            return beatmap
+
+        metrics.increment("cache_lookups_total", cache="beatmaps", result="miss")
+
+        # The attributes of an outdated version of the beatmap aren't valid anymore
+        for key in [key for key in self.beatmap_attributes.keys() if key[0] == beatmap_id]:
+            del self.beatmap_attributes[key]
+
+        beatmap = Beatmap.from_beatmap_info(beatmap_info, None)
+
+        self.unsaved_beatmaps[beatmap_id] = beatmap
+        self.__remember_beatmap(beatmap)
+        return beatmap
+
+    async def get_beatmap_by_checksum(self, checksum: str) -> Optional[tuple[Beatmap, Beatmapset]]:
+        """Returns the shared beatmap and beatmapset whose .osu file has the MD5 <checksum>, or None if no such beatmap exists."""
+
+        beatmap_id = self.beatmap_ids_by_checksum.get(checksum, None)
+        beatmap = self.beatmaps.get(beatmap_id, None) if beatmap_id is not None else None
+        cache_result = "memory"
+        if beatmap is None:
+            beatmap = await self.__load_beatmap_from_database("checksum", checksum)
+            cache_result = "database"
+
+        if beatmap is not None:
+            beatmapset = self.beatmapsets.get(beatmap.beatmapset_id, None)
+            if beatmapset is None:
+                beatmapset = await self.__load_beatmapset_from_database(beatmap.beatmapset_id)
+
+            if beatmapset is not None:
+                metrics.increment("cache_lookups_total", cache="beatmaps_by_checksum", result=cache_result)
+                self.__remember_beatmap(beatmap)
+                self.beatmapsets[beatmapset.id] = beatmapset
+                return beatmap, beatmapset
+
+        # Not stored yet, so the osu! API has to be asked
+        metrics.increment("cache_lookups_total", cache="beatmaps_by_checksum", result="miss")
+        beatmap_info = await other.utility.lookup_beatmap_from_api(checksum)
+        if beatmap_info is None:
+            return None
+        return await self.get_beatmap(beatmap_info), self.get_beatmapset(beatmap_info['beatmapset'])
+
+    def get_beatmapset(self, beatmapset_info: dict[str, Any]) -> Beatmapset:
+        """Returns the shared beatmapset described by the osu! API's <beatmapset_info>."""
+
+        beatmapset = self.beatmapsets.get(beatmapset_info['id'], None)
+        if beatmapset is None:
+            beatmapset = Beatmapset(beatmapset_info)
+            self.beatmapsets[beatmapset.id] = beatmapset
+            self.unsaved_beatmapsets[beatmapset.id] = beatmapset
+        return beatmapset
+
+    async def get_beatmap_attributes(self, beatmap: Beatmap, mods: tuple[Mod, ...]) -> BeatmapAttributes:
+        """Returns the attributes of <beatmap> with <mods>, calculating the star rating if this mod combination hasn't been seen yet."""
+
+        mods_bitmask = 0
+        for mod in mods:
+            mods_bitmask |= mod.bitmask
+        mods_bitmask &= DIFFICULTY_CHANGING_MODS_BITMASK
+
+        beatmap_attributes = self.beatmap_attributes.get((beatmap.id, mods_bitmask), None)
+        if beatmap_attributes is not None and beatmap_attributes.beatmap is beatmap:
+            metrics.increment("cache_lookups_total", cache="beatmap_attributes", result="memory")
+            return beatmap_attributes
+
+        metrics.increment("cache_lookups_total", cache="beatmap_attributes", result="miss")
+        beatmap_attributes = BeatmapAttributes(beatmap, mods_bitmask, await self.__get_star_rating(beatmap, mods_bitmask))
+        self.beatmap_attributes[(beatmap.id, mods_bitmask)] = beatmap_attributes
+        return beatmap_attributes
+
+    async def __get_star_rating(self, beatmap: Beatmap, mods_bitmask: int) -> float:
+        # List of mod acronyms do not work for the 'mods' parameter, for some reason, so the classic part of the bitmask is sent
+        api_attributes = await other.utility.get_beatmap_attributes_from_api(beatmap.id, mods_bitmask & CLASSIC_MODS_MASK)
+        return api_attributes['star_rating']
+
+    def __remember_beatmap(self, beatmap: Beatmap):
+        # Re-inserted rather than assigned, so that the dict stays ordered from least to most recently used
+        self.beatmaps.pop(beatmap.id, None)
+        self.beatmaps[beatmap.id] = beatmap
+        if beatmap.checksum is not None:
+            self.beatmap_ids_by_checksum[beatmap.checksum] = beatmap.id
+
+        if len(self.beatmaps) > MAX_BEATMAPS_IN_MEMORY:
+            least_recently_used_beatmap_id = next(iter(self.beatmaps))
+            least_recently_used_beatmap = self.beatmaps.pop(least_recently_used_beatmap_id)
+            self.beatmap_ids_by_checksum.pop(least_recently_used_beatmap.checksum, None)  # type: ignore
+            for key in [key for key in self.beatmap_attributes.keys() if key[0] == least_recently_used_beatmap_id]:
+                del self.beatmap_attributes[key]
+
+    @metrics.timed("database")
+    async def __load_beatmap_from_database(self, column: str, value: int | str) -> Optional[Beatmap]:
+        """Loads a beatmap by <column>, which is either id or checksum."""
+
+        async with aiosqlite.connect("./data/database.db") as conn:
+            conn.row_factory = aiosqlite.Row  # Allows the query to return a dict-like
+            cursor = await conn.execute(f"SELECT {', '.join(BEATMAP_COLUMNS)} FROM beatmaps WHERE {column}=?", (value,))
+            row = await cursor.fetchone()
+
+        if row is None:
+            return None
+        return Beatmap(**dict(row))
+
+    @metrics.timed("database")
+    async def __load_beatmapset_from_database(self, beatmapset_id: int) -> Optional[Beatmapset]:
+        async with aiosqlite.connect("./data/database.db") as conn:
+            conn.row_factory = aiosqlite.Row  # Allows the query to return a dict-like
+            cursor = await conn.execute(f"SELECT {', '.join(BEATMAPSET_COLUMNS)} FROM beatmapsets WHERE id=?", (beatmapset_id,))
+            row = await cursor.fetchone()
+
+        if row is None:
+            return None
+        return Beatmapset(dict(row))
+
+    @metrics.timed("database")
+    async def save_new_metadata(self):
+        """Writes beatmaps and beatmapsets created since the last save to the database in one go."""
+
+        if not self.unsaved_beatmaps and not self.unsaved_beatmapsets:
+            return
+
+        beatmap_rows = [tuple(getattr(beatmap, column) for column in BEATMAP_COLUMNS) for beatmap in self.unsaved_beatmaps.values()]
+        beatmapset_rows = [tuple(getattr(beatmapset, column) for column in BEATMAPSET_COLUMNS) for beatmapset in self.unsaved_beatmapsets.values()]
+        self.unsaved_beatmaps = {}
+        self.unsaved_beatmapsets = {}
+
+        async with aiosqlite.connect("./data/database.db") as conn:
+            await conn.executemany(f"INSERT OR REPLACE INTO beatmaps ({', '.join(BEATMAP_COLUMNS)}) VALUES ({', '.join('?' * len(BEATMAP_COLUMNS))})", beatmap_rows)
+            await conn.executemany(f"INSERT OR REPLACE INTO beatmapsets ({', '.join(BEATMAPSET_COLUMNS)}) VALUES ({', '.join('?' * len(BEATMAPSET_COLUMNS))})", beatmapset_rows)
+            await conn.commit()
+
+beatmap_store = BeatmapStore()
\ No newline at end of file
@@ -3,14 +3,16 @@ from enum import auto
 from typing import TYPE_CHECKING, Optional
 
 import aiosqlite
-from classes.buff_effect import BuffEffect, BuffEffectType
 from classes.extended_enum import ExtendedEnum
+from classes.metrics import metrics
+from classes.render_cache import render_cache
 from classes.score import Score
 from classes.upgrade import upgrade_manager
 from other.global_constants import *
 
 if TYPE_CHECKING:
     from classes.exp import ExpManager
+    from classes.game_data import GameData
     
 
 class CurrencyID(ExtendedEnum):
@@ -29,58 +31,74 @@ class Currency:
 
 
 class CurrencyManager:
-    all_currencies: dict[str, Currency]
+    game_data: "GameData"  # Kept for the whole submission, so that a reload halfway through doesn't mix old and new upgrades
     initial_user_currency: dict[str, int]  # Before all score submissions
     current_user_currency: dict[str, int]  # Updated after each score submission
+    unsaved_currency_gain: dict[str, int]  # Gained since the database was last updated
     user_upgrade_levels: dict[str, int]
-    debug_log: list[str]
+    debug_log: list[tuple[str, dict[str, int]]]  # (step, currency gain after the step). Only filled when SCORE_TRACES_ENABLED.
     
     def __init__(self, initial_user_currency: dict[str, int], user_upgrade_levels: dict[str, int]):
-        from init.currency_init import init_currency
-        self.all_currencies = init_currency()
+        from classes.game_data import get_game_data
+        self.game_data = get_game_data()
         self.initial_user_currency = initial_user_currency
         self.current_user_currency = copy.deepcopy(self.initial_user_currency)  # Deep copy to prevent the two from pointing to the same dict
+        self.unsaved_currency_gain = dict.fromkeys(self.game_data.currency_names, 0)
         self.user_upgrade_levels = user_upgrade_levels
         self.debug_log = []
     
     async def process_one_score(self, score: Score) -> dict[str, int]:
         """Calculate the currency gained from a score and update database accordingly. Returns the currency gained from the score for display purposes."""
         
-        self.debug_log.clear()
+        new_currency_gain = self.calculate_one_score(score)
+        
+        # Update database based on currency manager attributes
+        await self.__update_user_currency_in_database(score.user_osu_id)
+        
+        return new_currency_gain
+    
+    def calculate_one_score(self, score: Score) -> dict[str, int]:
+        """Calculate the currency gained from a score and update the currency locally, without touching the database. Returns the currency gained from the score."""
+        
+        self.debug_log = []
         original_currency_gain = self.__calculate_currency_of_score_before_buffs(score)
-        self.debug_log.append(f"original_currency_gain: {original_currency_gain}")
+        if SCORE_TRACES_ENABLED:
+            self.debug_log.append(("before_buffs", original_currency_gain))
         new_currency_gain = self.__calculate_currency_of_score_after_buffs(score, original_currency_gain)
-        self.debug_log.append(f"new_currency_gain: {new_currency_gain}")
         
-        # Update database based on currency manager attributes
         self.__update_user_currency_locally(new_currency_gain)
-        await self.__update_user_currency_in_database(score.user_osu_id)
         
         return new_currency_gain
     
     async def process_levelup_bonus(self, exp_manager: 'ExpManager', osu_id: int) -> Optional[dict[str, int]]:
         """Gives additional currency based on how many overall levels you gain."""
         
+        currency_gain = self.calculate_levelup_bonus(exp_manager)
+        
+        if currency_gain:
+            await self.__update_user_currency_in_database(osu_id)
+            return currency_gain
+        return None
+    
+    def calculate_levelup_bonus(self, exp_manager: 'ExpManager') -> dict[str, int]:
+        """Calculate the level up bonus and update the currency locally, without touching the database. Returns the currency gained, empty if no level was gained."""
+        
         currency_gain = {}
         
-        if exp_manager.current_user_exp_bars["Overall"].level > exp_manager.initial_user_exp_bars["Overall"].level:
-            currency_gain["taiko_tokens"] = 0
+        initial_level = exp_manager.initial_user_exp_bars["Overall"].level
+        current_level = exp_manager.current_user_exp_bars["Overall"].level
+        if current_level > initial_level:
             
             # If you level up from 2 -> 4, then the bonus for level 3 and level 4 will be added
-            for level in range(exp_manager.initial_user_exp_bars["Overall"].level + 1, exp_manager.current_user_exp_bars["Overall"].level + 1):
-                
-                # Currency gain is set at 10% of exp required to reach that level
-                currency_gain["taiko_tokens"] += (level - 1) * 50 // 5
+            # Currency gain is set at 10% of exp required to reach that level, (level - 1) * 50 // 5, summed over the levels gained
+            currency_gain["taiko_tokens"] = 10 * (current_level - initial_level) * (current_level + initial_level - 1) // 2
             
             self.__update_user_currency_locally(currency_gain)
-            await self.__update_user_currency_in_database(osu_id)
-            
-        if currency_gain:
-            return currency_gain
-        return None
+        
+        return currency_gain
     
     def __calculate_currency_of_score_before_buffs(self, score: Score) -> dict[str, int]:
-        original_currency_gain = {currency_name: 0 for currency_name in self.all_currencies.keys()}
+        original_currency_gain = dict.fromkeys(self.game_data.currency_names, 0)
         original_currency_gain['taiko_tokens'] = score.note_hits // NOTE_HITS_REQUIRED_PER_TAIKO_TOKEN
         return original_currency_gain
 
@@ -91,21 +109,24 @@ class CurrencyManager:
     
     def __apply_buff_effects_to_currency(self, score: Score, new_currency_gain: dict[str, int]):
         # Apply relevant upgrades in the correct order
-        for upgrade in upgrade_manager.upgrades.values():
-            for current_upgrade_priority in BuffEffectType.list():
-                if upgrade.effect_type == current_upgrade_priority and upgrade.effect in [BuffEffect.TAIKO_TOKEN_GAIN]:
-                    upgrade_level = self.user_upgrade_levels[upgrade.id]
-                    upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, currency_gain=new_currency_gain)
-                    self.debug_log.append(f"upgrade applied: {upgrade.name}")
-                    self.debug_log.append(f"after upgrade applied: {new_currency_gain}")
+        for upgrade in self.game_data.taiko_token_upgrades:
+            upgrade_level = self.user_upgrade_levels[upgrade.id]
+            upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, currency_gain=new_currency_gain)
+            if SCORE_TRACES_ENABLED:
+                self.debug_log.append((upgrade.id, dict(new_currency_gain)))
     
     def __update_user_currency_locally(self, new_currency_gain: dict[str, int]):
-        for currency_name in self.all_currencies.keys():
-            self.current_user_currency[currency_name] += new_currency_gain[currency_name]
+        for currency_name in self.game_data.currency_names:
+            self.current_user_currency[currency_name] += new_currency_gain.get(currency_name, 0)
+            self.unsaved_currency_gain[currency_name] += new_currency_gain.get(currency_name, 0)
     
+    @metrics.timed("database")
     async def __update_user_currency_in_database(self, osu_id: int):
+        # Only the gain is added, rather than overwriting the totals read at the start of the submission, so currency spent meanwhile with /buy isn't lost
         async with aiosqlite.connect("./data/database.db") as conn:
-            for currency_name, amount_of_currency in self.current_user_currency.items():
-                query = f"UPDATE currency SET {currency_name}=? WHERE osu_id=?"
-                await conn.execute(query, (amount_of_currency, osu_id))
-            await conn.commit()
\ No newline at end of file
+            for currency_name, currency_gain in self.unsaved_currency_gain.items():
+                if currency_gain:
+                    await conn.execute(f"UPDATE currency SET {currency_name}={currency_name}+? WHERE osu_id=?", (currency_gain, osu_id))
+            await conn.commit()
+        self.unsaved_currency_gain = dict.fromkeys(self.game_data.currency_names, 0)
+        render_cache.invalidate(osu_id)
\ No newline at end of file
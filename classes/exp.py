@@ -4,12 +4,14 @@ from enum import auto
 from typing import TYPE_CHECKING
 
 import aiosqlite
-from classes.buff_effect import BuffEffect, BuffEffectType
 from classes.extended_enum import ExtendedEnum
+from classes.metrics import metrics
+from classes.render_cache import render_cache
 from classes.upgrade import upgrade_manager
 from other.global_constants import *
 
 if TYPE_CHECKING:
+    from classes.game_data import GameData
     from classes.score import Score
 
 class ExpBarName(ExtendedEnum):
@@ -40,31 +42,26 @@ class ExpBar:
         self.__update_bar_based_on_total_exp()
     
     def __update_bar_based_on_total_exp(self):
-        current_exp = self.total_exp
-        current_level = 1
-        exp_required_for_next_level = 50
-        
-        # From the total exp in the bar, deduct the exp required for each subsequent level
         # Starting at level 1, reaching level 2 requires 50 exp, level 3 requires 100 more exp (so 150 exp total), etc
-        while current_exp >= exp_required_for_next_level:
-            current_level += 1
-            current_exp -= exp_required_for_next_level
-            exp_required_for_next_level += 50
-        
-        exp_progress_to_next_level = current_exp
+        # Reaching level L takes 25 * L * (L-1) exp in total, so the level is solved for directly instead of deducting one level at a time
+        total_exp = max(self.total_exp, 0)
+        current_level = (math.isqrt((4 * total_exp + 25) // 25) + 1) // 2
         
         self.level = current_level
-        self.exp_progress_to_next_level = exp_progress_to_next_level
-        self.exp_required_for_next_level = exp_required_for_next_level
+        self.exp_progress_to_next_level = total_exp - 25 * current_level * (current_level - 1)
+        self.exp_required_for_next_level = 50 * current_level
         
         
 class ExpManager:
     initial_user_exp_bars: dict[str, "ExpBar"]  # Before all score submissions
     current_user_exp_bars: dict[str, "ExpBar"]  # Updated after each score submission
     user_upgrade_levels: dict[str, int]
-    debug_log: list[str]
+    debug_log: list[tuple[str, dict[str, int]]]  # (step, exp gain after the step). Only filled when SCORE_TRACES_ENABLED.
+    game_data: "GameData"  # Kept for the whole submission, so that a reload halfway through doesn't mix old and new upgrades
     
     def __init__(self, initial_user_exp_bars: dict[str, "ExpBar"], user_upgrade_levels: dict[str, int]):
+        from classes.game_data import get_game_data
+        self.game_data = get_game_data()
         self.initial_user_exp_bars = initial_user_exp_bars
         self.current_user_exp_bars = copy.deepcopy(self.initial_user_exp_bars)  # Deep copy to prevent the two from pointing to the same dict
         self.user_upgrade_levels = user_upgrade_levels
@@ -73,22 +70,30 @@ class ExpManager:
     async def process_one_score(self, score: 'Score') -> dict[str, int]:
         """Calculate the exp gained from a score and update database accordingly. Returns the exp gained from the score for display purposes."""
         
+        new_exp_bar_exp_gain = self.calculate_one_score(score)
+        
+        # Update database based on exp manager attributes
+        await self.__update_user_exp_in_database(score)
+        
+        return new_exp_bar_exp_gain
+    
+    def calculate_one_score(self, score: 'Score') -> dict[str, int]:
+        """Calculate the exp gained from a score and update the exp bars locally, without touching the database. Returns the exp gained from the score."""
+        
         self.debug_log = []
         original_exp_bar_exp_gain = self.__calculate_exp_bar_exp_of_score_before_buffs(score)
-        self.debug_log.append(f"original_exp_bar_exp_gain: {original_exp_bar_exp_gain}")
+        if SCORE_TRACES_ENABLED:
+            self.debug_log.append(("before_buffs", original_exp_bar_exp_gain))
         new_exp_bar_exp_gain = self.__calculate_exp_bar_exp_of_score_after_buffs(score, original_exp_bar_exp_gain)
-        self.debug_log.append(f"new_exp_bar_exp_gain: {new_exp_bar_exp_gain}")
         
-        # Update database based on exp manager attributes
         self.__update_user_exp_bars_locally(new_exp_bar_exp_gain)
-        await self.__update_user_exp_in_database(score)
         
         return new_exp_bar_exp_gain
     
     def __calculate_overall_exp_of_score_before_buffs(self, score: 'Score') -> int:
         """Calculates the overall exp that a score gives based on a formula."""
         
-        original_overall_exp = math.pow(max(3*score.num_300s + 0.75*score.num_100s - 3*score.num_misses, 0), 0.6) * min(score.beatmap.sr+1, 11) * 0.07
+        original_overall_exp = math.pow(max(3*score.num_300s + 0.75*score.num_100s - 3*score.num_misses, 0), 0.6) * min(score.beatmap_attributes.sr+1, 11) * 0.07
         
         # Punish incomplete scores according to how much of the map was played
         if not score.is_complete_runthrough_of_map():
@@ -97,7 +102,7 @@ class ExpManager:
         return int(original_overall_exp)
     
     def __calculate_exp_bar_exp_of_score_before_buffs(self, score: 'Score') -> dict[str, int]:
-        original_exp_bar_exp = {exp_bar_name: 0 for exp_bar_name in ExpBarName.list_as_str()}
+        original_exp_bar_exp = dict.fromkeys(self.game_data.exp_bar_names, 0)
         original_exp_bar_exp['Overall'] = self.__calculate_overall_exp_of_score_before_buffs(score)
         
         self.split_overall_exp_among_exp_bars(score, original_exp_bar_exp)
@@ -114,7 +119,7 @@ class ExpManager:
         # Split the EXP evenly among activated exp bar mods otherwise
         else:
             for mod in score.mods:
-                if mod.acronym in ExpBarName.list_as_str() + ['NC', 'DC']:
+                if mod.acronym in self.game_data.exp_bar_mods:
                     # NC and DC aren't exp bar names, but belong under DT and HT respectively
                     if mod.acronym == 'NC': mod_name = 'DT'
                     elif mod.acronym == 'DC': mod_name = 'HT'
@@ -129,7 +134,7 @@ class ExpManager:
     def __calculate_exp_bar_exp_of_score_after_buffs(self, score: 'Score', original_exp_bar_exp_gain: dict[str, int]) -> dict[str, int]:
         
         # Get overall exp after buffs
-        new_exp_bar_exp_gain = {exp_bar_name: 0 for exp_bar_name in ExpBarName.list_as_str()}
+        new_exp_bar_exp_gain = dict.fromkeys(self.game_data.exp_bar_names, 0)
         new_exp_bar_exp_gain['Overall'] = copy.deepcopy(original_exp_bar_exp_gain['Overall'])
         
         self.__apply_buff_effects_to_overall_exp(score, new_exp_bar_exp_gain)
@@ -148,24 +153,20 @@ class ExpManager:
     def __apply_buff_effects_to_overall_exp(self, score: 'Score', new_exp_bar_exp_gain: dict[str, int]):
          
         # Apply relevant upgrades in the correct order
-        for upgrade in upgrade_manager.upgrades.values():
-            for current_upgrade_priority in BuffEffectType.list():
-                if upgrade.effect_type == current_upgrade_priority and upgrade.effect == BuffEffect.OVERALL_EXP_GAIN:
-                    upgrade_level = self.user_upgrade_levels[upgrade.id]
-                    upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, exp_bar_exp_gain=new_exp_bar_exp_gain, user_exp_bars=self.current_user_exp_bars)
-                    self.debug_log.append(f"upgrade applied: {upgrade.name}")
-                    self.debug_log.append(f"after upgrade applied: {new_exp_bar_exp_gain}")
+        for upgrade in self.game_data.overall_exp_upgrades:
+            upgrade_level = self.user_upgrade_levels[upgrade.id]
+            upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, exp_bar_exp_gain=new_exp_bar_exp_gain, user_exp_bars=self.current_user_exp_bars)
+            if SCORE_TRACES_ENABLED:
+                self.debug_log.append((upgrade.id, dict(new_exp_bar_exp_gain)))
 
     def __apply_upgrade_effects_to_exp_bar_exp(self, score: 'Score', new_exp_bar_exp_gain: dict[str, int]):
         
         # Apply relevant upgrades in the correct order
-        for upgrade in upgrade_manager.upgrades.values():
-            for current_upgrade_priority in BuffEffectType.list():
-                if upgrade.effect_type == current_upgrade_priority and upgrade.effect in [BuffEffect.NM_EXP_GAIN, BuffEffect.HD_EXP_GAIN, BuffEffect.HR_EXP_GAIN, BuffEffect.HR_EXP_GAIN, BuffEffect.DT_EXP_GAIN, BuffEffect.HT_EXP_GAIN]:
-                    upgrade_level = self.user_upgrade_levels[upgrade.id]
-                    upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, exp_bar_exp_gain=new_exp_bar_exp_gain, user_exp_bars=self.current_user_exp_bars)
-                    self.debug_log.append(f"upgrade applied: {upgrade.name}")
-                    self.debug_log.append(f"after upgrade applied: {new_exp_bar_exp_gain}")
+        for upgrade in self.game_data.exp_bar_exp_upgrades:
+            upgrade_level = self.user_upgrade_levels[upgrade.id]
+            upgrade_manager.apply_upgrade_effect(upgrade=upgrade, upgrade_level=upgrade_level, score=score, exp_bar_exp_gain=new_exp_bar_exp_gain, user_exp_bars=self.current_user_exp_bars)
+            if SCORE_TRACES_ENABLED:
+                self.debug_log.append((upgrade.id, dict(new_exp_bar_exp_gain)))
     
     def recaulcate_overall_exp_based_on_exp_bar_exp(self, new_exp_bar_exp_gain: dict[str, int]):
         recalculated_overall_exp = 0
@@ -181,9 +182,11 @@ class ExpManager:
         for exp_bar_name, exp_gain in new_exp_bar_exp_gain.items():
             self.current_user_exp_bars[exp_bar_name].add_exp(exp_gain)
         
+    @metrics.timed("database")
     async def __update_user_exp_in_database(self, score: 'Score'):
         async with aiosqlite.connect("./data/database.db") as conn:
             for exp_bar_name, exp_bar in self.current_user_exp_bars.items():
                 query = f"UPDATE exp_table SET {exp_bar_name.lower()}_exp=?, {exp_bar_name.lower()}_level=? WHERE osu_id=?"
                 await conn.execute(query, (exp_bar.total_exp, exp_bar.level, score.user_osu_id))
-            await conn.commit()
\ No newline at end of file
+            await conn.commit()
+        render_cache.invalidate(score.user_osu_id)
\ No newline at end of file
@@ -10,4 +10,4 @@ class ExtendedEnum(Enum):
     @classmethod
     def list_as_str(cls):
         """Returns a list of all members of the enum as strings."""
-        return [x.name for x in cls]
+        return list(cls._member_names_)  # Same as [x.name for x in cls], without looking up each member's name, since it is called for every score
@@ -0,0 +1,113 @@
+import dataclasses
+import importlib
+import inspect
+from types import MappingProxyType
+from typing import Mapping
+
+import init.currency_init
+import init.upgrade_init
+from classes.buff_effect import BuffEffect
+from classes.currency import Currency
+from classes.exp import ExpBarName
+from classes.mod import AllowedMods
+from classes.prefix_index import PrefixIndex
+from classes.render_cache import render_cache
+from classes.upgrade import Upgrade, upgrade_manager
+
+# Upgrades that affect the exp of a specific exp bar, applied after the Overall exp is split among them
+EXP_BAR_EXP_EFFECTS = (BuffEffect.NM_EXP_GAIN, BuffEffect.HD_EXP_GAIN, BuffEffect.HR_EXP_GAIN, BuffEffect.DT_EXP_GAIN, BuffEffect.HT_EXP_GAIN)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class UpgradeListing:
+    """An upgrade as shown in the shop. Everything but the user's level and the cost of their next level is rendered ahead of time."""
+
+    upgrade: Upgrade
+    description: str  # Cleaned of the indentation of the source it was written in
+    currency_emoji: str
+    purchase_hint: str
+
+    def render(self, current_upgrade_level: int) -> str:
+        header = f"**{self.upgrade.name} [Level {current_upgrade_level}/{self.upgrade.max_level}]**"
+        if current_upgrade_level >= self.upgrade.max_level:
+            return f"{header}\n{self.description}"
+        return f"{header} - {self.upgrade.cost(current_upgrade_level + 1)} {self.currency_emoji}\n{self.description}\n{self.purchase_hint}"
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GameData:
+    """
+    Everything about the game that only changes with the code: currencies, upgrades, exp bars and allowed mods, plus what is derived from them.
+    Built once and never modified. It is replaced as a whole when reloaded, so code holding on to one always sees a consistent set.
+    """
+
+    currencies: Mapping[str, Currency]  # currency_id: currency
+    currency_names: tuple[str, ...]
+    currency_emojis: Mapping[str, str]  # currency_id: animated emoji
+    upgrades: Mapping[str, Upgrade]  # upgrade_id: upgrade
+    upgrade_listings: Mapping[str, UpgradeListing]  # upgrade_id: listing, in shop order
+    upgrade_index: PrefixIndex[str]  # Upgrade IDs by their ID and name, for /buy's autocomplete. Not modified after it's built.
+
+    # Upgrades by what they affect, in the order they are applied
+    overall_exp_upgrades: tuple[Upgrade, ...]
+    exp_bar_exp_upgrades: tuple[Upgrade, ...]
+    taiko_token_upgrades: tuple[Upgrade, ...]
+
+    exp_bar_names: tuple[str, ...]
+    exp_bar_mods: frozenset[str]  # Acronyms of the mods that have an exp bar, including NC and DC which count as DT and HT
+    allowed_mods: frozenset[str]
+    allowed_mods_str: str  # eg "NF EZ HD ...", for messages
+
+def build_game_data(currencies: dict[str, Currency], upgrades: dict[str, Upgrade]) -> GameData:
+    exp_bar_names = tuple(ExpBarName.list_as_str())
+    allowed_mods = AllowedMods.list_as_str()
+    currency_emojis = {currency_id: currency.animated_discord_emoji for currency_id, currency in currencies.items()}
+
+    upgrade_listings = {}
+    upgrade_index: PrefixIndex[str] = PrefixIndex()
+    for upgrade_id, upgrade in upgrades.items():
+        upgrade_index.add(upgrade_id, upgrade_id)
+        upgrade_index.add(upgrade.name, upgrade_id)
+        upgrade_listings[upgrade_id] = UpgradeListing(upgrade=upgrade, description=inspect.cleandoc(upgrade.description),
+                                                      currency_emoji=currency_emojis[upgrade.cost_currency_unit],
+                                                      purchase_hint=f"(Purchase with `/buy {upgrade_id}`)")
+
+    return GameData(
+        currencies=MappingProxyType(dict(currencies)),
+        currency_names=tuple(currencies.keys()),
+        currency_emojis=MappingProxyType(currency_emojis),
+        upgrades=MappingProxyType(dict(upgrades)),
+        upgrade_listings=MappingProxyType(upgrade_listings),
+        upgrade_index=upgrade_index,
+        overall_exp_upgrades=tuple(upgrade for upgrade in upgrades.values() if upgrade.effect == BuffEffect.OVERALL_EXP_GAIN),
+        exp_bar_exp_upgrades=tuple(upgrade for upgrade in upgrades.values() if upgrade.effect in EXP_BAR_EXP_EFFECTS),
+        taiko_token_upgrades=tuple(upgrade for upgrade in upgrades.values() if upgrade.effect == BuffEffect.TAIKO_TOKEN_GAIN),
+        exp_bar_names=exp_bar_names,
+        exp_bar_mods=frozenset(exp_bar_names) | {'NC', 'DC'},
+        allowed_mods=frozenset(allowed_mods),
+        allowed_mods_str=" ".join(allowed_mods),
+    )
+
+def get_game_data() -> GameData:
+    """The current game data. Hold on to the result for the length of a command or submission, rather than calling this repeatedly."""
+    return current_game_data
+
+def reload_game_data() -> GameData:
+    """
+    Rebuilds the game data from init/, so that changes to currencies and upgrades are picked up along with reloaded cogs.
+    The old game data stays in use if the new one can't be built, or if it adds or removes currencies or upgrades, since those need a database migration.
+    """
+
+    global current_game_data
+    currencies = importlib.reload(init.currency_init).init_currency()
+    upgrades = importlib.reload(init.upgrade_init).init_upgrades()
+    if currencies.keys() != current_game_data.currencies.keys() or upgrades.keys() != current_game_data.upgrades.keys():
+        raise ValueError("Currencies and upgrades can only be added or removed with a restart, which migrates the database")
+
+    new_game_data = build_game_data(currencies, upgrades)
+    upgrade_manager.upgrades = upgrades
+    current_game_data = new_game_data  # Nothing is awaited in between, so no command or submission ever sees the old and new game data mixed
+    render_cache.clear()  # Embeds rendered with the old upgrades and emojis
+    return current_game_data
+
+current_game_data = build_game_data(init.currency_init.init_currency(), upgrade_manager.upgrades)
@@ -1,4 +1,10 @@
+import os
+
 import aiohttp
+from classes.metrics import metrics
+
+# Every request to osu! goes through this, so that it can be pointed at a local stand-in (see benchmarks/fake_osu_api.py)
+OSU_WEBSITE_URL: str = os.getenv('OSU_WEBSITE_URL', "https://osu.ppy.sh")
 
 
 class HttpSession:
@@ -7,7 +13,7 @@ class HttpSession:
     interface: aiohttp.ClientSession
     
     async def start_http_session(self):
-        self.interface = aiohttp.ClientSession(connector=aiohttp.TCPConnector())
+        self.interface = aiohttp.ClientSession(connector=aiohttp.TCPConnector(), trace_configs=[metrics.trace_config("osu")])
     
     async def close_http_session(self):
         if not self.interface.closed:
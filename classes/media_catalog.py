@@ -0,0 +1,163 @@
+import asyncio
+import dataclasses
+import hashlib
+import io
+import os
+import random
+import time
+import urllib.parse
+from typing import Optional
+
+import aiosqlite
+import discord
+from classes.metrics import metrics
+from discord.ext import tasks
+
+SECRETS_DATA_DIRECTORY = "../RPG common data/secrets_data"
+MEDIA_CATALOG_REFRESH_INTERVAL = 60  # Seconds between checks for added or removed files
+UPLOAD_URL_EXPIRY_MARGIN = 3600  # Seconds. Uploads whose URL expires sooner than this are uploaded again, so a sent link is never already dead.
+
+# Folder: whether its files are sent as attachments (images, videos) or as the text they contain (texts, songs)
+MEDIA_FOLDERS = {'images': True, 'videos': True, 'texts': False, 'songs': False}
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class MediaFile:
+    path: str
+    is_attachment: bool
+    size: int
+    modified_at: int  # st_mtime_ns, so that an edited file isn't mistaken for the one it replaced
+
+
+class MediaCatalog:
+    """
+    The /secret media, listed once and refreshed in the background whenever one of the folders changes, rather than listed on every pick.
+    Every file is equally likely to be picked, which makes each folder as likely as its share of the files.
+    Attachments are uploaded to Discord once. Discord's URL for the upload is kept in the media_uploads table by the file's hash,
+    and later picks send the URL instead, until Discord expires it.
+    Editing a file without adding or removing one doesn't change its folder, so the edit is only picked up on the next change or restart.
+    """
+
+    files: Optional[tuple[MediaFile, ...]]  # None until the first refresh
+    folder_modified_at: dict[str, int]  # folder: st_mtime_ns when the files were last listed. Adding or removing a file changes it.
+    content_hashes: dict[MediaFile, str]  # Hashing reads the whole file, so it is only done once per file
+
+    def __init__(self):
+        self.files = None
+        self.folder_modified_at = {}
+        self.content_hashes = {}
+
+    @tasks.loop(seconds=MEDIA_CATALOG_REFRESH_INTERVAL)
+    async def regularly_refresh(self):
+        await self.refresh()
+
+    async def refresh(self):
+        """Lists the folders again if any of them changed since they were last listed."""
+
+        folder_modified_at = await asyncio.to_thread(get_folder_modification_times)
+        if self.files is not None and folder_modified_at == self.folder_modified_at:
+            return
+
+        self.files = tuple(await asyncio.to_thread(list_media_files))
+        self.folder_modified_at = folder_modified_at
+        current_files = set(self.files)
+        self.content_hashes = {media_file: content_hash for media_file, content_hash in self.content_hashes.items() if media_file in current_files}
+
+    async def pick(self) -> Optional[MediaFile]:
+        """A random file, or None if there are none."""
+
+        if self.files is None:
+            await self.refresh()
+        assert self.files is not None
+        return random.choice(self.files) if self.files else None
+
+    async def send(self, interaction: discord.Interaction, media_file: MediaFile):
+        """Sends the file as an ephemeral response, reusing its last upload if it is still available."""
+
+        if not media_file.is_attachment:
+            text = await asyncio.to_thread(read_text_file, media_file.path)
+            await interaction.response.send_message(text, ephemeral=True)
+            return
+
+        content_hash = self.content_hashes.get(media_file, None)
+        contents = None
+        if content_hash is None:
+            contents = await asyncio.to_thread(read_binary_file, media_file.path)
+            content_hash = hashlib.sha256(contents).hexdigest()
+            self.content_hashes[media_file] = content_hash
+
+        upload_url = await self.__get_upload_url(content_hash)
+        if upload_url is not None:
+            metrics.increment("cache_lookups_total", cache="media_uploads", result="database")
+            await interaction.response.send_message(upload_url, ephemeral=True)
+            return
+
+        metrics.increment("cache_lookups_total", cache="media_uploads", result="miss")
+        if contents is None:
+            contents = await asyncio.to_thread(read_binary_file, media_file.path)
+        await interaction.response.send_message(file=discord.File(io.BytesIO(contents), filename=os.path.basename(media_file.path)), ephemeral=True)
+
+        original_response = await interaction.original_response()
+        if original_response.attachments:
+            await self.__save_upload_url(content_hash, original_response.attachments[0].url)
+
+    @metrics.timed("database")
+    async def __get_upload_url(self, content_hash: str) -> Optional[str]:
+        async with aiosqlite.connect("./data/database.db") as conn:
+            cursor = await conn.execute("SELECT url FROM media_uploads WHERE content_hash=? AND expires_at>?",
+                                        (content_hash, time.time() + UPLOAD_URL_EXPIRY_MARGIN))
+            row = await cursor.fetchone()
+        return row[0] if row is not None else None
+
+    @metrics.timed("database")
+    async def __save_upload_url(self, content_hash: str, url: str):
+        async with aiosqlite.connect("./data/database.db") as conn:
+            await conn.execute("INSERT OR REPLACE INTO media_uploads (content_hash, url, expires_at) VALUES (?, ?, ?)",
+                               (content_hash, url, get_url_expiry(url)))
+            await conn.commit()
+
+def get_folder_modification_times() -> dict[str, int]:
+    folder_modified_at = {}
+    for folder in MEDIA_FOLDERS:
+        try:
+            folder_modified_at[folder] = os.stat(f"{SECRETS_DATA_DIRECTORY}/{folder}").st_mtime_ns
+        except FileNotFoundError:
+            folder_modified_at[folder] = 0
+    return folder_modified_at
+
+def list_media_files() -> list[MediaFile]:
+    media_files = []
+    for folder, is_attachment in MEDIA_FOLDERS.items():
+        try:
+            entries = list(os.scandir(f"{SECRETS_DATA_DIRECTORY}/{folder}"))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                media_files.append(MediaFile(path=entry.path, is_attachment=is_attachment, size=stat.st_size, modified_at=stat.st_mtime_ns))
+    return media_files
+
+def get_url_expiry(url: str) -> float:
+    """
+    Discord's attachment URLs stop working after a while, which is given in hexadecimal unix time by their "ex" parameter.
+    URLs without one are taken to never expire.
+    """
+
+    expiry = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('ex', None)
+    if not expiry:
+        return float('inf')
+    try:
+        return int(expiry[0], 16)
+    except ValueError:
+        return 0
+
+def read_text_file(path: str) -> str:
+    with open(path, "r") as file:
+        return file.read()
+
+def read_binary_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+media_catalog = MediaCatalog()
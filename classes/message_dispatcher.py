@@ -0,0 +1,119 @@
+import asyncio
+import dataclasses
+import logging
+import re
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import discord
+from classes.metrics import metrics
+from other.global_constants import *
+
+logger = logging.getLogger(__name__)
+
+# Pings, emotes (<...>) and markdown links, eg animated emotes and gifs ([...](...)). They are removed before content triggers are matched.
+# https://regex-vis.com/?r=%3C.%2B%3F%3E%7C%5C%5B.%2B%3F%5C%5D%5C%28.%2B%3F%5C%29
+IGNORED_MARKUP_PATTERN = re.compile(r"<.+?>|\[.+?\]\(.+?\)")
+
+MessageHandler = Callable[[discord.Message], Awaitable[None]]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class MessageTrigger:
+    """What a message trigger handler (see message_trigger) responds to. A trigger with both patterns needs either to match."""
+
+    content_pattern: Optional[str]  # Searched for in the message's content
+    attachment_pattern: Optional[str]  # Searched for in the filenames of the message's attachments
+
+def message_trigger(content_pattern: Optional[str] = None, attachment_pattern: Optional[str] = None) -> Callable[[Any], Any]:
+    """
+    Decorator for cog methods taking a message. The method is called for every message matching one of the patterns,
+    rather than for every message the bot can see. Patterns are regular expressions.
+    """
+
+    assert content_pattern is not None or attachment_pattern is not None
+
+    def decorator(method: Any) -> Any:
+        method.__message_trigger__ = MessageTrigger(content_pattern, attachment_pattern)
+        return method
+
+    return decorator
+
+
+class MessageDispatcher:
+    """
+    The bot's only message listener besides text commands. Every trigger's pattern is also joined into one pattern per kind (content, attachments),
+    which each message is scanned with once however many triggers there are. Only the messages it matches are checked against each trigger's
+    own pattern, so triggers whose matches overlap all fire, and handlers are only called for messages that match them.
+    The patterns have to be rebuilt with build after cogs are loaded, unloaded or reloaded.
+    """
+
+    triggers: list[tuple[MessageHandler, Optional[re.Pattern[str]], Optional[re.Pattern[str]]]]  # (handler, content pattern, attachment pattern)
+    content_prefilter: Optional[re.Pattern[str]]  # Matches if any content pattern does. None if every trigger has to be checked.
+    attachment_prefilter: Optional[re.Pattern[str]]
+
+    def __init__(self):
+        self.triggers = []
+        self.content_prefilter = None
+        self.attachment_prefilter = None
+
+    def build(self, cogs: Iterable[Any]):
+        """Builds the patterns from the triggers of <cogs>, which should be every loaded cog."""
+
+        self.triggers = []
+        for cog in cogs:
+            for method in get_message_trigger_handlers(cog):
+                trigger: MessageTrigger = method.__message_trigger__  # type: ignore
+                content_pattern = re.compile(trigger.content_pattern) if trigger.content_pattern is not None else None
+                attachment_pattern = re.compile(trigger.attachment_pattern) if trigger.attachment_pattern is not None else None
+                self.triggers.append((method, content_pattern, attachment_pattern))
+
+        self.content_prefilter = build_prefilter([content_pattern for _, content_pattern, _ in self.triggers])
+        self.attachment_prefilter = build_prefilter([attachment_pattern for _, _, attachment_pattern in self.triggers])
+
+    async def dispatch(self, message: discord.Message):
+        if message.author.bot:
+            return
+        if MESSAGE_TRIGGER_CHANNEL_IDS and message.channel.id not in MESSAGE_TRIGGER_CHANNEL_IDS:
+            return
+
+        # Removed rather than skipped, so that eg "7<@1>27" still contains 727
+        content = IGNORED_MARKUP_PATTERN.sub("", message.content) if message.content else ""
+        if content and self.content_prefilter is not None and self.content_prefilter.search(content) is None:
+            content = ""
+
+        filenames = [attachment.filename for attachment in message.attachments]
+        if self.attachment_prefilter is not None:
+            filenames = [filename for filename in filenames if self.attachment_prefilter.search(filename) is not None]
+
+        if not content and not filenames:
+            return
+
+        matched_handlers = [handler for handler, content_pattern, attachment_pattern in self.triggers
+                            if (content and content_pattern is not None and content_pattern.search(content) is not None)
+                            or (attachment_pattern is not None and any(attachment_pattern.search(filename) is not None for filename in filenames))]
+        if not matched_handlers:
+            return
+
+        metrics.increment("message_triggers_total", amount=len(matched_handlers))
+        results = await asyncio.gather(*(handler(message) for handler in matched_handlers), return_exceptions=True)
+        for handler, result in zip(matched_handlers, results):
+            if isinstance(result, Exception):
+                logger.error(str(result), exc_info=result, extra={'command': handler.__qualname__, 'user_id': message.author.id})
+
+def build_prefilter(patterns: list[Optional[re.Pattern[str]]]) -> Optional[re.Pattern[str]]:
+    """
+    One pattern matching wherever any of <patterns> does, or None if there is no such pattern to build.
+    Joined patterns share their group numbers and names, which would break the backreferences and named groups of patterns with groups,
+    so with any of those, there is no prefilter and every pattern is checked.
+    """
+
+    patterns = [pattern for pattern in patterns if pattern is not None]
+    if not patterns or any(pattern.groups for pattern in patterns):
+        return None
+    return re.compile("|".join(f"(?:{pattern.pattern})" for pattern in patterns))
+
+def get_message_trigger_handlers(cog: Any) -> list[MessageHandler]:
+    """The cog's methods decorated with message_trigger, bound to the cog."""
+    return [getattr(cog, name) for name in dir(type(cog)) if hasattr(getattr(type(cog), name, None), "__message_trigger__")]
+
+message_dispatcher = MessageDispatcher()
@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import functools
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+from aiohttp import web
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+T = TypeVar("T")
+
+# Upper bounds (in seconds) of the latency histogram buckets. /submit can take minutes, so the buckets go up to 5 minutes.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+EVENT_LOOP_LAG_SAMPLE_INTERVAL = 0.5  # Seconds
+
+# Path segments replaced by placeholders, so that every user / beatmap / interaction doesn't get its own label
+ID_SEGMENT = re.compile(r"^\d+$")
+TOKEN_SEGMENT_MIN_LENGTH = 32
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Counts observations per bucket of LATENCY_BUCKETS. Observing is a bisect and a few additions, so it can be left on everywhere."""
+
+    __slots__ = ("bucket_counts", "count", "sum", "max")
+
+    bucket_counts: list[int]  # Not cumulative, the last one counts observations above every bucket
+    count: int
+    sum: float
+    max: float
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction: float) -> float:
+        """Estimates a quantile by interpolating within its bucket. Quantiles past the last bucket return the maximum."""
+
+        rank = fraction * self.count
+        cumulative_count = 0
+        for bucket_index, bucket_count in enumerate(self.bucket_counts):
+            if cumulative_count + bucket_count >= rank and bucket_count > 0:
+                if bucket_index == len(LATENCY_BUCKETS):
+                    return self.max
+                lower_bound = LATENCY_BUCKETS[bucket_index - 1] if bucket_index > 0 else 0.0
+                upper_bound = LATENCY_BUCKETS[bucket_index]
+                return min(lower_bound + (upper_bound - lower_bound) * (rank - cumulative_count) / bucket_count, self.max)
+            cumulative_count += bucket_count
+        return self.max
+
+
+class Metrics:
+    """
+    In-process metrics: latency histograms, counters and gauges, each identified by a name and a set of labels.
+    Exported in the Prometheus text format (see start_server) and summarised by rpg!stats.
+    """
+
+    histograms: dict[tuple[str, Labels], Histogram]
+    counters: dict[tuple[str, Labels], int]
+    gauges: dict[tuple[str, Labels], float]
+    start_time: float
+    runner: Optional[web.AppRunner]
+    event_loop_lag_task: Optional[asyncio.Task]
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.start_time = time.time()
+        self.runner = None
+        self.event_loop_lag_task = None
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        """Returns the histogram with <name> and <labels>, creating it if needed. Hot paths should keep the returned histogram."""
+
+        key = (name, tuple((label, str(label_value)) for label, label_value in labels.items()))
+        histogram = self.histograms.get(key, None)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def increment(self, name: str, amount: int = 1, **labels: Any):
+        key = (name, tuple((label, str(label_value)) for label, label_value in labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: Any):
+        self.gauges[(name, tuple((label, str(label_value)) for label, label_value in labels.items()))] = value
+
+    def timed(self, phase: str, name: Optional[str] = None) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+        """
+        Decorator for coroutine functions. Records how long every call takes in phase_latency_seconds, labelled with <phase>
+        (eg database, check) and <name>, which defaults to the function's qualified name. Failed calls are recorded as well.
+        """
+
+        def decorator(function: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            histogram = self.histogram("phase_latency_seconds", phase=phase, function=name or function.__qualname__)
+
+            @functools.wraps(function)
+            async def wrapper(*args: Any, **kwargs: Any) -> T:
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+
+            return wrapper
+        return decorator
+
+    def trace_config(self, service: str) -> aiohttp.TraceConfig:
+        """
+        Times every request made by an aiohttp session created with this trace config, labelled with <service> and the request's route.
+        Used for the osu! API (through http_session) and Discord (through the bot's HTTP client, which webhooks and followups share).
+        """
+
+        async def on_request_start(session: aiohttp.ClientSession, context: SimpleNamespace, params: aiohttp.TraceRequestStartParams):
+            context.start = time.perf_counter()
+
+        async def on_request_end(session: aiohttp.ClientSession, context: SimpleNamespace, params: aiohttp.TraceRequestEndParams):
+            self.record_request(service, params.method, params.url.path, params.response.status, time.perf_counter() - context.start)
+
+        async def on_request_exception(session: aiohttp.ClientSession, context: SimpleNamespace, params: aiohttp.TraceRequestExceptionParams):
+            self.record_request(service, params.method, params.url.path, "error", time.perf_counter() - context.start)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def record_request(self, service: str, method: str, path: str, status: int | str, seconds: float):
+        route = normalise_route(path)
+        self.histogram("http_request_duration_seconds", service=service, method=method, route=route).observe(seconds)
+        self.increment("http_requests_total", service=service, method=method, route=route, status=status)
+
+    async def monitor_event_loop_lag(self):
+        """
+        Sleeps for a fixed interval over and over. Whatever it oversleeps by is time the event loop spent running something else without
+        yielding, which delays every command and heartbeat.
+        """
+
+        histogram = self.histogram("event_loop_lag_seconds")
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(EVENT_LOOP_LAG_SAMPLE_INTERVAL)
+            lag = max(time.perf_counter() - start - EVENT_LOOP_LAG_SAMPLE_INTERVAL, 0.0)
+            histogram.observe(lag)
+            self.set_gauge("event_loop_lag_last_seconds", lag)
+
+    def start_monitoring_event_loop_lag(self):
+        if self.event_loop_lag_task is None or self.event_loop_lag_task.done():
+            self.event_loop_lag_task = asyncio.create_task(self.monitor_event_loop_lag())
+
+    def update_process_gauges(self):
+        """Process-wide resource usage, read when metrics are exported rather than continuously."""
+
+        self.set_gauge("process_uptime_seconds", time.time() - self.start_time)
+        self.set_gauge("process_cpu_seconds", time.process_time())
+        if resource is not None:
+            self.set_gauge("process_max_resident_memory_kilobytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+
+        self.update_process_gauges()
+        lines: list[str] = []
+        typed_names: set[str] = set()
+
+        # Every metric's series have to follow its TYPE line, which they do since they are sorted by name
+        def add_type_line(name: str, metric_type: str):
+            if name not in typed_names:
+                typed_names.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            add_type_line(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), value in sorted(self.gauges.items()):
+            add_type_line(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if histogram.count == 0:
+                continue
+            add_type_line(name, "histogram")
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(upper_bound)),))} {cumulative_count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def render_summary(self, name_filter: str = "") -> list[str]:
+        """
+        Human-readable lines for rpg!stats: count, mean, p50, p99 and max of every histogram, followed by counters and gauges.
+        Only metrics whose name or labels contain <name_filter> are included.
+        """
+
+        self.update_process_gauges()
+        lines: list[str] = []
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            description = f"{name}{format_labels(labels)}"
+            if histogram.count == 0 or name_filter not in description:
+                continue
+            lines.append(f"{description}: n={histogram.count} mean={histogram.sum / histogram.count * 1000:.1f}ms "
+                         f"p50={histogram.quantile(0.5) * 1000:.1f}ms p99={histogram.quantile(0.99) * 1000:.1f}ms max={histogram.max * 1000:.1f}ms")
+
+        for (name, labels), value in sorted(self.counters.items()) + sorted(self.gauges.items()):
+            description = f"{name}{format_labels(labels)}"
+            if name_filter in description:
+                lines.append(f"{description}: {value:g}")
+
+        return lines
+
+    async def start_server(self, port: int, host: str = "127.0.0.1"):
+        """Serves render_prometheus() at http://<host>:<port>/metrics. Only listens locally by default, since there is no authentication."""
+
+        async def handle_metrics(request: web.Request) -> web.Response:
+            return web.Response(text=self.render_prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop_server(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label}="{escape_label_value(value)}"' for label, value in labels) + "}"
+
+def escape_label_value(value: str) -> str:
+    """Label values are quoted, so backslashes, double quotes and line breaks in them have to be escaped."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def normalise_route(path: str) -> str:
+    """/api/v2/users/123/scores/recent -> /api/v2/users/{id}/scores/recent. Interaction tokens in webhook paths become {token}."""
+
+    segments = path.split("/")
+    for index, segment in enumerate(segments):
+        if ID_SEGMENT.match(segment):
+            segments[index] = "{id}"
+        elif len(segment) >= TOKEN_SEGMENT_MIN_LENGTH:
+            segments[index] = "{token}"
+    return "/".join(segments)
+
+metrics = Metrics()
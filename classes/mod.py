@@ -3,21 +3,100 @@ from typing import Any, Optional
 
 from classes.extended_enum import ExtendedEnum
 
+# Bitwise enum of classic mods, as used by the osu! API
+CLASSIC_MOD_BITMASKS: dict[str, int] = {
+    "NM": 0,
+    "NF": 1 << 0,
+    "EZ": 1 << 1,
+    "TD": 1 << 2,
+    "HD": 1 << 3,
+    "HR": 1 << 4,
+    "SD": 1 << 5,
+    "DT": 1 << 6,
+    "RX": 1 << 7,
+    "HT": 1 << 8,
+    "NC": 1 << 9,
+    "FL": 1 << 10,
+    "AT": 1 << 11,
+    "SO": 1 << 12,
+    "AP": 1 << 13,
+    "PF": 1 << 14,
+    "4K": 1 << 15,
+    "5K": 1 << 16,
+    "6K": 1 << 17,
+    "7K": 1 << 18,
+    "8K": 1 << 19,
+    "FI": 1 << 20,
+    "RD": 1 << 21,
+    "CN": 1 << 22,
+    "TP": 1 << 23,
+    "9K": 1 << 24,
+    "CO": 1 << 25,
+    "1K": 1 << 26,
+    "3K": 1 << 27,
+    "2K": 1 << 28,
+    "V2": 1 << 29,
+    "MR": 1 << 30,
+}
+CLASSIC_MODS_MASK = (1 << 31) - 1
+
+# Mods that only exist in lazer get bits past the classic ones. These bits are only used internally, never sent to the osu! API.
+MOD_BITMASKS: dict[str, int] = CLASSIC_MOD_BITMASKS | {
+    "DC": 1 << 31,
+    "CL": 1 << 32,
+    "AC": 1 << 33,
+    "SG": 1 << 34,
+    "MU": 1 << 35,
+}
+UNKNOWN_MOD_BITMASK = 1 << 62  # Any mod not in MOD_BITMASKS
+
 
 class Mod:
-    """Class representing an osu mod."""
-    
+    """Class representing an osu mod. Mods without settings are shared, so they must not be modified."""
+
+    __slots__ = ("acronym", "settings", "bitmask")
+
     acronym: str
-    settings: dict[str, Any]
-    
+    settings: Optional[dict[str, Any]]
+    bitmask: int
+
     def __init__(self, mod_info: dict[str, Any]):
         self.acronym = mod_info['acronym']
         self.settings = mod_info.get('settings', None)  # Field is ommitted when fetching from API if the mod doesn't not have any settings changed
+        self.bitmask = MOD_BITMASKS.get(self.acronym, UNKNOWN_MOD_BITMASK)
+
+
+# Mod combinations without settings, shared between all scores that use them
+interned_mod_combinations: dict[tuple[str, ...], tuple[Mod, ...]] = {}
+
+def intern_mods(mods_info: list[dict[str, Any]]) -> tuple[Mod, ...]:
+    """Returns the mods of a score. Combinations without settings are shared instead of being created for every score."""
+
+    if any('settings' in mod_info for mod_info in mods_info):
+        return tuple(Mod(mod_info) for mod_info in mods_info)
+
+    acronyms = tuple(mod_info['acronym'] for mod_info in mods_info)
+    mods = interned_mod_combinations.get(acronyms, None)
+    if mods is None:
+        mods = tuple(Mod(mod_info) for mod_info in mods_info)
+        interned_mod_combinations[acronyms] = mods
+    return mods
+
+def mods_to_bitmask(mod_acronyms: str | list[str]) -> int:
+    """Returns the internal bitmask of a mod acronym or a list of mod acronyms."""
+
+    if isinstance(mod_acronyms, str):
+        return MOD_BITMASKS.get(mod_acronyms, UNKNOWN_MOD_BITMASK)
+
+    bitmask = 0
+    for mod_acronym in mod_acronyms:
+        bitmask |= MOD_BITMASKS.get(mod_acronym, UNKNOWN_MOD_BITMASK)
+    return bitmask
+
 
-        
 class AllowedMods(ExtendedEnum):
     """Mods allowed in a submitted score."""
-    
+
     NF = auto()
     EZ = auto()
     HD = auto()
@@ -33,40 +112,9 @@ class AllowedMods(ExtendedEnum):
     AC = auto()
     SG = auto()
     MU = auto()
-    
+
+ALLOWED_MODS_BITMASK = mods_to_bitmask(AllowedMods.list_as_str())
+
 def mod_to_int(mod_acronym: str) -> Optional[int]:
     """Returns the bitwise enum of a specific mod. Only supports classic mods."""
-
-    match(mod_acronym):
-        case "NM": return 0
-        case "NF": return 1 << 0
-        case "EZ": return 1 << 1
-        case "TD": return 1 << 2
-        case "HD": return 1 << 3
-        case "HR": return 1 << 4
-        case "SD": return 1 << 5
-        case "DT": return 1 << 6
-        case "RX": return 1 << 7
-        case "HT": return 1 << 8
-        case "NC": return 1 << 9
-        case "FL": return 1 << 10
-        case "AT": return 1 << 11
-        case "SO": return 1 << 12
-        case "AP": return 1 << 13
-        case "PF": return 1 << 14
-        case "4K": return 1 << 15
-        case "5K": return 1 << 16
-        case "6K": return 1 << 17
-        case "7K": return 1 << 18
-        case "8K": return 1 << 19
-        case "FI": return 1 << 20
-        case "RD": return 1 << 21
-        case "CN": return 1 << 22
-        case "TP": return 1 << 23
-        case "9K": return 1 << 24
-        case "CO": return 1 << 25
-        case "1K": return 1 << 26
-        case "3K": return 1 << 27
-        case "2K": return 1 << 28
-        case "V2": return 1 << 29
-        case "MR": return 1 << 30
\ No newline at end of file
+    return CLASSIC_MOD_BITMASKS.get(mod_acronym, None)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import asyncio
+import sqlite3
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+MAX_AUTOCOMPLETE_CHOICES = 25  # Discord's limit
+
+
+class TrieNode(Generic[T]):
+    __slots__ = ("children", "values")
+
+    children: dict[str, "TrieNode[T]"]
+    values: list[T]  # Values of the texts that end at this node
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+
+
+class PrefixIndex(Generic[T]):
+    """
+    Case-insensitive trie from texts to values, for autocomplete. A value can be added under several texts, eg an upgrade's ID and name.
+    Finding the values of a prefix only visits the part of the trie under the prefix, up to the number of values asked for.
+    """
+
+    root: TrieNode[T]
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def add(self, text: str, value: T):
+        node = self.root
+        for character in text.casefold():
+            node = node.children.setdefault(character, TrieNode())
+        if value not in node.values:
+            node.values.append(value)
+
+    def remove(self, text: str, value: T):
+        """Removes <value> from under <text>, along with the nodes that no longer lead to any value."""
+
+        path = [self.root]
+        for character in text.casefold():
+            child = path[-1].children.get(character, None)
+            if child is None:
+                return
+            path.append(child)
+
+        if value in path[-1].values:
+            path[-1].values.remove(value)
+        for character, parent, node in reversed(list(zip(text.casefold(), path, path[1:]))):
+            if node.values or node.children:
+                break
+            del parent.children[character]
+
+    def search(self, prefix: str, limit: int = MAX_AUTOCOMPLETE_CHOICES) -> list[T]:
+        """Up to <limit> distinct values of the texts starting with <prefix>, in alphabetical order of their texts."""
+
+        node = self.root
+        for character in prefix.casefold():
+            node = node.children.get(character, None)
+            if node is None:
+                return []
+
+        values: list[T] = []
+        stack = [node]
+        while stack and len(values) < limit:
+            node = stack.pop()
+            for value in node.values:
+                if value not in values:
+                    values.append(value)
+            stack.extend(node.children[character] for character in sorted(node.children, reverse=True))
+        return values[:limit]
+
+
+class UsernameIndex:
+    """
+    The osu! usernames of every verified user, for /profile's autocomplete. Loaded from the database when first searched,
+    then kept in sync by verification and username updates through set_username.
+    """
+
+    usernames: Optional[dict[int, str]]  # osu_id: osu_username. None until loaded.
+    index: PrefixIndex[str]
+    load_lock: asyncio.Lock
+    updates_during_load: Optional[dict[int, str]]  # osu_id: osu_username set while the database was being read, which the read may have missed. None when not loading.
+
+    def __init__(self):
+        self.usernames = None
+        self.index = PrefixIndex()
+        self.load_lock = asyncio.Lock()
+        self.updates_during_load = None
+
+    async def search(self, prefix: str) -> list[str]:
+        if self.usernames is None:
+            async with self.load_lock:
+                if self.usernames is None:
+                    await self.load()
+        return self.index.search(prefix)
+
+    async def load(self):
+        self.updates_during_load = {}
+        try:
+            rows = await asyncio.to_thread(read_usernames)
+        finally:
+            updates_during_load, self.updates_during_load = self.updates_during_load, None
+
+        index: PrefixIndex[str] = PrefixIndex()
+        for _, osu_username in rows:
+            index.add(osu_username, osu_username)
+        self.index = index
+        self.usernames = dict(rows)
+
+        for osu_id, osu_username in updates_during_load.items():
+            self.set_username(osu_id, osu_username)
+
+    def set_username(self, osu_id: int, osu_username: str):
+        """Call after writing a user's username to the database. Before the index is loaded, loading reads the new username instead."""
+
+        if self.usernames is None:
+            if self.updates_during_load is not None:
+                self.updates_during_load[osu_id] = osu_username
+            return
+        old_username = self.usernames.get(osu_id, None)
+        if old_username is not None:
+            self.index.remove(old_username, old_username)
+        self.usernames[osu_id] = osu_username
+        self.index.add(osu_username, osu_username)
+
+def read_usernames() -> list[tuple[int, str]]:
+    with sqlite3.connect("./data/database.db") as conn:
+        rows = conn.execute("SELECT osu_id, osu_username FROM exp_table WHERE osu_username IS NOT NULL").fetchall()
+    conn.close()
+    return rows
+
+username_index = UsernameIndex()
@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ProcessPool:
+    """
+    The process pool shared by CPU-heavy work (difficulty calculation, replay parsing), so that it doesn't block the event loop.
+    Functions run in it have to be module-level functions, since they are pickled.
+    """
+
+    executor: Optional[ProcessPoolExecutor]
+
+    def __init__(self):
+        self.executor = None
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        # Created when first needed, so that processes that never use the pool don't spawn workers
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+process_pool = ProcessPool()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import signal
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+SAMPLING_INTERVAL = 0.005  # Seconds between stack samples
+MAX_TOP_ENTRIES = 50
+TRACEMALLOC_FRAMES = 10  # Frames kept per allocation. More frames make tracebacks more useful, but tracing slower.
+
+
+class ProfilerError(Exception):
+    pass
+
+
+class Profiler:
+    """
+    Profiles the running bot on demand, without a restart. Nothing is hooked in while no profile is running, so it costs nothing when idle.
+    Only one profile can run at a time, since cProfile and the sampler would measure each other.
+    """
+
+    running: bool
+
+    def __init__(self):
+        self.running = False
+
+    async def profile(self, seconds: float, sort_key: str = "cumulative") -> str:
+        """
+        Profiles every function called in the event loop's thread for <seconds> with cProfile, and returns the top entries sorted by <sort_key>.
+        Every call is recorded, so it is exact but slows the bot down while it runs.
+        """
+
+        self.__start()
+        profile = cProfile.Profile()
+        try:
+            # The event loop runs in this thread, so every task that runs while this one sleeps is profiled
+            profile.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            self.running = False
+
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats(sort_key).print_stats(MAX_TOP_ENTRIES)
+        return output.getvalue()
+
+    async def sample(self, seconds: float) -> str:
+        """
+        Records the event loop thread's stack every SAMPLING_INTERVAL of CPU time for <seconds>, and returns the functions that were seen
+        the most, followed by every stack in collapsed form (one line per stack, usable by flamegraph tools).
+        Much cheaper than profile(), but only shows where CPU time goes, not how many calls were made. Idle time isn't sampled.
+        """
+
+        if not hasattr(signal, "setitimer"):
+            raise ProfilerError("Sampling isn't supported on this platform. Use `cprofile` instead.")
+
+        self.__start()
+        stack_counts: Counter[tuple[str, ...]] = Counter()
+
+        # SIGPROF handlers run in the main thread, between two bytecodes of whatever it was running, so <frame> is exactly where CPU time was going
+        def record_sample(signal_number: int, frame: Optional[FrameType]):
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack_counts[tuple(reversed(stack))] += 1
+
+        previous_handler = signal.signal(signal.SIGPROF, record_sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLING_INTERVAL, SAMPLING_INTERVAL)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous_handler)
+            self.running = False
+
+        num_samples = sum(stack_counts.values())
+        if num_samples == 0:
+            return f"No samples over {seconds}s, the bot was idle."
+
+        self_counts: Counter[str] = Counter()
+        inclusive_counts: Counter[str] = Counter()
+        for stack, count in stack_counts.items():
+            self_counts[stack[-1]] += count
+            for function in set(stack):
+                inclusive_counts[function] += count
+
+        lines = [f"{num_samples} samples over {seconds}s, one every {SAMPLING_INTERVAL * 1000:.0f}ms of CPU time", "", "Self (running this function)"]
+        lines += [f"{count / num_samples:7.2%}  {function}" for function, count in self_counts.most_common(MAX_TOP_ENTRIES)]
+        lines += ["", "Inclusive (this function or something it called)"]
+        lines += [f"{count / num_samples:7.2%}  {function}" for function, count in inclusive_counts.most_common(MAX_TOP_ENTRIES)]
+        lines += ["", "Collapsed stacks"]
+        lines += [f"{';'.join(stack)} {count}" for stack, count in stack_counts.most_common()]
+        return "\n".join(lines)
+
+    def __start(self):
+        if self.running:
+            raise ProfilerError("A profile is already running!")
+        self.running = True
+
+
+class AllocationTracker:
+    """
+    Takes tracemalloc snapshots, so that memory growth can be traced to the lines that allocated it.
+    tracemalloc slows down every allocation while it is on, so it is only on between start() and stop().
+    """
+
+    first_snapshot: Optional[tracemalloc.Snapshot]
+    last_snapshot: Optional[tracemalloc.Snapshot]
+    last_snapshot_time: float
+
+    def __init__(self):
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.last_snapshot_time = 0
+
+    def start(self, num_frames: int = TRACEMALLOC_FRAMES):
+        """Starts tracing and takes the first snapshot. Only allocations made after this are seen."""
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(num_frames)
+        self.first_snapshot = self.last_snapshot = self.__take_snapshot()
+        self.last_snapshot_time = time.time()
+
+    def stop(self):
+        tracemalloc.stop()
+        self.first_snapshot = None
+        self.last_snapshot = None
+
+    def snapshot(self, key_type: str = "lineno") -> str:
+        """
+        Takes a snapshot and returns the allocations that grew the most since the previous snapshot and since start(),
+        grouped by <key_type> (lineno, filename or traceback).
+        """
+
+        if self.first_snapshot is None or self.last_snapshot is None or not tracemalloc.is_tracing():
+            raise ProfilerError("Allocation tracking isn't running! Start it with `rpg!memory start`.")
+
+        snapshot = self.__take_snapshot()
+        current_size, peak_size = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current_size / 1024 / 1024:.1f} MiB (peak {peak_size / 1024 / 1024:.1f} MiB), "
+                 f"tracemalloc overhead: {tracemalloc.get_tracemalloc_memory() / 1024 / 1024:.1f} MiB"]
+
+        lines += ["", f"Since the previous snapshot ({time.time() - self.last_snapshot_time:.0f}s ago)"]
+        lines += format_statistic_diffs(snapshot.compare_to(self.last_snapshot, key_type), key_type)
+        lines += ["", "Since tracking started"]
+        lines += format_statistic_diffs(snapshot.compare_to(self.first_snapshot, key_type), key_type)
+
+        self.last_snapshot = snapshot
+        self.last_snapshot_time = time.time()
+        return "\n".join(lines)
+
+    def __take_snapshot(self) -> tracemalloc.Snapshot:
+        # Allocations made by tracemalloc itself would drown out the rest
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+
+def format_statistic_diffs(statistic_diffs: list[tracemalloc.StatisticDiff], key_type: str) -> list[str]:
+    lines = []
+    for statistic_diff in statistic_diffs[:MAX_TOP_ENTRIES]:
+        lines.append(f"{statistic_diff.size_diff / 1024:+10.1f} KiB {statistic_diff.count_diff:+8} blocks "
+                     f"(total {statistic_diff.size / 1024:.1f} KiB)  {statistic_diff.traceback}")
+        if key_type == "traceback":
+            lines += [f"    {line}" for line in statistic_diff.traceback.format()]
+    return lines
+
+profiler = Profiler()
+allocation_tracker = AllocationTracker()
@@ -0,0 +1,57 @@
+import time
+from typing import Awaitable, Callable
+
+import discord
+from classes.metrics import metrics
+
+MAX_RENDERED_EMBEDS = 5000  # Least recently used embeds are dropped past this point
+RENDERED_EMBED_TTL = 600  # Seconds. A safety net for writes that don't go through invalidate, eg editing the database by hand.
+
+EmbedField = tuple[str, str, bool]  # name, value, inline
+
+
+class RenderCache:
+    """
+    Per-user cache of the fields of embeds that only depend on the user's exp, currency and upgrades, eg /shop and /profile.
+    Every write to a user's exp, currency or upgrades calls invalidate, which bumps the user's version.
+    A render is only cached if the version didn't change while it was rendering, so a write racing a render never leaves a stale embed behind.
+    """
+
+    versions: dict[int, int]  # osu_id: number of writes. One int per user that ever had a write, so it stays small.
+    embeds: dict[tuple[str, int], tuple[int, float, list[EmbedField]]]  # (embed name, osu_id): (version, time rendered, fields), least recently used first
+
+    def __init__(self):
+        self.versions = {}
+        self.embeds = {}
+
+    async def get_fields(self, embed_name: str, osu_id: int, render: Callable[[], Awaitable[list[EmbedField]]]) -> list[EmbedField]:
+        """Returns the cached fields of <embed_name> for the user, calling <render> if they aren't cached or are outdated."""
+
+        key = (embed_name, osu_id)
+        version = self.versions.get(osu_id, 0)
+        cached_embed = self.embeds.pop(key, None)
+        if cached_embed is not None and cached_embed[0] == version and time.monotonic() - cached_embed[1] < RENDERED_EMBED_TTL:
+            self.embeds[key] = cached_embed  # Reinserted to be the most recently used
+            metrics.increment("cache_lookups_total", cache="embeds", result="memory")
+            return cached_embed[2]
+
+        metrics.increment("cache_lookups_total", cache="embeds", result="miss")
+        fields = await render()
+        if self.versions.get(osu_id, 0) == version:
+            self.embeds[key] = (version, time.monotonic(), fields)
+            if len(self.embeds) > MAX_RENDERED_EMBEDS:
+                del self.embeds[next(iter(self.embeds))]
+        return fields
+
+    def invalidate(self, osu_id: int):
+        self.versions[osu_id] = self.versions.get(osu_id, 0) + 1
+
+    def clear(self):
+        """Drops every cached embed, eg when the game data is reloaded."""
+        self.embeds.clear()
+
+def add_fields_to_embed(embed: discord.Embed, fields: list[EmbedField]):
+    for name, value, inline in fields:
+        embed.add_field(name=name, value=value, inline=inline)
+
+render_cache = RenderCache()
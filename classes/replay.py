@@ -0,0 +1,201 @@
+import datetime
+import lzma
+import struct
+from typing import Optional
+
+from classes.mod import CLASSIC_MOD_BITMASKS
+
+TAIKO_MODE = 1
+WINDOWS_TICKS_PER_MICROSECOND = 10
+REPLAY_FRAME_SEED_MARKER = -12345  # The last frame of a replay stores the RNG seed instead of inputs
+DRUM_KEYS_BITMASK = 0b1111  # The four drum keys. Higher bits are smoke, which isn't a hit.
+
+# A stable bitmask sets both DT and NC for NC, and both SD and PF for PF
+CLASSIC_MOD_ACRONYMS = {bitmask: acronym for acronym, bitmask in CLASSIC_MOD_BITMASKS.items() if bitmask != 0}
+IMPLIED_MODS = {"NC": "DT", "PF": "SD"}
+
+
+class InvalidReplayError(Exception):
+    """Raised when a .osr file can't be parsed."""
+
+
+class Replay:
+    """Class representing an osu! replay (.osr file). Only the header and the number of key presses are kept, not the frames themselves."""
+
+    __slots__ = ("mode", "version", "beatmap_checksum", "player_name", "replay_checksum", "num_300s", "num_100s", "num_50s", "num_gekis",
+                 "num_katus", "num_misses", "total_score", "max_combo", "is_perfect_combo", "mods", "final_life", "timestamp", "online_score_id",
+                 "num_frames", "num_key_presses")
+
+    mode: int
+    version: int
+    beatmap_checksum: str  # MD5 of the .osu file
+    player_name: str
+    replay_checksum: str
+    num_300s: int
+    num_100s: int
+    num_50s: int
+    num_gekis: int
+    num_katus: int
+    num_misses: int
+    total_score: int
+    max_combo: int
+    is_perfect_combo: bool
+    mods: int  # Classic bitwise enum
+    final_life: Optional[float]  # None if the replay has no life bar graph
+    timestamp: datetime.datetime
+    online_score_id: int  # 0 if the score wasn't submitted online
+    num_frames: int
+    num_key_presses: int
+
+    def mod_acronyms(self) -> list[str]:
+        """Converts the classic mod bitmask to a list of acronyms, in the same format as the osu! API."""
+
+        acronyms = [acronym for bitmask, acronym in CLASSIC_MOD_ACRONYMS.items() if self.mods & bitmask]
+        for mod_acronym, implied_mod_acronym in IMPLIED_MODS.items():
+            if mod_acronym in acronyms and implied_mod_acronym in acronyms:
+                acronyms.remove(implied_mod_acronym)
+        return acronyms
+
+    def accuracy(self) -> float:
+        """Taiko accuracy, from 0 to 100."""
+
+        num_notes_judged = self.num_300s + self.num_100s + self.num_misses
+        if num_notes_judged == 0:
+            return 0
+        return (self.num_300s + 0.5 * self.num_100s) / num_notes_judged * 100
+
+
+class ReplayReader:
+    """Reads the primitive types used in .osr files."""
+
+    data: bytes
+    offset: int
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def read(self, format: str) -> int | float:
+        size = struct.calcsize(format)
+        if self.offset + size > len(self.data):
+            raise InvalidReplayError("Replay ended unexpectedly")
+        value = struct.unpack_from(format, self.data, self.offset)[0]
+        self.offset += size
+        return value
+
+    def read_byte(self) -> int:
+        return int(self.read("<B"))
+
+    def read_short(self) -> int:
+        return int(self.read("<H"))
+
+    def read_int(self) -> int:
+        return int(self.read("<i"))
+
+    def read_long(self) -> int:
+        return int(self.read("<q"))
+
+    def read_uleb128(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            byte = self.read_byte()
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80 == 0:
+                return value
+            shift += 7
+
+    def read_string(self) -> str:
+        # 0x00 means the string isn't present, 0x0b means it is followed by its length and the string itself
+        indicator = self.read_byte()
+        if indicator == 0x00:
+            return ""
+        if indicator != 0x0B:
+            raise InvalidReplayError("Invalid string in replay")
+
+        length = self.read_uleb128()
+        if self.offset + length > len(self.data):
+            raise InvalidReplayError("Replay ended unexpectedly")
+        value = self.data[self.offset:self.offset + length].decode("utf-8", errors="replace")
+        self.offset += length
+        return value
+
+    def read_bytes(self, length: int) -> bytes:
+        if length < 0 or self.offset + length > len(self.data):
+            raise InvalidReplayError("Replay ended unexpectedly")
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+
+def parse_replay(data: bytes) -> Replay:
+    """
+    Parses the contents of a .osr file: https://osu.ppy.sh/wiki/en/Client/File_formats/osr_%28file_format%29
+    Runs inside the process pool, so this has to stay a picklable module-level function.
+    """
+
+    reader = ReplayReader(data)
+    replay = Replay()
+
+    replay.mode = reader.read_byte()
+    replay.version = reader.read_int()
+    replay.beatmap_checksum = reader.read_string()
+    replay.player_name = reader.read_string()
+    replay.replay_checksum = reader.read_string()
+    replay.num_300s = reader.read_short()
+    replay.num_100s = reader.read_short()
+    replay.num_50s = reader.read_short()
+    replay.num_gekis = reader.read_short()
+    replay.num_katus = reader.read_short()
+    replay.num_misses = reader.read_short()
+    replay.total_score = reader.read_int()
+    replay.max_combo = reader.read_short()
+    replay.is_perfect_combo = reader.read_byte() == 1
+    replay.mods = reader.read_int()
+    replay.final_life = parse_final_life(reader.read_string())
+    replay.timestamp = datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(microseconds=reader.read_long() // WINDOWS_TICKS_PER_MICROSECOND)
+
+    compressed_frames = reader.read_bytes(reader.read_int())
+    replay.online_score_id = reader.read_long()
+
+    try:
+        frames = lzma.decompress(compressed_frames, format=lzma.FORMAT_ALONE).decode("ascii")
+    except (lzma.LZMAError, UnicodeDecodeError) as error:
+        raise InvalidReplayError(f"Replay frames can't be decompressed: {error}")
+
+    replay.num_frames, replay.num_key_presses = count_frames_and_key_presses(frames)
+    return replay
+
+
+def parse_final_life(life_bar_graph: str) -> Optional[float]:
+    """The life bar graph is a comma separated list of time|life pairs. The replay is a fail if the life at the end is 0."""
+
+    life_points = [point for point in life_bar_graph.split(",") if point]
+    if not life_points:
+        return None
+    return float(life_points[-1].split("|")[1])
+
+
+def count_frames_and_key_presses(frames: str) -> tuple[int, int]:
+    """Frames are comma separated w|x|y|z, where z is the bitwise combination of keys held down. A key press is a key that wasn't held in the previous frame."""
+
+    num_frames = 0
+    num_key_presses = 0
+    previous_keys = 0
+
+    for frame in frames.split(","):
+        if not frame:
+            continue
+
+        fields = frame.split("|")
+        if len(fields) != 4:
+            raise InvalidReplayError("Replay contains an invalid frame")
+        if int(fields[0]) == REPLAY_FRAME_SEED_MARKER:
+            continue
+
+        keys = int(float(fields[3])) & DRUM_KEYS_BITMASK
+        num_key_presses += (keys & ~previous_keys).bit_count()
+        previous_keys = keys
+        num_frames += 1
+
+    return num_frames, num_key_presses
\ No newline at end of file
@@ -4,137 +4,126 @@ from typing import Any
 import aiosqlite
 import dateutil.parser
 
-import other.utility
-from classes.beatmap import Beatmap, Beatmapset
-from classes.exp import ExpBarName
-from classes.http_session import http_session
-from classes.mod import AllowedMods, Mod, mod_to_int
+from classes.beatmap import Beatmap, BeatmapAttributes, Beatmapset
+from classes.beatmap_store import beatmap_store
+from classes.metrics import metrics
+from classes.mod import ALLOWED_MODS_BITMASK, MOD_BITMASKS, Mod, intern_mods, mods_to_bitmask
 from other.global_constants import *
 
 
+EXP_BAR_MODS_BITMASK = mods_to_bitmask(["HD", "HR", "DT", "NC", "HT", "DC"])  # NC and DC belong under the DT and HT exp bars
+SPEED_CHANGING_MODS = frozenset(["DT", "NC", "HT", "DC"])
+
+
+def parse_timestamp(timestamp: str) -> datetime.datetime:
+    """Converts an ISO 8601 format timestamp to a datetime object. The osu! API's format is handled by the fast built-in parser."""
+    try:
+        return datetime.datetime.fromisoformat(timestamp)
+    except ValueError:
+        return dateutil.parser.parse(timestamp)
+
+
 class Score:
-    "Class representing an osu score. Contains information about the score itself, exp gained from the score, and beatmap and beatmapset information."
+    """
+    Class representing an osu score. Contains information about the score itself, and beatmap and beatmapset information.
+    Only the fields used by the reward calculation and the embeds are kept, since a /submit can create up to 100 of these.
+    """
+    
+    __slots__ = ("username", "user_osu_id", "score_id", "num_300s", "num_100s", "num_misses", "note_hits", "accuracy", 
+                 "mods", "mods_bitmask", "timestamp", "is_pass", "beatmap", "beatmap_attributes", "beatmapset")
     
     username: str
     user_osu_id: int
-    user_discord_id: int
     
     score_id: int
-    score_url: str
     
     num_300s: int
     num_100s: int
     num_misses: int
     note_hits: int
-    max_combo: int  # In the score, not the map
     accuracy: float
-    rank: str
-    mods: list[Mod]
-    mods_human_readable: str
+    mods: tuple[Mod, ...]
+    mods_bitmask: int  # Internal bitmask of all mods in the score, see MOD_BITMASKS
     timestamp: datetime.datetime
     
-    is_FC: bool
     is_pass: bool
-    is_convert: bool
     
     beatmap: Beatmap
+    beatmap_attributes: BeatmapAttributes  # Mod-adjusted values of the beatmap
     beatmapset: Beatmapset
     
+    def __init__(self, username: str, user_osu_id: int, score_id: int, num_300s: int, num_100s: int, num_misses: int, accuracy: float, 
+                 mods: tuple[Mod, ...], timestamp: datetime.datetime, is_pass: bool, beatmap: Beatmap, beatmap_attributes: BeatmapAttributes, beatmapset: Beatmapset):
+        self.username = username
+        self.user_osu_id = user_osu_id
+        self.score_id = score_id
+        self.num_300s = num_300s
+        self.num_100s = num_100s
+        self.num_misses = num_misses
+        self.note_hits = num_300s + num_100s
+        self.accuracy = accuracy
+        self.mods = mods
+        self.mods_bitmask = 0
+        for mod in mods:
+            self.mods_bitmask |= mod.bitmask
+        self.timestamp = timestamp
+        self.is_pass = is_pass
+        self.beatmap = beatmap
+        self.beatmap_attributes = beatmap_attributes
+        self.beatmapset = beatmapset
+    
     @classmethod
     async def create_score_object(cls, score_info: dict[str, Any]):
-        self = cls()
-        self.username = score_info['user']['username']
-        self.user_osu_id = score_info['user']['id']
-        await self.__init_user_discord_id()
+        """Creates a score from the osu! API's score info."""
         
-        self.score_id = score_info['id']
-        self.score_url = f"https://osu.ppy.sh/scores/{self.score_id}"
+        mods = intern_mods(score_info['mods'])
+        beatmap = await beatmap_store.get_beatmap(score_info['beatmap'])
         
         score_statistics: dict[str, int] = score_info['statistics']
-        self.num_300s = score_statistics.get('great', 0)  # Field is ommitted when fetching from API if there are no 300s
-        self.num_100s = score_statistics.get('ok', 0)  # Field is ommitted when fetching from API if there are no 100s
-        self.num_misses = score_statistics.get('miss', 0)  # Field is ommitted when fetching from API if there are no misses
-        self.note_hits = self.num_300s + self.num_100s
-        self.max_combo = score_info['max_combo']
-        self.accuracy = score_info['accuracy'] * 100  # Convert from 0.99 to 99 for example, since it's more intuitive
-        self.rank = score_info['rank']
-        self.mods = [Mod(mod_info) for mod_info in score_info['mods']]
-        self.__init_human_readable_mod_listing()
-        self.timestamp = dateutil.parser.parse(score_info['ended_at'])  # Converts ISO 8601 format timestamp to datetime object
-        
-        self.is_FC = score_info['is_perfect_combo']
-        self.is_pass = score_info['passed']
-        self.is_convert = score_info['beatmap']['convert']
-        
-        self.beatmap = Beatmap(score_info['beatmap'], await self.__get_beatmap_attributes(score_info), self)
-        self.beatmapset = Beatmapset(score_info['beatmapset'])
-        
-        return self
-    
-    async def __init_user_discord_id(self):
-        discord_id = await other.utility.get_discord_id(osu_id=self.user_osu_id)
-        assert discord_id is not None  # You can't send a score without being verified
-        self.user_discord_id = discord_id
-    
-    def __init_human_readable_mod_listing(self):
-        """Create a human-readable listing of the mods used in the score."""
-        
-        mods_human_readable = ""
-        for mod in self.mods:
-            mods_human_readable += mod.acronym + " "
-        self.mods_human_readable = mods_human_readable.strip()  # Remove trailing whitespace
+        return cls(
+            username = score_info['user']['username'],
+            user_osu_id = score_info['user']['id'],
+            score_id = score_info['id'],
+            num_300s = score_statistics.get('great', 0),  # Field is ommitted when fetching from API if there are no 300s
+            num_100s = score_statistics.get('ok', 0),  # Field is ommitted when fetching from API if there are no 100s
+            num_misses = score_statistics.get('miss', 0),  # Field is ommitted when fetching from API if there are no misses
+            accuracy = score_info['accuracy'] * 100,  # Convert from 0.99 to 99 for example, since it's more intuitive
+            mods = mods,
+            timestamp = parse_timestamp(score_info['ended_at']),
+            is_pass = score_info['passed'],
+            beatmap = beatmap,
+            beatmap_attributes = await beatmap_store.get_beatmap_attributes(beatmap, mods),
+            beatmapset = beatmap_store.get_beatmapset(score_info['beatmapset']),
+        )
+    
+    @property
+    def score_url(self) -> str:
+        return f"https://osu.ppy.sh/scores/{self.score_id}"
+    
+    @property
+    def mods_human_readable(self) -> str:
+        """A human-readable listing of the mods used in the score."""
+        return " ".join(mod.acronym for mod in self.mods)
     
     def count_number_of_exp_bar_mods_activated(self) -> int:
-        number_of_exp_bar_mods_activated = 0
-        
-        for mod in self.mods:
-            
-            # There is no mod with the name "Overall" or "NM"
-            if mod.acronym in ExpBarName.list_as_str() + ['NC', 'DC']:
-                number_of_exp_bar_mods_activated += 1
-                
-        return number_of_exp_bar_mods_activated
-    
-    async def __get_beatmap_attributes(self, score_info: dict[str, Any]) -> dict[str, Any]:
-        headers = {
-            'Accept': "application/json",
-            'Content-Type': "application/json",
-            'Authorization': f"Bearer {os.getenv('OSU_API_ACCESS_TOKEN')}",
-        }
-        
-        params = {
-            'ruleset': "taiko",
-            'mods': 0
-        }
-        
-        # List of mod acronyms do not work for the 'mods' parameter, for some reason, so we manually calculate the mod combination int
-        for mod in self.mods:
-            mod_bitwise_enum = mod_to_int(mod.acronym)
-            if mod_bitwise_enum is not None:
-                params['mods'] += mod_bitwise_enum
-                
-        url = f"https://osu.ppy.sh/api/v2/beatmaps/{score_info['beatmap']['id']}/attributes"
-        async with http_session.interface.post(url, headers=headers, params=params) as resp:
-            parsed_response = await resp.json()
-            return parsed_response['attributes']
+        # There is no mod with the name "Overall" or "NM"
+        return (self.mods_bitmask & EXP_BAR_MODS_BITMASK).bit_count()
     
     def is_taiko(self) -> bool:
         return self.beatmap.mode == "taiko"
     
     def has_illegal_mods(self) -> bool:
-        for mod in self.mods:
-            if mod.acronym not in AllowedMods.list_as_str():
-                return True
-        return False
+        return self.mods_bitmask & ~ALLOWED_MODS_BITMASK != 0
     
     def has_illegal_dt_ht_rates(self) -> bool:
         for mod in self.mods:
             # Default DT and HT do not have a 'speed_change' modifier
-            if mod.acronym in ['DT', 'NC', 'HT', 'DC'] and mod.settings is not None:
+            if mod.settings is not None and mod.acronym in SPEED_CHANGING_MODS:
                 if 'speed_change' in mod.settings:
                     return True
         return False
     
+    @metrics.timed("database")
     async def is_already_submitted(self) -> bool:
         async with aiosqlite.connect("./data/database.db") as conn:
     
@@ -170,8 +159,13 @@ class Score:
         Check if a mod(s) is in a score. Accepts a mod acronym or a list of mod acronyms.
         If a list is passed in, it will return True if any of the mods in the list are in the score.
         """
-        
-        for mod_used in self.mods:
-            if mod_used.acronym in mods_to_check_for:
-                return True
-        return False
\ No newline at end of file
+        if isinstance(mods_to_check_for, str):
+            mods_to_check_for = [mods_to_check_for]
+
+        known_acronyms = [acronym for acronym in mods_to_check_for if acronym in MOD_BITMASKS]
+        if self.mods_bitmask & mods_to_bitmask(known_acronyms) != 0:
+            return True
+
+        # Unknown mods all share UNKNOWN_MOD_BITMASK, so they're told apart by their acronym
+        unknown_acronyms = [acronym for acronym in mods_to_check_for if acronym not in MOD_BITMASKS]
+        return any(mod.acronym in unknown_acronyms for mod in self.mods)
\ No newline at end of file
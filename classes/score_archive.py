@@ -0,0 +1,346 @@
+import array
+import asyncio
+import datetime
+import functools
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+from classes.exp import ExpBarName
+from classes.metrics import metrics
+from discord.ext import tasks
+from init.currency_init import init_currency
+
+if TYPE_CHECKING:
+    from classes.score import Score
+
+SCORE_ARCHIVE_DIRECTORY = "./data/score_archive"  # One directory per UTC day of the scores' timestamps, eg 2024-07-31, holding that day's chunks
+ARCHIVE_FLUSH_INTERVAL = 60  # Seconds
+MAX_PENDING_ROWS = 100_000  # Past this, new scores are dropped until the next flush
+COMPACTION_AGE = 2  # Days. Scores can be submitted up to a day after they were set, so only older partitions are done being written to.
+COMPRESSION_LEVEL = 6
+LEFTOVER_TMP_FILE_AGE = 24 * 60 * 60  # Seconds. Younger temporary files may still be being written, by this or another process.
+
+# Chunk file: MAGIC, header length (uint32), JSON header, then every column's zlib-compressed bytes back to back.
+# The header lists each column's typecode and where its bytes are, so that a reader only decompresses the columns it asks for.
+MAGIC = b"TRPGSA1\n"
+HEADER_LENGTH_FORMAT = "<I"
+CHUNK_FILE_EXTENSION = ".chunk"
+COMPACTED_CHUNK_FILE_EXTENSION = f".compacted{CHUNK_FILE_EXTENSION}"  # Holds the rows of every chunk of its partition written before it
+
+# Column: array typecode. Typecodes are those of the array module, eg q is a 64-bit int and d a double.
+SCORE_COLUMNS: dict[str, str] = {
+    'timestamp': "q",  # Unix time the score was set, in seconds
+    'osu_id': "q",
+    'score_id': "q",
+    'beatmap_id': "q",
+    'mods_bitmask': "q",  # Internal bitmask, see MOD_BITMASKS
+    'is_pass': "b",
+    'num_300s': "i",
+    'num_100s': "i",
+    'num_misses': "i",
+    'num_notes': "i",
+    'accuracy': "d",
+    'sr': "d",
+    'od': "d",
+    'drain_time': "i",
+}
+
+
+@functools.cache
+def get_columns() -> dict[str, str]:
+    """Every archived column: the score's stats, then the exp gained on each exp bar and each currency gained."""
+
+    columns = dict(SCORE_COLUMNS)
+    for exp_bar_name in ExpBarName.list_as_str():
+        columns[f"exp_{exp_bar_name.lower()}"] = "q"
+    for currency_name in init_currency().keys():
+        columns[f"currency_{currency_name}"] = "q"
+    return columns
+
+
+class ScoreArchive:
+    """
+    Append-only history of every processed score and what it was rewarded, kept forever (unlike submitted_scores) for analytics and recomputation.
+    Scores are stored by column, in compressed chunks partitioned by day. Full scans then only read and decompress the columns they need.
+    Recording appends to in-memory arrays. A background task writes them out as a new chunk per day, off the event loop.
+    """
+
+    pending: dict[str, dict[str, array.array]]  # day: column: values not written yet
+    num_pending: int
+    lock: asyncio.Lock  # Prevents two flushes or compactions from writing the same partition at once
+
+    def __init__(self):
+        self.pending = {}
+        self.num_pending = 0
+        self.lock = asyncio.Lock()
+
+    def record(self, score: 'Score', exp_gained: dict[str, int], currency_gained: dict[str, int]):
+        if self.num_pending >= MAX_PENDING_ROWS:
+            metrics.increment("score_archive_dropped_total")
+            return
+
+        day = score.timestamp.astimezone(datetime.timezone.utc).date().isoformat()
+        columns = self.pending.get(day, None)
+        if columns is None:
+            columns = self.pending[day] = {column: array.array(typecode) for column, typecode in get_columns().items()}
+
+        row = {
+            'timestamp': int(score.timestamp.timestamp()),
+            'osu_id': score.user_osu_id,
+            'score_id': score.score_id,
+            'beatmap_id': score.beatmap.id,
+            'mods_bitmask': score.mods_bitmask,
+            'is_pass': score.is_pass,
+            'num_300s': score.num_300s,
+            'num_100s': score.num_100s,
+            'num_misses': score.num_misses,
+            'num_notes': score.beatmap.num_notes,
+            'accuracy': score.accuracy,
+            'sr': score.beatmap_attributes.sr,
+            'od': score.beatmap_attributes.od,
+            'drain_time': score.beatmap_attributes.drain_time,
+        }
+        for exp_bar_name, exp in exp_gained.items():
+            row[f"exp_{exp_bar_name.lower()}"] = exp
+        for currency_name, amount in currency_gained.items():
+            row[f"currency_{currency_name}"] = amount
+
+        for column, values in columns.items():
+            values.append(row.get(column, 0))
+        self.num_pending += 1
+
+    @tasks.loop(seconds=ARCHIVE_FLUSH_INTERVAL)
+    async def regularly_flush(self):
+        await self.flush()
+
+    @tasks.loop(hours=6)
+    async def regularly_compact(self):
+        async with self.lock:
+            num_compacted = await asyncio.to_thread(compact_old_partitions)
+        metrics.increment("score_archive_compactions_total", num_compacted)
+
+    async def flush(self):
+        """Writes every pending score to a new chunk in its day's partition."""
+
+        async with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.num_pending = 0
+            for day, columns in pending.items():
+                num_bytes = await asyncio.to_thread(write_chunk, get_partition_directory(day), columns)
+                metrics.increment("score_archive_rows_total", len(columns['timestamp']))
+                metrics.increment("score_archive_bytes_total", num_bytes)
+
+def get_partition_directory(day: str, directory: str = SCORE_ARCHIVE_DIRECTORY) -> str:
+    return f"{directory}/{day}"
+
+def write_chunk(partition_directory: str, columns: dict[str, array.array]) -> int:
+    """Writes <columns> as a new chunk in <partition_directory>. Returns the chunk's size in bytes."""
+
+    header: dict[str, Any] = {'num_rows': len(next(iter(columns.values()))), 'byteorder': sys.byteorder, 'columns': {}}
+    blobs = []
+    offset = 0
+    for column, values in columns.items():
+        blob = zlib.compress(values.tobytes(), COMPRESSION_LEVEL)
+        header['columns'][column] = {'typecode': values.typecode, 'offset': offset, 'length': len(blob)}
+        blobs.append(blob)
+        offset += len(blob)
+
+    encoded_header = json.dumps(header, separators=(",", ":")).encode()
+    os.makedirs(partition_directory, exist_ok=True)
+
+    # Written under a temporary name first, so that readers never see a partially written chunk
+    path = f"{partition_directory}/{time.time_ns()}{CHUNK_FILE_EXTENSION}"
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(MAGIC + struct.pack(HEADER_LENGTH_FORMAT, len(encoded_header)) + encoded_header)
+        for blob in blobs:
+            file.write(blob)
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+def read_chunk_header(path: str) -> dict[str, Any]:
+    """The header of the chunk at <path>, without reading any of its columns."""
+
+    with open(path, "rb") as file:
+        prefix = file.read(len(MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT))
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} isn't a score archive chunk")
+        (header_length,) = struct.unpack_from(HEADER_LENGTH_FORMAT, prefix, len(MAGIC))
+        return json.loads(file.read(header_length))
+
+def read_chunk(path: str, columns: Optional[list[str]] = None) -> dict[str, array.array]:
+    """
+    Reads <columns> (every column if None) of the chunk at <path>. The file is memory-mapped, so only the requested columns' bytes are read.
+    Columns that didn't exist yet when the chunk was written, eg a new currency, are all zeros.
+    """
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        if mapped_file[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} isn't a score archive chunk")
+        header_start = len(MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT)
+        (header_length,) = struct.unpack_from(HEADER_LENGTH_FORMAT, mapped_file, len(MAGIC))
+        header = json.loads(mapped_file[header_start:header_start + header_length])
+        data_start = header_start + header_length
+
+        result: dict[str, array.array] = {}
+        for column in columns if columns is not None else header['columns'].keys():
+            column_info = header['columns'].get(column, None)
+            if column_info is None:
+                result[column] = get_zeros(get_columns().get(column, "q"), header['num_rows'])
+                continue
+
+            start = data_start + column_info['offset']
+            values = array.array(column_info['typecode'])
+            values.frombytes(zlib.decompress(mapped_file[start:start + column_info['length']]))
+            if header['byteorder'] != sys.byteorder:
+                values.byteswap()
+            result[column] = values
+
+    return result
+
+def get_zeros(typecode: str, num_rows: int) -> array.array:
+    return array.array(typecode, bytes(array.array(typecode).itemsize * num_rows))
+
+def list_partitions(start_day: Optional[datetime.date] = None, end_day: Optional[datetime.date] = None, directory: str = SCORE_ARCHIVE_DIRECTORY) -> list[str]:
+    """The days between <start_day> and <end_day> (both inclusive) that have scores, oldest first."""
+
+    if not os.path.isdir(directory):
+        return []
+    days = sorted(os.listdir(directory))
+    if start_day is not None:
+        days = [day for day in days if day >= start_day.isoformat()]
+    if end_day is not None:
+        days = [day for day in days if day <= end_day.isoformat()]
+    return days
+
+def list_chunks(partition_directory: str) -> list[str]:
+    """
+    The partition's chunks, oldest first. The chunks written before its latest compacted chunk are left out, since their rows are in it.
+    They are only still there if compaction stopped before removing them.
+    """
+
+    paths = sorted((f"{partition_directory}/{filename}" for filename in os.listdir(partition_directory) if filename.endswith(CHUNK_FILE_EXTENSION)),
+                   key=get_chunk_sort_key)
+    compacted_paths = [path for path in paths if path.endswith(COMPACTED_CHUNK_FILE_EXTENSION)]
+    if not compacted_paths:
+        return paths
+    return paths[paths.index(compacted_paths[-1]):]
+
+def get_chunk_sort_key(path: str) -> tuple[int, bool]:
+    """Chunks are named after the time_ns() they were written at. A compacted chunk is named after the last chunk it holds, and sorts after it."""
+    return int(os.path.basename(path).split(".", 1)[0]), path.endswith(COMPACTED_CHUNK_FILE_EXTENSION)
+
+def iter_chunks(columns: Optional[list[str]] = None, start_day: Optional[datetime.date] = None, end_day: Optional[datetime.date] = None,
+                directory: str = SCORE_ARCHIVE_DIRECTORY) -> Iterator[dict[str, array.array]]:
+    """
+    Streams the archive one chunk at a time, oldest day first, as column: values. Only one chunk is in memory at a time, however big the archive is.
+    Ask for only the columns that are needed, since the others are then never decompressed.
+    """
+
+    for day in list_partitions(start_day, end_day, directory):
+        for path in list_chunks(get_partition_directory(day, directory)):
+            yield read_chunk(path, columns)
+
+def iter_rows(columns: Optional[list[str]] = None, start_day: Optional[datetime.date] = None, end_day: Optional[datetime.date] = None,
+              directory: str = SCORE_ARCHIVE_DIRECTORY) -> Iterator[dict[str, Any]]:
+    """Same as iter_chunks, but one score at a time. Slower, use iter_chunks for scans over millions of scores."""
+
+    for chunk in iter_chunks(columns, start_day, end_day, directory):
+        names = list(chunk.keys())
+        for values in zip(*chunk.values()):
+            yield dict(zip(names, values))
+
+def compact_old_partitions(directory: str = SCORE_ARCHIVE_DIRECTORY) -> int:
+    """
+    Merges the chunks of every partition that can't be written to anymore into a single chunk, since every flush adds a small chunk.
+    Fewer, bigger chunks compress better and are faster to scan. Returns the number of partitions compacted.
+    """
+
+    last_day_to_compact = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=COMPACTION_AGE)
+    num_compacted = 0
+    for day in list_partitions(end_day=last_day_to_compact, directory=directory):
+        partition_directory = get_partition_directory(day, directory)
+        paths = list_chunks(partition_directory)
+        remove_leftover_files(partition_directory, paths)
+        if len(paths) <= 1:
+            continue
+
+        # The compacted chunk appears in one rename, and from then on list_chunks leaves the old chunks out, so a crash at any point
+        # either leaves the old chunks or the compacted chunk in use, never both
+        write_compacted_chunk(partition_directory, paths)
+        for path in paths:
+            os.remove(path)
+        num_compacted += 1
+
+    return num_compacted
+
+def write_compacted_chunk(partition_directory: str, paths: list[str]):
+    """
+    Writes the rows of the chunks at <paths> as one chunk, named after the last of them. Only one column of one chunk is in memory at a time,
+    since each column is compressed as a stream into a temporary file, which is copied behind the header once every column's length is known.
+    """
+
+    headers = [read_chunk_header(path) for path in paths]
+
+    # Columns that are no longer in the code are kept, since the archive is the only copy of them
+    typecodes = dict(get_columns())
+    for header in headers:
+        for column, column_info in header['columns'].items():
+            typecodes.setdefault(column, column_info['typecode'])
+
+    compacted_header: dict[str, Any] = {'num_rows': sum(header['num_rows'] for header in headers), 'byteorder': sys.byteorder, 'columns': {}}
+    compacted_path = f"{partition_directory}/{get_chunk_sort_key(paths[-1])[0]}{COMPACTED_CHUNK_FILE_EXTENSION}"
+    with tempfile.TemporaryFile(dir=partition_directory) as data_file:
+        offset = 0
+        for column, typecode in typecodes.items():
+            compressor = zlib.compressobj(COMPRESSION_LEVEL)
+            length = 0
+            for path, header in zip(paths, headers):
+                if column in header['columns']:
+                    values = read_chunk(path, [column])[column]
+                    if values.typecode != typecode:
+                        values = array.array(typecode, values)
+                else:
+                    values = get_zeros(typecode, header['num_rows'])
+                length += data_file.write(compressor.compress(values.tobytes()))
+            length += data_file.write(compressor.flush())
+            compacted_header['columns'][column] = {'typecode': typecode, 'offset': offset, 'length': length}
+            offset += length
+
+        encoded_header = json.dumps(compacted_header, separators=(",", ":")).encode()
+        data_file.seek(0)
+        with open(f"{compacted_path}.tmp", "wb") as file:
+            file.write(MAGIC + struct.pack(HEADER_LENGTH_FORMAT, len(encoded_header)) + encoded_header)
+            shutil.copyfileobj(data_file, file)
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(f"{compacted_path}.tmp", compacted_path)
+
+def remove_leftover_files(partition_directory: str, paths: list[str]):
+    """
+    Removes what an interrupted compaction left behind: the chunks written before the partition's latest compacted chunk, which are already in it,
+    and temporary files old enough that nothing can still be writing them. <paths> is the partition's list_chunks.
+    Chunks written since then sort after the compacted chunk, so they're never removed, even if they aren't in <paths>.
+    """
+
+    latest_compacted_key = get_chunk_sort_key(paths[0]) if paths and paths[0].endswith(COMPACTED_CHUNK_FILE_EXTENSION) else None
+    for filename in os.listdir(partition_directory):
+        path = f"{partition_directory}/{filename}"
+        try:
+            if filename.endswith(".tmp"):
+                if time.time() - os.path.getmtime(path) > LEFTOVER_TMP_FILE_AGE:
+                    os.remove(path)
+            elif filename.endswith(CHUNK_FILE_EXTENSION) and latest_compacted_key is not None and get_chunk_sort_key(path) < latest_compacted_key:
+                os.remove(path)
+        except FileNotFoundError:  # Renamed or removed since it was listed
+            continue
+
+score_archive = ScoreArchive()
@@ -0,0 +1,110 @@
+import asyncio
+import datetime
+import json
+import os
+from typing import TYPE_CHECKING, Any, Optional
+
+from classes.metrics import metrics
+from discord.ext import tasks
+
+if TYPE_CHECKING:
+    from classes.currency import CurrencyManager
+    from classes.exp import ExpManager
+    from classes.score import Score
+
+SCORE_TRACE_DIRECTORY = "./data/score_traces"  # One JSON-lines file per user, named after their osu! ID
+TRACE_FLUSH_INTERVAL = 30  # Seconds
+MAX_PENDING_TRACES = 10_000  # Traces waiting to be flushed. Past this, new traces are dropped until the next flush.
+MAX_TRACE_FILE_BYTES = 1_000_000  # Per user. Past this, the oldest half of the user's traces is dropped.
+
+
+class ScoreTraceStore:
+    """
+    Records how every submitted score was rewarded: the score's inputs, each step of the exp and currency calculation, and the outputs.
+    Recording only encodes a line and keeps it in memory. A background task appends the lines to the user's file, off the event loop.
+    Opt-in through SCORE_TRACES_ENABLED, since the managers only fill their debug logs when it is on.
+    """
+
+    pending: dict[int, list[str]]  # osu_id: traces not written yet
+    num_pending: int
+    lock: asyncio.Lock  # Prevents two flushes from appending to the same file at once
+
+    def __init__(self):
+        self.pending = {}
+        self.num_pending = 0
+        self.lock = asyncio.Lock()
+
+    def record(self, score: 'Score', exp_manager: 'ExpManager', currency_manager: 'CurrencyManager', exp_gained: dict[str, int], currency_gained: dict[str, int]):
+        if self.num_pending >= MAX_PENDING_TRACES:
+            metrics.increment("score_traces_dropped_total")
+            return
+
+        trace = {
+            'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            'score_id': score.score_id,
+            'timestamp': score.timestamp.isoformat(),
+            'beatmap_id': score.beatmap.id,
+            'mods': [mod.acronym for mod in score.mods],
+            'is_pass': score.is_pass,
+            'accuracy': score.accuracy,
+            'num_300s': score.num_300s,
+            'num_100s': score.num_100s,
+            'num_misses': score.num_misses,
+            'num_notes': score.beatmap.num_notes,
+            'sr': score.beatmap_attributes.sr,
+            'od': score.beatmap_attributes.od,
+            'drain_time': score.beatmap_attributes.drain_time,
+            'exp_steps': exp_manager.debug_log,
+            'currency_steps': currency_manager.debug_log,
+            'exp_gained': exp_gained,
+            'currency_gained': currency_gained,
+            'total_exp_after': {exp_bar_name: exp_bar.total_exp for exp_bar_name, exp_bar in exp_manager.current_user_exp_bars.items()},
+            'currency_after': currency_manager.current_user_currency,
+        }
+        self.pending.setdefault(score.user_osu_id, []).append(json.dumps(trace, separators=(",", ":")))
+        self.num_pending += 1
+
+    @tasks.loop(seconds=TRACE_FLUSH_INTERVAL)
+    async def regularly_flush(self):
+        await self.flush()
+
+    async def flush(self):
+        """Appends every pending trace to its user's file."""
+
+        async with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.num_pending = 0
+            if pending:
+                await asyncio.to_thread(write_traces, pending)
+
+    async def query(self, osu_id: int, limit: int, beatmap_id: Optional[int] = None) -> list[dict[str, Any]]:
+        """The user's <limit> most recent traces, only on <beatmap_id> if given."""
+
+        await self.flush()
+        lines = await asyncio.to_thread(read_traces, osu_id)
+        traces = [json.loads(line) for line in lines]
+        if beatmap_id is not None:
+            traces = [trace for trace in traces if trace['beatmap_id'] == beatmap_id]
+        return traces[-limit:]
+
+def write_traces(pending: dict[int, list[str]]):
+    os.makedirs(SCORE_TRACE_DIRECTORY, exist_ok=True)
+    for osu_id, lines in pending.items():
+        path = f"{SCORE_TRACE_DIRECTORY}/{osu_id}.jsonl"
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+        if os.path.getsize(path) > MAX_TRACE_FILE_BYTES:
+            all_lines = read_traces(osu_id)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("\n".join(all_lines[len(all_lines) // 2:]) + "\n")
+
+def read_traces(osu_id: int) -> list[str]:
+    path = f"{SCORE_TRACE_DIRECTORY}/{osu_id}.jsonl"
+    if not os.path.isfile(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return file.read().splitlines()
+
+score_trace_store = ScoreTraceStore()
@@ -0,0 +1,337 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import multiprocessing.process
+import os
+from typing import Any, Iterator, Optional
+
+import discord
+from classes.render_cache import render_cache
+from discord.ext import tasks
+
+logger = logging.getLogger(__name__)
+
+SUBMIT_WORKER_SOCKET_PATH = "./data/submit_workers.sock"
+MAX_MESSAGE_SIZE = 1024 * 1024  # Bytes. Messages are single JSON lines, and Discord caps an embed at 6000 characters, so this is never reached.
+WORKER_STOP_TIMEOUT = 30  # Seconds given to the submissions in progress to finish, and then to the workers to exit, before they are terminated
+
+
+class SubmitWorkerError(Exception):
+    pass
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[dict[str, Any]]:
+    """Returns None once the other side has disconnected."""
+
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class WorkerConnection:
+    """The gateway's end of the connection to a worker."""
+
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    pid: int
+    jobs: dict[int, asyncio.Queue[Optional[dict[str, Any]]]]  # job_id: the worker's messages about the job, then None if the worker disconnected
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, pid: int):
+        self.reader = reader
+        self.writer = writer
+        self.pid = pid
+        self.jobs = {}
+
+    async def dispatch_messages(self):
+        """Hands every message from the worker to the job it is about, until the worker disconnects."""
+
+        try:
+            while (message := await read_message(self.reader)) is not None:
+                job_messages = self.jobs.get(message['job_id'], None)
+                if job_messages is not None:
+                    job_messages.put_nowait(message)
+        except (ConnectionError, ValueError) as error:
+            logger.error(f"Lost the connection to submit worker {self.pid}", exc_info=error)
+        finally:
+            for job_messages in self.jobs.values():
+                job_messages.put_nowait(None)
+            self.writer.close()
+
+
+class SubmitWorkerPool:
+    """
+    Runs /submit in worker processes, so that one user's submission (score parsing, reward calculation, building embeds) doesn't hold up
+    everyone else's commands on the gateway's event loop. Enabled by setting SUBMIT_WORKERS.
+
+    Workers connect to the gateway over a Unix socket. Each one runs many submissions at once on its own event loop, like the gateway would,
+    and a new submission goes to the worker with the fewest. Messages are JSON lines, tagged with the submission's job_id:
+    - gateway -> worker: {"type": "submit", ...} with what the submission needs from the interaction
+    - worker -> gateway: {"type": "send" / "edit_original_response", ...} for every Discord message, which the gateway sends for it,
+      then {"type": "done"} or {"type": "error", "error": ...}
+    Workers share the database and caches on disk with the gateway. Their in-memory caches, game data and metrics are their own,
+    so they keep the game data they started with until the bot restarts.
+    """
+
+    num_workers: int
+    socket_path: str
+    processes: list[Optional[multiprocessing.process.BaseProcess]]  # One slot per worker, which is also the worker's index
+    workers: list[WorkerConnection]  # Connected workers
+    worker_connected: asyncio.Event  # Set while at least one worker is connected
+    job_ids: Iterator[int]
+    server: Optional[asyncio.AbstractServer]
+
+    def __init__(self):
+        self.num_workers = 0
+        self.socket_path = SUBMIT_WORKER_SOCKET_PATH
+        self.processes = []
+        self.workers = []
+        self.worker_connected = asyncio.Event()
+        self.job_ids = itertools.count()
+        self.server = None
+
+    def is_running(self) -> bool:
+        return self.server is not None
+
+    async def start(self, num_workers: int, socket_path: str = SUBMIT_WORKER_SOCKET_PATH):
+        self.num_workers = num_workers
+        self.socket_path = os.path.abspath(socket_path)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # Left behind by a crash
+
+        self.server = await asyncio.start_unix_server(self.add_worker, self.socket_path, limit=MAX_MESSAGE_SIZE)
+        self.processes = [None] * num_workers
+        self.replace_dead_workers()
+        self.regularly_replace_dead_workers.start()
+
+    @tasks.loop(seconds=10)
+    async def regularly_replace_dead_workers(self):
+        self.replace_dead_workers()
+
+    def replace_dead_workers(self):
+        # Spawned rather than forked, since a forked worker would inherit the gateway's event loop, connections and Discord client
+        context = multiprocessing.get_context("spawn")
+        for worker_index, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.error(f"Submit worker {worker_index} exited with code {process.exitcode}, starting a new one")
+
+            new_process = context.Process(target=run_worker, args=(self.socket_path, worker_index), name=f"submit-worker-{worker_index}")
+            new_process.start()
+            self.processes[worker_index] = new_process
+
+    async def add_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = await read_message(reader)
+        if hello is None or hello['type'] != "ready":
+            writer.close()
+            return
+
+        worker = WorkerConnection(reader, writer, hello['pid'])
+        self.workers.append(worker)
+        self.worker_connected.set()
+        try:
+            await worker.dispatch_messages()
+        finally:
+            self.workers.remove(worker)
+            if not self.workers:
+                self.worker_connected.clear()
+
+    async def submit(self, interaction: discord.Interaction, osu_id: int, display_each_score: int, number_of_scores_to_submit: int):
+        """Has the least busy worker run the submission, sending the messages it sends back. Returns once the submission is done."""
+
+        await self.worker_connected.wait()
+        worker = min(self.workers, key=lambda worker: len(worker.jobs))
+        job_id = next(self.job_ids)
+        job_messages: asyncio.Queue[Optional[dict[str, Any]]] = asyncio.Queue()
+        worker.jobs[job_id] = job_messages
+        job = {
+            'type': "submit",
+            'job_id': job_id,
+            'discord_id': interaction.user.id,
+            'display_each_score': display_each_score,
+            'number_of_scores_to_submit': number_of_scores_to_submit,
+            'osu_api_access_token': os.getenv('OSU_API_ACCESS_TOKEN'),  # Refreshed by the gateway, after the worker started
+        }
+
+        try:
+            worker.writer.write(encode_message(job))
+            await worker.writer.drain()
+
+            while True:
+                message = await job_messages.get()
+                if message is None:
+                    raise SubmitWorkerError("The submission was interrupted, try again")
+
+                if message['type'] == "send":
+                    embed = discord.Embed.from_dict(message['embed']) if message['embed'] is not None else None
+                    await interaction.followup.send(content=message['content'], embed=embed)  # type: ignore
+
+                elif message['type'] == "edit_original_response":
+                    original_response = await interaction.original_response()
+                    await original_response.edit(content=message['content'])
+
+                elif message['type'] == "done":
+                    break
+
+                elif message['type'] == "error":
+                    raise SubmitWorkerError(message['error'])
+
+        except ConnectionError as error:
+            raise SubmitWorkerError("The submission was interrupted, try again") from error
+
+        finally:
+            del worker.jobs[job_id]
+            render_cache.invalidate(osu_id)  # The worker's writes don't go through this process's render cache
+
+    async def stop(self):
+        """Lets the submissions in progress finish, then has every worker exit. Workers that don't are terminated."""
+
+        if self.server is None:
+            return
+        self.regularly_replace_dead_workers.cancel()
+        self.server.close()
+
+        for _ in range(WORKER_STOP_TIMEOUT):
+            if not any(worker.jobs for worker in self.workers):
+                break
+            await asyncio.sleep(1)
+
+        # Workers exit once their connection is closed
+        for worker in self.workers:
+            worker.writer.close()
+
+        for process in self.processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+        self.server = None
+        self.processes = []
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class RelayedWebhook:
+    """Has the parts of discord.Webhook that /submit uses. Messages are sent to the gateway, which sends them to Discord."""
+
+    job_id: int
+    writer: asyncio.StreamWriter
+
+    def __init__(self, job_id: int, writer: asyncio.StreamWriter):
+        self.job_id = job_id
+        self.writer = writer
+
+    async def send(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None, **kwargs: Any):
+        embed_dict = embed.to_dict() if embed is not None else None
+        self.writer.write(encode_message({'type': "send", 'job_id': self.job_id, 'content': content, 'embed': embed_dict}))
+        await self.writer.drain()
+
+
+class RelayedOriginalResponse:
+    job_id: int
+    writer: asyncio.StreamWriter
+
+    def __init__(self, job_id: int, writer: asyncio.StreamWriter):
+        self.job_id = job_id
+        self.writer = writer
+
+    async def edit(self, content: Optional[str] = None, **kwargs: Any):
+        self.writer.write(encode_message({'type': "edit_original_response", 'job_id': self.job_id, 'content': content}))
+        await self.writer.drain()
+
+
+class RelayedInteraction:
+    """Has the parts of discord.Interaction that /submit uses, after its initial response was sent by the gateway."""
+
+    job_id: int
+    user: discord.Object
+    followup: RelayedWebhook
+    writer: asyncio.StreamWriter
+
+    def __init__(self, job_id: int, discord_id: int, writer: asyncio.StreamWriter):
+        self.job_id = job_id
+        self.user = discord.Object(id=discord_id)
+        self.followup = RelayedWebhook(job_id, writer)
+        self.writer = writer
+
+    async def original_response(self) -> RelayedOriginalResponse:
+        return RelayedOriginalResponse(self.job_id, self.writer)
+
+def run_worker(socket_path: str, worker_index: int):
+    """Entry point of a worker process."""
+    asyncio.run(serve_submissions(socket_path, worker_index))
+
+async def serve_submissions(socket_path: str, worker_index: int):
+    """Runs the submissions the gateway sends until it disconnects."""
+
+    import other.utility  # classes/ has circular imports that only resolve in the order the bot imports them
+    from classes.http_session import http_session
+    from classes.process_pool import process_pool
+    from classes.score_archive import score_archive
+    from classes.score_trace import score_trace_store
+    from cogs.submit import SubmitCog
+    from other.global_constants import SCORE_ARCHIVE_ENABLED, SCORE_TRACES_ENABLED
+    from other.logging_config import LOG_FILE_PATH, setup_logging
+
+    setup_logging(f"{LOG_FILE_PATH}.worker-{worker_index}")  # Every process appending to the same log would break its rotation
+    await http_session.start_http_session()
+    if SCORE_TRACES_ENABLED:
+        score_trace_store.regularly_flush.start()
+    if SCORE_ARCHIVE_ENABLED:
+        score_archive.regularly_flush.start()  # Compaction is left to the gateway, so that two processes never compact the same partition
+
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=MAX_MESSAGE_SIZE)
+    writer.write(encode_message({'type': "ready", 'pid': os.getpid()}))
+    await writer.drain()
+    submit_cog = SubmitCog(bot=None)
+    running_submissions: set[asyncio.Task] = set()
+
+    try:
+        while (job := await read_message(reader)) is not None:
+            if job['osu_api_access_token'] is not None:
+                os.environ['OSU_API_ACCESS_TOKEN'] = job['osu_api_access_token']
+            task = asyncio.create_task(run_submission(submit_cog, job, writer))
+            running_submissions.add(task)
+            task.add_done_callback(running_submissions.discard)
+
+    except ConnectionError:
+        pass
+
+    finally:
+        # The gateway only disconnects once nothing is in progress, or when it is going down anyway
+        for task in running_submissions:
+            task.cancel()
+        await asyncio.gather(*running_submissions, return_exceptions=True)
+        writer.close()
+        await score_trace_store.flush()
+        await score_archive.flush()
+        await http_session.close_http_session()
+        process_pool.shutdown()
+
+async def run_submission(submit_cog: Any, job: dict[str, Any], writer: asyncio.StreamWriter):
+    from discord.app_commands import Choice
+
+    interaction = RelayedInteraction(job['job_id'], job['discord_id'], writer)
+    display_each_score = Choice(name="Yes", value=1) if job['display_each_score'] else Choice(name="No", value=0)
+    try:
+        await submit_cog.submit_scores(interaction, display_each_score, job['number_of_scores_to_submit'])
+    except Exception as error:
+        logger.error(str(error), exc_info=error, extra={'command': "submit", 'user_id': job['discord_id']})
+        writer.write(encode_message({'type': "error", 'job_id': job['job_id'], 'error': str(error)}))
+    else:
+        writer.write(encode_message({'type': "done", 'job_id': job['job_id']}))
+
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass  # The gateway is gone, so there is no one left to tell
+
+submit_worker_pool = SubmitWorkerPool()
@@ -0,0 +1,405 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from typing import Any, Optional
+
+import aiohttp
+from classes.http_session import OSU_WEBSITE_URL, http_session
+from classes.metrics import metrics
+from classes.process_pool import process_pool
+
+logger = logging.getLogger(__name__)
+
+BEATMAP_FILE_CACHE_DIRECTORY = "./data/beatmap_files"
+
+# Maximum difference from the osu! API's star rating that is considered correct, checked with rpg!compare_sr and tests/test_star_rating.py
+STAR_RATING_TOLERANCE = 0.1
+
+# Hit sound bits that turn a hit into a rim (blue) hit
+HIT_SOUND_WHISTLE = 1 << 1
+HIT_SOUND_CLAP = 1 << 3
+
+# Hit object type bits
+HIT_OBJECT_CIRCLE = 1 << 0
+HIT_OBJECT_SLIDER = 1 << 1
+HIT_OBJECT_SPINNER = 1 << 3
+
+# Taiko hit object kinds
+CENTRE = "centre"
+RIM = "rim"
+DRUMROLL = "drumroll"
+SWELL = "swell"
+
+# Constants used by osu!'s slider -> taiko conversion
+OSU_BASE_SCORING_DISTANCE = 100
+LEGACY_TAIKO_VELOCITY_MULTIPLIER = 1.4
+
+# Constants used by osu!'s strain-based taiko difficulty calculation
+STAR_SCALING_FACTOR = 0.04125
+DECAY_WEIGHT = 0.9
+STRAIN_STEP = 400
+DECAY_BASE = 0.30
+TYPE_CHANGE_BONUS = 0.75
+RHYTHM_CHANGE_BONUS = 1.0
+RHYTHM_CHANGE_BASE_THRESHOLD = 0.2
+RHYTHM_CHANGE_BASE = 2.0
+
+
+class TaikoHitObject:
+    """A hit object after it has been converted to taiko. Only hits (centre / rim) count towards the number of notes."""
+
+    __slots__ = ("start_time", "kind", "strain", "time_elapsed", "same_type_since", "last_type_switch_even")
+
+    start_time: float
+    kind: str
+
+    # Used by the difficulty calculation
+    strain: float
+    time_elapsed: float
+    same_type_since: int
+    last_type_switch_even: Optional[bool]  # None means there hasn't been a type switch yet
+
+    def __init__(self, start_time: float, kind: str):
+        self.start_time = start_time
+        self.kind = kind
+        self.strain = 1
+        self.time_elapsed = 0
+        self.same_type_since = 1
+        self.last_type_switch_even = None
+
+    def is_hit(self) -> bool:
+        return self.kind in (CENTRE, RIM)
+
+
+class OsuFile:
+    """The parts of a .osu file that are needed to convert a beatmap to taiko and calculate its difficulty."""
+
+    format_version: int
+    mode: int
+    slider_multiplier: float
+    slider_tick_rate: float
+    timing_points: list[tuple[float, float, bool]]  # (time, beat_length, uninherited)
+    hit_objects: list[list[str]]  # Raw comma separated fields
+
+    def __init__(self, content: str):
+        self.format_version = 14
+        self.mode = 0
+        self.slider_multiplier = 1.4
+        self.slider_tick_rate = 1
+        self.timing_points = []
+        self.hit_objects = []
+        self.__parse(content)
+
+    def __parse(self, content: str):
+        section = ""
+
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+
+            if line.startswith("osu file format v"):
+                self.format_version = int(line.removeprefix("osu file format v"))
+
+            elif line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+
+            elif section == "General" and line.startswith("Mode:"):
+                self.mode = int(line.split(":", 1)[1])
+
+            elif section == "Difficulty" and line.startswith("SliderMultiplier:"):
+                self.slider_multiplier = float(line.split(":", 1)[1])
+
+            elif section == "Difficulty" and line.startswith("SliderTickRate:"):
+                self.slider_tick_rate = float(line.split(":", 1)[1])
+
+            elif section == "TimingPoints":
+                fields = line.split(",")
+                beat_length = float(fields[1])
+                # Old beatmaps omit the uninherited field, in which case negative beat lengths mark inherited points
+                uninherited = fields[6] == "1" if len(fields) > 6 else beat_length > 0
+                self.timing_points.append((float(fields[0]), beat_length, uninherited))
+
+            elif section == "HitObjects":
+                self.hit_objects.append(line.split(","))
+
+        self.timing_points.sort(key=lambda timing_point: timing_point[0])
+
+    def beat_length_at(self, time: float) -> float:
+        """Returns the beat length of the uninherited timing point active at <time>."""
+
+        beat_length = None
+        for point_time, point_beat_length, uninherited in self.timing_points:
+            if not uninherited:
+                continue
+            if beat_length is not None and point_time > time:
+                break
+            beat_length = point_beat_length
+        return beat_length if beat_length is not None else 1000
+
+    def slider_velocity_beat_length_at(self, time: float) -> float:
+        """Returns the (negative) beat length of the inherited timing point active at <time>, or -100 if there is none."""
+
+        slider_velocity_beat_length = -100.0
+        for point_time, point_beat_length, uninherited in self.timing_points:
+            if point_time > time:
+                break
+            # An uninherited timing point resets the slider velocity
+            slider_velocity_beat_length = -100.0 if uninherited else point_beat_length
+        return slider_velocity_beat_length
+
+
+def convert_to_taiko(osu_file: OsuFile) -> list[TaikoHitObject]:
+    """Converts the hit objects of a .osu file to taiko, following the rules of osu!'s taiko beatmap converter."""
+
+    is_taiko_beatmap = osu_file.mode == 1
+    taiko_hit_objects: list[TaikoHitObject] = []
+
+    for fields in osu_file.hit_objects:
+        start_time = float(fields[2])
+        object_type = int(fields[3])
+        hit_sound = int(fields[4])
+
+        if object_type & HIT_OBJECT_CIRCLE:
+            taiko_hit_objects.append(TaikoHitObject(start_time, hit_kind(hit_sound)))
+
+        elif object_type & HIT_OBJECT_SLIDER:
+            taiko_hit_objects.extend(convert_slider(osu_file, fields, start_time, hit_sound, is_taiko_beatmap))
+
+        elif object_type & HIT_OBJECT_SPINNER:
+            taiko_hit_objects.append(TaikoHitObject(start_time, SWELL))
+
+    taiko_hit_objects.sort(key=lambda hit_object: hit_object.start_time)
+    return taiko_hit_objects
+
+
+def hit_kind(hit_sound: int) -> str:
+    if hit_sound & (HIT_SOUND_WHISTLE | HIT_SOUND_CLAP):
+        return RIM
+    return CENTRE
+
+
+def convert_slider(osu_file: OsuFile, fields: list[str], start_time: float, hit_sound: int, is_taiko_beatmap: bool) -> list[TaikoHitObject]:
+    """
+    Converts a slider to either a drumroll, or a stream of hits if the slider is too fast.
+    Do not simplify the arithmetic in here, it mirrors osu! to stay compatible with it.
+    """
+
+    spans = int(fields[6])
+    distance = float(fields[7]) * spans * LEGACY_TAIKO_VELOCITY_MULTIPLIER
+
+    timing_beat_length = osu_file.beat_length_at(start_time)
+    bpm_multiplier = min(max(-osu_file.slider_velocity_beat_length_at(start_time), 10), 10000) / 100
+    beat_length = timing_beat_length * bpm_multiplier
+
+    slider_scoring_point_distance = OSU_BASE_SCORING_DISTANCE * (osu_file.slider_multiplier * LEGACY_TAIKO_VELOCITY_MULTIPLIER) / osu_file.slider_tick_rate
+    taiko_velocity = slider_scoring_point_distance * osu_file.slider_tick_rate
+    taiko_duration = int(distance / taiko_velocity * beat_length)
+
+    # Sliders in taiko beatmaps are always drumrolls
+    if is_taiko_beatmap:
+        return [TaikoHitObject(start_time, DRUMROLL)]
+
+    osu_velocity = taiko_velocity * (1000 / beat_length)
+
+    # osu-stable only uses the slider velocity adjusted beat length for conversion if the beatmap version < 8
+    if osu_file.format_version >= 8:
+        beat_length = timing_beat_length
+
+    tick_spacing = min(beat_length / osu_file.slider_tick_rate, taiko_duration / spans)
+
+    if not (tick_spacing > 0 and distance / osu_velocity * 1000 < 2 * beat_length):
+        return [TaikoHitObject(start_time, DRUMROLL)]
+
+    # Every node (head, repeats, tail) has its own hit sound, which cycles as the slider is split into hits
+    node_hit_sounds = [hit_sound]
+    if len(fields) > 8 and fields[8]:
+        node_hit_sounds = [int(node_hit_sound) for node_hit_sound in fields[8].split("|")]
+
+    hits: list[TaikoHitObject] = []
+    node_index = 0
+    time = start_time
+    while time <= start_time + taiko_duration + tick_spacing / 8:
+        hits.append(TaikoHitObject(time, hit_kind(node_hit_sounds[node_index])))
+        node_index = (node_index + 1) % len(node_hit_sounds)
+        time += tick_spacing
+
+    return hits
+
+
+def calculate_star_rating(taiko_hit_objects: list[TaikoHitObject], clock_rate: float) -> float:
+    """Calculates the star rating using osu!'s strain-based taiko difficulty model."""
+
+    if not taiko_hit_objects:
+        return 0
+
+    for previous, current in zip(taiko_hit_objects, taiko_hit_objects[1:]):
+        calculate_strain(previous, current, clock_rate)
+
+    # Find the highest strain in each strain step
+    actual_strain_step = STRAIN_STEP * clock_rate
+    highest_strains: list[float] = []
+    interval_end_time = actual_strain_step
+    maximum_strain = 0.0
+    previous: Optional[TaikoHitObject] = None
+
+    for hit_object in taiko_hit_objects:
+        while hit_object.start_time > interval_end_time:
+            highest_strains.append(maximum_strain)
+
+            # The strain of the next interval starts at the decayed strain of the last hit object, not at 0
+            if previous is None:
+                maximum_strain = 0
+            else:
+                maximum_strain = previous.strain * math.pow(DECAY_BASE, (interval_end_time - previous.start_time) / 1000)
+
+            interval_end_time += actual_strain_step
+
+        maximum_strain = max(hit_object.strain, maximum_strain)
+        previous = hit_object
+
+    # Weighted sum of the strains, from highest to lowest
+    difficulty = 0.0
+    weight = 1.0
+    for strain in sorted(highest_strains, reverse=True):
+        difficulty += weight * strain
+        weight *= DECAY_WEIGHT
+
+    return difficulty * STAR_SCALING_FACTOR
+
+
+def calculate_strain(previous: TaikoHitObject, current: TaikoHitObject, clock_rate: float):
+    current.time_elapsed = (current.start_time - previous.start_time) / clock_rate
+    decay = math.pow(DECAY_BASE, current.time_elapsed / 1000)
+    addition = 1.0
+
+    # Only hits close to each other get a bonus for colour and rhythm changes
+    if previous.is_hit() and current.is_hit() and current.start_time - previous.start_time < 1000:
+        addition += type_change_addition(previous, current)
+        addition += rhythm_change_addition(previous, current)
+
+    # Scale linearly from 0.4 to 1 for time elapsed from 0 to 50
+    addition_factor = 1.0
+    if current.time_elapsed < 50:
+        addition_factor = 0.4 + 0.6 * current.time_elapsed / 50
+
+    current.strain = previous.strain * decay + addition * addition_factor
+
+
+def type_change_addition(previous: TaikoHitObject, current: TaikoHitObject) -> float:
+    if (previous.kind == RIM) != (current.kind == RIM):
+        current.last_type_switch_even = previous.same_type_since % 2 == 0
+
+        # Only give a bonus if the parity of the type switch changes
+        if previous.last_type_switch_even is not None and previous.last_type_switch_even != current.last_type_switch_even:
+            return TYPE_CHANGE_BONUS
+
+    else:
+        current.last_type_switch_even = previous.last_type_switch_even
+        current.same_type_since = previous.same_type_since + 1
+
+    return 0
+
+
+def rhythm_change_addition(previous: TaikoHitObject, current: TaikoHitObject) -> float:
+    # No bonus for drastic rhythm changes
+    if current.time_elapsed == 0 or previous.time_elapsed == 0:
+        return 0
+
+    time_elapsed_ratio = max(previous.time_elapsed / current.time_elapsed, current.time_elapsed / previous.time_elapsed)
+    if time_elapsed_ratio >= 8:
+        return 0
+
+    difference = math.log(time_elapsed_ratio, RHYTHM_CHANGE_BASE) % 1.0
+    if RHYTHM_CHANGE_BASE_THRESHOLD < difference < 1 - RHYTHM_CHANGE_BASE_THRESHOLD:
+        return RHYTHM_CHANGE_BONUS
+    return 0
+
+
+def calculate_difficulty_attributes(osu_file_path: str, clock_rate: float) -> dict[str, Any]:
+    """
+    Reads a cached .osu file and returns its taiko difficulty attributes.
+    Runs inside the process pool, so this has to stay a picklable module-level function.
+    """
+
+    with open(osu_file_path, "rb") as file:
+        raw_content = file.read()
+
+    osu_file = OsuFile(raw_content.decode("utf-8-sig", errors="replace"))
+    taiko_hit_objects = convert_to_taiko(osu_file)
+
+    return {
+        'star_rating': calculate_star_rating(taiko_hit_objects, clock_rate),
+        'num_notes': sum(1 for hit_object in taiko_hit_objects if hit_object.is_hit()),
+        'num_drumrolls': sum(1 for hit_object in taiko_hit_objects if hit_object.kind == DRUMROLL),
+        'num_swells': sum(1 for hit_object in taiko_hit_objects if hit_object.kind == SWELL),
+        'checksum': hashlib.md5(raw_content).hexdigest(),
+    }
+
+
+class TaikoDifficultyCalculator:
+    """
+    Calculates taiko difficulty attributes locally from cached .osu files. Only used by rpg!compare_sr: the model is osu!'s old strain model,
+    which hasn't been shown to match osu!'s star ratings within STAR_RATING_TOLERANCE (see tests/test_star_rating.py), so rewards use the osu! API's.
+    """
+
+    async def get_difficulty_attributes(self, beatmap_id: int, checksum: Optional[str], clock_rate: float) -> Optional[dict[str, Any]]:
+        """
+        Returns the difficulty attributes of a beatmap, downloading its .osu file first if it isn't cached or is outdated.
+        Returns None if the .osu file can't be obtained, in which case the osu! API should be used instead.
+        """
+
+        osu_file_path = f"{BEATMAP_FILE_CACHE_DIRECTORY}/{beatmap_id}.osu"
+
+        try:
+            if os.path.isfile(osu_file_path):
+                metrics.increment("cache_lookups_total", cache="osu_files", result="disk")
+            else:
+                metrics.increment("cache_lookups_total", cache="osu_files", result="miss")
+                if not await self.__download_osu_file(beatmap_id, osu_file_path):
+                    return None
+
+            attributes = await process_pool.run(calculate_difficulty_attributes, osu_file_path, clock_rate)
+
+            # The beatmap was updated since it was cached
+            if checksum is not None and attributes['checksum'] != checksum:
+                metrics.increment("cache_lookups_total", cache="osu_files", result="outdated")
+                if not await self.__download_osu_file(beatmap_id, osu_file_path):
+                    return None
+                attributes = await process_pool.run(calculate_difficulty_attributes, osu_file_path, clock_rate)
+
+        # Unreachable osu! website, unreadable cache or a malformed .osu file
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, IndexError) as error:
+            logger.warning(f"Couldn't calculate the difficulty of beatmap {beatmap_id} locally: {error!r}")
+            return None
+
+        except Exception as error:
+            logger.error(f"Unexpected error while calculating the difficulty of beatmap {beatmap_id}", exc_info=error)
+            return None
+
+        return attributes
+
+    async def __download_osu_file(self, beatmap_id: int, osu_file_path: str) -> bool:
+        async with http_session.interface.get(f"{OSU_WEBSITE_URL}/osu/{beatmap_id}") as resp:
+            if resp.status != 200:
+                return False
+            content = await resp.read()
+
+        # Unavailable beatmaps return an empty body
+        if not content:
+            return False
+
+        await asyncio.to_thread(self.__write_osu_file, osu_file_path, content)
+        return True
+
+    def __write_osu_file(self, osu_file_path: str, content: bytes):
+        os.makedirs(BEATMAP_FILE_CACHE_DIRECTORY, exist_ok=True)
+
+        # Write to a temporary file first so a half-written file is never read by the process pool
+        with open(f"{osu_file_path}.tmp", "wb") as file:
+            file.write(content)
+        os.replace(f"{osu_file_path}.tmp", osu_file_path)
+
+taiko_difficulty_calculator = TaikoDifficultyCalculator()
\ No newline at end of file
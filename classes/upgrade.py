@@ -1,9 +1,12 @@
+import functools
 import inspect
 from typing import TYPE_CHECKING, Callable, Optional
 
 import aiosqlite
 import discord
 import other.utility
+from classes.metrics import metrics
+from classes.render_cache import render_cache
 
 if TYPE_CHECKING:
     from classes.buff_effect import BuffEffect, BuffEffectType
@@ -52,7 +55,7 @@ class UpgradeManager:
         """Applies an upgrade effect given some upgrade, its level, and the things that it affects."""
         
         # Determine the parameters needed to be passed as a tuple
-        parameters_needed = inspect.getfullargspec(upgrade.effect_impl).args
+        parameters_needed = get_effect_parameters(upgrade.effect_impl)
 
         # Add the necessary parameters as a dict
         parameters_to_be_passed = {}
@@ -86,48 +89,75 @@ class UpgradeManager:
         
         upgrade = self.get_upgrade(upgrade_id)
         assert upgrade is not None
+        osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
+        assert osu_id is not None
         upgrade_levels_purchased = 0
         
         for _ in range(times_to_purchase):
-            user_currency = await other.utility.get_user_currency(discord_id=interaction.user.id)
-            user_upgrade_levels = await other.utility.get_user_upgrade_levels(discord_id=interaction.user.id)
-            
-            current_upgrade_level = user_upgrade_levels[upgrade_id]
-            upgrade_cost = upgrade.cost(user_upgrade_levels[upgrade_id]+1)
-            
-            if current_upgrade_level >= upgrade.max_level:
-                if upgrade_levels_purchased == 0:
-                    await interaction.followup.send(f"You already maxed out {upgrade.name}!")
-                break
-            
-            if not await self.__user_has_enough_currency(upgrade, user_currency, upgrade_cost):
+            purchase_failed_reason = await self.__purchase_next_level(osu_id, upgrade)
+            if purchase_failed_reason:
                 if upgrade_levels_purchased == 0:
-                    await interaction.followup.send(f"You don't have enough currency to purchase {upgrade.name} (Level {current_upgrade_level+1})!")
+                    await interaction.followup.send(purchase_failed_reason)
                 break
-            
-            await self.__update_database_from_purchase(interaction, upgrade_id, upgrade, user_currency, current_upgrade_level, upgrade_cost)
             upgrade_levels_purchased += 1
             
         if upgrade_levels_purchased != 0:
             await interaction.followup.send(f"Purchased {upgrade_levels_purchased} level(s) of {upgrade.name}!")
 
-    async def __update_database_from_purchase(self, interaction: discord.Interaction, upgrade_id: str, upgrade: Upgrade, 
-                                            user_currency: dict[str, int], current_upgrade_level: int, upgrade_cost: int):
-        osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
+    async def __purchase_next_level(self, osu_id: int, upgrade: Upgrade) -> str:
+        """Buys the user's next level of the upgrade. Returns why it can't be bought, or an empty string if it was bought."""
+        
+        # Retried until the purchase goes through or can't be afforded, since a submission or another purchase can change the user's
+        # currency or upgrade level between reading them and buying
+        while True:
+            user_currency = await other.utility.get_user_currency(osu_id=osu_id)
+            user_upgrade_levels = await other.utility.get_user_upgrade_levels(osu_id=osu_id)
+            
+            current_upgrade_level = user_upgrade_levels[upgrade.id]
+            if current_upgrade_level >= upgrade.max_level:
+                return f"You already maxed out {upgrade.name}!"
+            
+            upgrade_cost = upgrade.cost(current_upgrade_level+1)
+            if not await self.__user_has_enough_currency(upgrade, user_currency, upgrade_cost):
+                return f"You don't have enough currency to purchase {upgrade.name} (Level {current_upgrade_level+1})!"
+            
+            if await self.__update_database_from_purchase(osu_id, upgrade, current_upgrade_level, upgrade_cost):
+                return ""
+            metrics.increment("upgrade_purchase_conflicts_total")
+
+    @metrics.timed("database")
+    async def __update_database_from_purchase(self, osu_id: int, upgrade: Upgrade, current_upgrade_level: int, upgrade_cost: int) -> bool:
+        """
+        Deducts the cost and adds a level, as long as the user is still at <current_upgrade_level> and can still afford it.
+        Returns whether the purchase went through. If it didn't, nothing is changed.
+        """
+        
         async with aiosqlite.connect("./data/database.db") as conn:
             # deduct currency
-            new_currency_amount = user_currency[upgrade.cost_currency_unit] - upgrade_cost
-            await conn.execute(F"UPDATE currency SET {upgrade.cost_currency_unit}=? WHERE osu_id=?", (new_currency_amount, osu_id))
+            cursor = await conn.execute(f"UPDATE currency SET {upgrade.cost_currency_unit}={upgrade.cost_currency_unit}-? WHERE osu_id=? AND {upgrade.cost_currency_unit}>=?",
+                                        (upgrade_cost, osu_id, upgrade_cost))
+            if cursor.rowcount == 0:
+                await conn.rollback()
+                return False
                 
             # add level
-            new_level = current_upgrade_level + 1
-            await conn.execute(F"UPDATE upgrades SET {upgrade_id}=? WHERE osu_id=?", (new_level, osu_id))
+            cursor = await conn.execute(f"UPDATE upgrades SET {upgrade.id}={upgrade.id}+1 WHERE osu_id=? AND {upgrade.id}=?", (osu_id, current_upgrade_level))
+            if cursor.rowcount == 0:
+                await conn.rollback()
+                return False
                 
             await conn.commit()
+        render_cache.invalidate(osu_id)
+        return True
         
     async def __user_has_enough_currency(self, upgrade: Upgrade, user_currency: dict[str, int], upgrade_cost: int):
         if upgrade_cost > user_currency[upgrade.cost_currency_unit]:
             return False
         return True
 
+@functools.cache
+def get_effect_parameters(effect_impl: Callable[..., None]) -> list[str]:
+    """The parameter names of an upgrade's effect. Cached, since effects are applied several times for every score and inspecting them is slow."""
+    return inspect.getfullargspec(effect_impl).args
+
 upgrade_manager = UpgradeManager()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import contextlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import AsyncIterator
+
+import aiosqlite
+from classes.metrics import metrics
+from discord.ext import tasks
+
+logger = logging.getLogger(__name__)
+
+LEASE_DURATION = 60  # Seconds. A lease that isn't renewed in time, eg because its process died, can be taken by anyone.
+LEASE_RENEWAL_INTERVAL = 15  # Seconds. Well below LEASE_DURATION, so that a few slow renewals don't lose a lease.
+
+
+class UserLockManager:
+    """
+    Per-user locks shared by every process using the database, eg a second bot process or the submit workers.
+    A lock is a lease in the user_locks table: its owner, and when it expires unless renewed. Leases held by this process
+    are renewed in the background, so a lock is held for as long as it's needed, but never outlives its process for long.
+    /submit holds the user's lock for its whole run, so the same scores are never submitted twice at once.
+    """
+
+    owner_id: str  # Unique to this process, including across restarts that reuse its pid
+    held: set[int]  # Discord IDs of the users whose lock this process holds
+
+    def __init__(self):
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = set()
+
+    @metrics.timed("database")
+    async def acquire(self, discord_id: int) -> bool:
+        """Takes the user's lock if it's free or its lease expired. Returns whether it was taken, without waiting for it."""
+
+        now = time.time()
+        async with aiosqlite.connect("./data/database.db") as conn:
+            # The conflict clause only takes over expired leases, so the lock is checked and taken in one statement
+            cursor = await conn.execute("""
+                INSERT INTO user_locks (discord_id, owner_id, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (discord_id) DO UPDATE SET owner_id=excluded.owner_id, expires_at=excluded.expires_at WHERE user_locks.expires_at <= ?
+                """, (discord_id, self.owner_id, now + LEASE_DURATION, now))
+            await conn.commit()
+            acquired = cursor.rowcount == 1
+
+        metrics.increment("user_lock_acquisitions_total", result="acquired" if acquired else "contended")
+        if acquired:
+            self.held.add(discord_id)
+        return acquired
+
+    @metrics.timed("database")
+    async def release(self, discord_id: int):
+        """Releases the user's lock, if this process holds it."""
+
+        self.held.discard(discord_id)
+        async with aiosqlite.connect("./data/database.db") as conn:
+            await conn.execute("DELETE FROM user_locks WHERE discord_id=? AND owner_id=?", (discord_id, self.owner_id))
+            await conn.commit()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, discord_id: int) -> AsyncIterator[bool]:
+        """Holds the user's lock for the duration of the block, if it could be taken. Yields whether it was."""
+
+        acquired = await self.acquire(discord_id)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await self.release(discord_id)
+
+    @tasks.loop(seconds=LEASE_RENEWAL_INTERVAL)
+    async def regularly_renew_leases(self):
+        await self.renew_leases()
+
+    @metrics.timed("database")
+    async def renew_leases(self):
+        """Pushes back the expiry of every lease this process holds."""
+
+        if not self.held:
+            return
+
+        held = list(self.held)
+        async with aiosqlite.connect("./data/database.db") as conn:
+            cursor = await conn.execute(f"UPDATE user_locks SET expires_at=? WHERE owner_id=? AND discord_id IN ({','.join('?' * len(held))}) RETURNING discord_id",
+                                        (time.time() + LEASE_DURATION, self.owner_id, *held))
+            renewed = {discord_id for discord_id, in await cursor.fetchall()}
+            await conn.commit()
+
+        # Only happens if renewals stopped for longer than LEASE_DURATION, eg while the event loop was blocked. Locks released meanwhile don't count.
+        lost = self.held.intersection(held) - renewed
+        if lost:
+            self.held -= lost
+            logger.warning(f"Lost the lock lease of {len(lost)} user(s) before it was released")
+
+user_lock_manager = UserLockManager()
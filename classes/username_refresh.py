@@ -0,0 +1,99 @@
+import logging
+import os
+from typing import Optional
+
+import aiosqlite
+from classes.http_session import OSU_WEBSITE_URL, http_session
+from classes.metrics import metrics
+from classes.prefix_index import username_index
+from discord.ext import tasks
+from other.global_constants import *
+
+logger = logging.getLogger(__name__)
+
+USERNAME_REFRESH_INTERVAL = 1  # Hours
+USERS_PER_LOOKUP = 50  # The most users the osu! API returns from one /users request
+
+
+class UsernameRefresher:
+    """
+    Keeps usernames up to date without waiting for /update_osu_username. Every run looks up the next users after where the previous run stopped,
+    USERS_PER_LOOKUP at a time and at most USERNAME_REFRESH_API_BUDGET lookups per run, wrapping around once every user was looked up.
+    Only the usernames that changed are written.
+    """
+
+    last_osu_id: int  # Where the next run starts from. Starts over from the lowest osu! ID on restart.
+
+    def __init__(self):
+        self.last_osu_id = 0
+
+    @tasks.loop(hours=USERNAME_REFRESH_INTERVAL)
+    async def regularly_refresh_usernames(self):
+        await self.refresh_usernames(USERNAME_REFRESH_API_BUDGET)
+
+    async def refresh_usernames(self, api_budget: int) -> int:
+        """Looks up to <api_budget> batches of users. Returns the number of usernames changed."""
+
+        num_changed = 0
+        num_lookups = 0
+        while num_lookups < api_budget:
+            osu_ids_and_usernames = await self.__get_next_users()
+            if not osu_ids_and_usernames:
+                # Every user was looked up, so the next batch starts over. Only within the same run if this run hasn't looked up anyone yet.
+                already_at_start = self.last_osu_id == 0
+                self.last_osu_id = 0
+                if num_lookups or already_at_start:
+                    break
+                continue
+
+            num_lookups += 1
+            usernames_on_osu = await self.__look_up_usernames([osu_id for osu_id, _ in osu_ids_and_usernames])
+            if usernames_on_osu is None:
+                break  # Rate limited or unavailable. The batch is retried by the next run.
+
+            self.last_osu_id = osu_ids_and_usernames[-1][0]
+            changed_usernames = [(usernames_on_osu[osu_id], osu_id) for osu_id, osu_username in osu_ids_and_usernames
+                                 if osu_id in usernames_on_osu and usernames_on_osu[osu_id] != osu_username]
+            if changed_usernames:
+                await self.__update_usernames(changed_usernames)
+                num_changed += len(changed_usernames)
+
+        metrics.increment("usernames_refreshed_total", amount=num_changed)
+        if num_changed:
+            logger.info(f"Refreshed {num_changed} username(s)")
+        return num_changed
+
+    @metrics.timed("database")
+    async def __get_next_users(self) -> list[tuple[int, str]]:
+        async with aiosqlite.connect("./data/database.db") as conn:
+            cursor = await conn.execute("SELECT osu_id, osu_username FROM exp_table WHERE osu_id>? ORDER BY osu_id LIMIT ?", (self.last_osu_id, USERS_PER_LOOKUP))
+            return list(await cursor.fetchall())  # type: ignore
+
+    async def __look_up_usernames(self, osu_ids: list[int]) -> Optional[dict[int, str]]:
+        """Returns osu_id: username, without the users that don't exist anymore or are restricted. Returns None if the lookup failed."""
+
+        headers = {
+            'Accept': "application/json",
+            'Content-Type': "application/json",
+            'Authorization': f"Bearer {os.getenv('OSU_API_ACCESS_TOKEN')}",
+        }
+
+        url = f"{OSU_WEBSITE_URL}/api/v2/users"
+        async with http_session.interface.get(url, headers=headers, params=[('ids[]', osu_id) for osu_id in osu_ids]) as resp:
+            if resp.status != 200:
+                logger.warning(f"Username lookup failed with status {resp.status}")
+                return None
+            users = (await resp.json())['users']
+        return {user['id']: user['username'] for user in users}
+
+    @metrics.timed("database")
+    async def __update_usernames(self, changed_usernames: list[tuple[str, int]]):
+        """<changed_usernames> is a list of (new username, osu_id)."""
+
+        async with aiosqlite.connect("./data/database.db") as conn:
+            await conn.executemany("UPDATE exp_table SET osu_username=? WHERE osu_id=?", changed_usernames)
+            await conn.commit()
+        for osu_username, osu_id in changed_usernames:
+            username_index.set_username(osu_id, osu_username)
+
+username_refresher = UsernameRefresher()
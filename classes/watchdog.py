@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from classes.metrics import metrics
+
+HEARTBEAT_INTERVAL = 0.05  # Seconds
+STALL_THRESHOLD = float(os.getenv('STALL_THRESHOLD', "0.25"))  # Seconds the event loop can go without running the heartbeat before it counts as stalled
+
+# Frames from files in here are the bot's own code, which is where a blocking call has to be fixed
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+
+class Stall:
+    """Every stall that was caught at the same call site."""
+
+    __slots__ = ("call_site", "blocked_in", "count", "total_seconds", "max_seconds", "stack")
+
+    call_site: str  # Innermost frame of the bot's own code, eg "other/utility.py:63 in regularly_backup_database"
+    blocked_in: str  # Innermost frame, eg the library function that was blocking
+    count: int
+    total_seconds: float
+    max_seconds: float
+    stack: list[str]  # Of the longest stall
+
+    def __init__(self, call_site: str, blocked_in: str, stack: list[str]):
+        self.call_site = call_site
+        self.blocked_in = blocked_in
+        self.count = 0
+        self.total_seconds = 0
+        self.max_seconds = 0
+        self.stack = stack
+
+
+class EventLoopWatchdog:
+    """
+    Catches calls that block the event loop. The loop updates a heartbeat every HEARTBEAT_INTERVAL, and a separate thread checks it.
+    When the heartbeat is more than STALL_THRESHOLD late, the thread captures the main thread's stack, which is stuck in the blocking call.
+    Stalls are aggregated by call site, shown by rpg!stalls and counted in event_loop_stalls_total.
+    """
+
+    stalls: dict[str, Stall]  # call_site: stall
+    lock: threading.Lock  # Guards stalls, which both threads use
+    last_heartbeat: float
+    loop: Optional[asyncio.AbstractEventLoop]
+    thread: Optional[threading.Thread]
+    stop_event: threading.Event
+
+    def __init__(self):
+        self.stalls = {}
+        self.lock = threading.Lock()
+        self.last_heartbeat = time.monotonic()
+        self.loop = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Has to be called from the event loop's thread."""
+
+        if self.thread is not None:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.__heartbeat()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__watch, args=(threading.get_ident(),), name="event-loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread = None
+
+    def get_stalls(self) -> list[Stall]:
+        """Every call site that stalled the event loop, the one that stalled it for the longest in total first."""
+
+        with self.lock:
+            return sorted(self.stalls.values(), key=lambda stall: stall.total_seconds, reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.stalls = {}
+
+    def __heartbeat(self):
+        self.last_heartbeat = time.monotonic()
+        if not self.stop_event.is_set():
+            self.loop.call_later(HEARTBEAT_INTERVAL, self.__heartbeat)  # type: ignore
+
+    def __watch(self, main_thread_id: int):
+        stalled_heartbeat: Optional[float] = None  # Heartbeat the current stall started after
+        stack: list[traceback.FrameSummary] = []
+
+        while not self.stop_event.wait(HEARTBEAT_INTERVAL):
+            last_heartbeat = self.last_heartbeat
+
+            # The stall is over once the heartbeat runs again
+            if stalled_heartbeat is not None and last_heartbeat != stalled_heartbeat:
+                self.__record_stall(stack, last_heartbeat - stalled_heartbeat - HEARTBEAT_INTERVAL)
+                stalled_heartbeat = None
+
+            if stalled_heartbeat is None and time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL + STALL_THRESHOLD:
+                frame = sys._current_frames().get(main_thread_id, None)
+                if frame is not None:
+                    stalled_heartbeat = last_heartbeat
+                    stack = traceback.extract_stack(frame)
+
+    def __record_stall(self, stack: list[traceback.FrameSummary], seconds: float):
+        call_site = format_frame(find_call_site(stack))
+        with self.lock:
+            stall = self.stalls.get(call_site, None)
+            is_new_call_site = stall is None
+            if stall is None:
+                stall = self.stalls[call_site] = Stall(call_site, format_frame(stack[-1]), traceback.format_list(stack))
+
+            stall.count += 1
+            stall.total_seconds += seconds
+            if seconds > stall.max_seconds:
+                stall.max_seconds = seconds
+                stall.stack = traceback.format_list(stack)
+
+        # New blocking calls are written to the log as soon as they are caught
+        if is_new_call_site:
+            logger.warning("Event loop blocked at a new call site", extra={'call_site': call_site, 'duration': round(seconds, 3), 'stack': "".join(stall.stack)})
+
+        # Metrics aren't thread-safe, so they are updated from the event loop
+        self.loop.call_soon_threadsafe(self.__record_metrics, call_site, seconds)  # type: ignore
+
+    def __record_metrics(self, call_site: str, seconds: float):
+        metrics.increment("event_loop_stalls_total", call_site=call_site)
+        metrics.histogram("event_loop_stall_seconds").observe(seconds)
+
+def find_call_site(stack: list[traceback.FrameSummary]) -> traceback.FrameSummary:
+    """The innermost frame of the bot's own code, or the innermost frame if the whole stack is in libraries."""
+
+    for frame_summary in reversed(stack):
+        if frame_summary.filename.startswith(PROJECT_DIRECTORY) and os.sep + "site-packages" + os.sep not in frame_summary.filename:
+            return frame_summary
+    return stack[-1]
+
+def format_frame(frame_summary: traceback.FrameSummary) -> str:
+    filename = os.path.relpath(frame_summary.filename, PROJECT_DIRECTORY) if frame_summary.filename.startswith(PROJECT_DIRECTORY) else frame_summary.filename
+    return f"{filename}:{frame_summary.lineno} in {frame_summary.name}"
+
+event_loop_watchdog = EventLoopWatchdog()
@@ -1,11 +1,30 @@
 import asyncio
+import io
+import json
+import pstats
+from typing import Optional
 
 import other.utility
+from classes.game_data import reload_game_data
 from classes.http_session import http_session
+from classes.message_dispatcher import message_dispatcher
+from classes.metrics import metrics
+from classes.mod import mod_to_int
 from classes.pagination import PaginationView
+from classes.process_pool import process_pool
+from classes.profiler import ProfilerError, allocation_tracker, profiler
+from classes.score_archive import score_archive
+from classes.score_trace import score_trace_store
+from classes.submit_workers import submit_worker_pool
+from classes.taiko_difficulty import STAR_RATING_TOLERANCE, taiko_difficulty_calculator
+from classes.watchdog import STALL_THRESHOLD, event_loop_watchdog
 from discord.ext import commands
 from other.global_constants import *
 
+MAX_MESSAGE_LENGTH = 2000
+MAX_PROFILE_SECONDS = 300
+TRACEMALLOC_KEY_TYPES = ["lineno", "filename", "traceback"]
+
 
 class AdminCog(commands.Cog):
     def __init__(self, bot):
@@ -31,6 +50,12 @@ class AdminCog(commands.Cog):
             await asyncio.sleep(seconds_to_wait_before_shutdown)  # type: ignore
         
         await other.utility.send_in_all_channels("Shutting down...")
+        await score_trace_store.flush()
+        await score_archive.flush()
+        await submit_worker_pool.stop()
+        process_pool.shutdown()
+        await metrics.stop_server()
+        event_loop_watchdog.stop()
         await http_session.close_http_session()
         await bot.close()
     
@@ -56,6 +81,12 @@ class AdminCog(commands.Cog):
         else:
             cog_list.append(cog_name)
         
+        # Game data first, so that the reloaded cogs are built against the new one
+        try:
+            reload_game_data()
+        except Exception as error:
+            await ctx.channel.send(f"Failed to reload game data, keeping the current one: {error}")
+        
         # Reload each cog in cog_list
         for cog in cog_list:
             message = await ctx.channel.send(f"Reloading {cog}.py")
@@ -66,14 +97,182 @@ class AdminCog(commands.Cog):
                 await message.edit(content=f"Failed to reload {cog}.py: {error}")
             else:
                 await message.edit(content=f"{cog}.py successfully reloaded.")
+        
+        # The reloaded cogs' message triggers are new objects, which the dispatcher has to be rebuilt with
+        message_dispatcher.build(bot.cogs.values())
     
     @commands.command()
     @commands.is_owner()
     async def sync(self, ctx: commands.Context):
-        """Sync all slash commands to discord."""
+        """Sync all slash commands to discord, even if they haven't changed since the last sync."""
+        
+        num_synced = await other.utility.sync_command_tree(force=True)
+        await ctx.channel.send(f"Synced {num_synced} commands.")
+        
+    @commands.command()
+    @commands.is_owner()
+    async def compare_sr(self, ctx: commands.Context, beatmap_id: int, *mod_acronyms: str):
+        """
+        Compares the locally calculated star rating of a beatmap against the osu! API.
+        Mods are passed as separate acronyms, eg rpg!compare_sr 123456 HD DT
+        """
+        
+        mods = 0
+        for mod_acronym in mod_acronyms:
+            mods += mod_to_int(mod_acronym.upper()) or 0
+        
+        clock_rate = 1.0
+        if any(mod_acronym.upper() in ["DT", "NC"] for mod_acronym in mod_acronyms):
+            clock_rate = 1.5
+        elif any(mod_acronym.upper() in ["HT", "DC"] for mod_acronym in mod_acronyms):
+            clock_rate = 0.75
+        
+        local_attributes = await taiko_difficulty_calculator.get_difficulty_attributes(beatmap_id, None, clock_rate)
+        api_attributes = await other.utility.get_beatmap_attributes_from_api(beatmap_id, mods)
+        
+        if local_attributes is None:
+            await ctx.send(f"Couldn't calculate the star rating locally. API: {api_attributes['star_rating']:.2f}*")
+            return
+        
+        difference = local_attributes['star_rating'] - api_attributes['star_rating']
+        within_tolerance = "within" if abs(difference) <= STAR_RATING_TOLERANCE else "**outside**"
+        await ctx.send(f"Local: {local_attributes['star_rating']:.2f}* ({local_attributes['num_notes']} notes) | API: {api_attributes['star_rating']:.2f}* | Difference: {difference:+.2f} ({within_tolerance} tolerance)")
+    
+    @commands.command()
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context, name_filter: str = ""):
+        """
+        Shows latency percentiles, counters and gauges collected since startup (see classes/metrics.py).
+        Only metrics whose name or labels contain <name_filter> are shown, eg rpg!stats command_latency
+        """
         
-        synced = await bot.tree.sync()
-        await ctx.channel.send(f"Synced {len(synced)} commands.")
+        lines = metrics.render_summary(name_filter)
+        if not lines:
+            await ctx.send("No metrics recorded yet.")
+            return
+        await self.send_in_code_blocks(ctx, lines)
+    
+    @commands.command()
+    @commands.is_owner()
+    async def stalls(self, ctx: commands.Context, action: str = "show"):
+        """
+        Shows the call sites that blocked the event loop for longer than the watchdog's threshold, the worst first (see classes/watchdog.py).
+        "clear" forgets them, eg after a fix has been deployed.
+        """
+        
+        if action == "clear":
+            event_loop_watchdog.clear()
+            await ctx.send("Stalls cleared.")
+            return
+        
+        stalls = event_loop_watchdog.get_stalls()
+        if not stalls:
+            await ctx.send(f"The event loop hasn't been blocked for more than {STALL_THRESHOLD}s.")
+            return
+        
+        lines = []
+        for stall in stalls:
+            lines.append(f"{stall.call_site}: {stall.count}x, {stall.total_seconds:.2f}s total, {stall.max_seconds:.2f}s max, blocked in {stall.blocked_in}")
+        await self.send_in_code_blocks(ctx, lines)
         
+        # Stack of the worst stall, since the call site alone doesn't always explain how it was reached
+        await ctx.send(file=discord.File(io.BytesIO("".join(stalls[0].stack).encode()), filename="worst_stall.txt"))
+    
+    @commands.command()
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context, seconds: float = 30, mode: str = "sample", sort_key: str = "cumulative"):
+        """
+        Profiles the live bot for <seconds> and sends the report as a file.
+        <mode> is "sample" (stack sampling, cheap enough for production) or "cprofile" (every call, sorted by <sort_key>, slows the bot down).
+        """
+        
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            await ctx.send(f"Profile for 1 - {MAX_PROFILE_SECONDS} seconds!")
+            return
+        if mode not in ["sample", "cprofile"]:
+            await ctx.send("Mode should be `sample` or `cprofile`!")
+            return
+        if sort_key not in pstats.Stats.sort_arg_dict_default:
+            await ctx.send(f"Sort key should be one of {', '.join(pstats.Stats.sort_arg_dict_default)}!")
+            return
+        
+        message = await ctx.send(f"Profiling ({mode}) for {seconds:g} seconds...")
+        try:
+            if mode == "cprofile":
+                report = await profiler.profile(seconds, sort_key)
+            else:
+                report = await profiler.sample(seconds)
+        except ProfilerError as error:
+            await message.edit(content=str(error))
+            return
+        
+        await ctx.send(file=discord.File(io.BytesIO(report.encode()), filename=f"profile_{mode}.txt"))
+    
+    @commands.command()
+    @commands.is_owner()
+    async def memory(self, ctx: commands.Context, action: str = "snapshot", key_type: str = "lineno"):
+        """
+        Traces memory allocations with tracemalloc.
+        "start" begins tracing, "snapshot" sends the allocations that grew the most since the last snapshot and since the start,
+        grouped by <key_type> (lineno, filename or traceback), and "stop" ends tracing, which slows down every allocation while it is on.
+        """
+        
+        if action == "start":
+            allocation_tracker.start()
+            await ctx.send("Allocation tracking started. Use `rpg!memory snapshot` to see what grew since.")
+        
+        elif action == "snapshot":
+            if key_type not in TRACEMALLOC_KEY_TYPES:
+                await ctx.send(f"Key type should be one of {', '.join(TRACEMALLOC_KEY_TYPES)}!")
+                return
+            try:
+                report = allocation_tracker.snapshot(key_type)
+            except ProfilerError as error:
+                await ctx.send(str(error))
+                return
+            await ctx.send(file=discord.File(io.BytesIO(report.encode()), filename="memory.txt"))
+        
+        elif action == "stop":
+            allocation_tracker.stop()
+            await ctx.send("Allocation tracking stopped.")
+        
+        else:
+            await ctx.send("Action should be `start`, `snapshot` or `stop`!")
+    
+    @commands.command()
+    @commands.is_owner()
+    async def traces(self, ctx: commands.Context, osu_user: str, count: int = 10, beatmap_id: Optional[int] = None):
+        """
+        Sends how a user's most recent <count> scores were rewarded, only on <beatmap_id> if given.
+        <osu_user> is an osu! username or ID. Scores are only traced while SCORE_TRACES_ENABLED is on.
+        """
+        
+        if not SCORE_TRACES_ENABLED:
+            await ctx.send("Score traces are disabled. Set SCORE_TRACES_ENABLED=1 to record them.")
+            return
+        
+        osu_id = int(osu_user) if osu_user.isdigit() else await other.utility.get_osu_id(osu_username=osu_user)
+        if osu_id is None:
+            await ctx.send("Player not found!")
+            return
+        
+        traces = await score_trace_store.query(osu_id, count, beatmap_id)
+        if not traces:
+            await ctx.send("No traces found!")
+            return
+        
+        await ctx.send(f"{len(traces)} trace(s), oldest first.", file=discord.File(io.BytesIO(json.dumps(traces, indent=2).encode()), filename=f"traces_{osu_id}.json"))
+    
+    async def send_in_code_blocks(self, ctx: commands.Context, lines: list[str]):
+        """Sends <lines> in as few code blocks as fit in Discord's message length limit."""
+        
+        message = ""
+        for line in lines:
+            if len(message) + len(line) + 1 > MAX_MESSAGE_LENGTH - len("```\n```"):
+                await ctx.send(f"```\n{message}```")
+                message = ""
+            message += line + "\n"
+        await ctx.send(f"```\n{message}```")
+    
 async def setup(bot: commands.Bot):
     await bot.add_cog(AdminCog(bot))
\ No newline at end of file
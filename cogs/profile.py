@@ -3,9 +3,11 @@ from typing import Optional
 import discord
 import other.utility
 from classes.exp import ExpBar
+from classes.game_data import get_game_data
+from classes.prefix_index import username_index
+from classes.render_cache import EmbedField, add_fields_to_embed, render_cache
 from discord import app_commands
 from discord.ext import commands
-from init.currency_init import init_currency
 from other.global_constants import *
 
 
@@ -14,7 +16,7 @@ class ProfileCog(commands.Cog):
         self.bot = bot
     
     @app_commands.command(name="profile", description="Display all of a user's exp information")
-    @app_commands.describe(osu_username="The player that you want to see the profile of (case sensitive). Leave blank to see your own.")
+    @app_commands.describe(osu_username="The player that you want to see the profile of. Leave blank to see your own.")
     @other.utility.is_verified()
     async def profile(self, interaction: discord.Interaction, osu_username: Optional[str] = None):
         
@@ -22,27 +24,36 @@ class ProfileCog(commands.Cog):
         if osu_username is None:
             osu_username = await other.utility.get_osu_username(discord_id=interaction.user.id)
         
-        # Check if the user is in the database
-        if not await other.utility.user_is_in_database(osu_username=osu_username):
+        # Check if the user is in the database. osu_id is needed to search data in the currency table.
+        osu_id = await other.utility.get_osu_id(osu_username=osu_username)
+        if osu_id is None:
             await interaction.response.send_message("Player not found!")
             return
         
-        # osu_id is needed to search data in the currency table
-        osu_id = await other.utility.get_osu_id(osu_username=osu_username)
-        assert osu_id is not None
+        # Shown the way it's written on osu!, rather than how it was typed
+        osu_username = await other.utility.get_osu_username(osu_id=osu_id)
         
-        user_currency = await other.utility.get_user_currency(osu_id=osu_id)
-        user_exp_bars = await other.utility.get_user_exp_bars(osu_username=osu_username)
+        fields = await render_cache.get_fields("profile", osu_id, lambda: self.render_profile_fields(osu_id))
         embed = discord.Embed(title=f"{osu_username}'s Profile", colour=discord.Colour.blurple())
-        
-        self.populate_profile_embed(user_currency, user_exp_bars, embed)
+        add_fields_to_embed(embed, fields)
         
         await interaction.response.send_message(embed=embed)
 
-    def populate_profile_embed(self, user_currency: dict[str, int], user_exp_bars: dict[str, ExpBar], embed: discord.Embed):
+    @profile.autocomplete("osu_username")
+    async def osu_username_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=osu_username, value=osu_username) for osu_username in await username_index.search(current)]
+
+    async def render_profile_fields(self, osu_id: int) -> list[EmbedField]:
+        user_currency = await other.utility.get_user_currency(osu_id=osu_id)
+        user_exp_bars = await other.utility.get_user_exp_bars(osu_id=osu_id)
+        return self.create_profile_fields(user_currency, user_exp_bars)
+
+    def create_profile_fields(self, user_currency: dict[str, int], user_exp_bars: dict[str, ExpBar]) -> list[EmbedField]:
+        fields: list[EmbedField] = []
+        
+        currency_emojis = get_game_data().currency_emojis
         for currency_id, currency_amount in user_currency.items():
-            all_currencies = init_currency()
-            embed.add_field(name='', value=f"{currency_amount} {all_currencies[currency_id].animated_discord_emoji}", inline=False)
+            fields.append(('', f"{currency_amount} {currency_emojis[currency_id]}", False))
         
         for exp_bar_name, exp_bar in user_exp_bars.items():
             # Add exp information for that mod to the embed
@@ -52,9 +63,11 @@ class ProfileCog(commands.Cog):
             
             # We want the overall exp to be in its own separate line
             if exp_bar_name == "Overall":
-                embed.add_field(name=name_info, value=value_info, inline=False)
+                fields.append((name_info, value_info, False))
             else:
-                embed.add_field(name=name_info, value=value_info)
+                fields.append((name_info, value_info, True))
+        
+        return fields
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ProfileCog(bot))
\ No newline at end of file
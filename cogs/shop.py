@@ -1,11 +1,10 @@
-import inspect
-
 import discord
 import other.utility
+from classes.game_data import get_game_data
+from classes.render_cache import EmbedField, add_fields_to_embed, render_cache
 from classes.upgrade import upgrade_manager
 from discord import app_commands
 from discord.ext import commands
-from init.currency_init import init_currency
 from other.global_constants import *
 
 
@@ -20,45 +19,31 @@ class ShopCog(commands.Cog):
         await interaction.response.send_message(embed=embed)
 
     async def create_shop_embed(self, interaction: discord.Interaction):
-        user_currency = await other.utility.get_user_currency(discord_id=interaction.user.id)
-        user_upgrade_levels = await other.utility.get_user_upgrade_levels(discord_id=interaction.user.id)
+        osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
+        assert osu_id is not None
         
+        # Browsing the shop again without buying anything in between reuses the last render
+        fields = await render_cache.get_fields("shop", osu_id, lambda: self.render_shop_fields(osu_id))
         embed = discord.Embed(title="Shop")
-        embed.add_field(name="Purse:", value=other.utility.create_str_of_user_currency(user_currency), inline=False)
-        self.populate_shop_embed_with_upgrades(user_upgrade_levels, embed)
+        add_fields_to_embed(embed, fields)
         return embed
 
-    def populate_shop_embed_with_upgrades(self, user_upgrade_levels: dict[str, int], embed: discord.Embed):
-        for upgrade_id, upgrade in upgrade_manager.upgrades.items():
-            upgrade_name = upgrade.name
-            current_upgrade_level = user_upgrade_levels[upgrade_id]
-            max_level = upgrade.max_level
-            next_upgrade_level_cost = upgrade.cost(current_upgrade_level+1)
-            all_currencies = init_currency()
-            currency_emoji = all_currencies[upgrade.cost_currency_unit].animated_discord_emoji
-            upgrade_description = upgrade.description
-            
-            if current_upgrade_level >= max_level:
-                text = f"""
-                        **{upgrade_name} [Level {current_upgrade_level}/{max_level}]**
-                        {upgrade_description}\n
-                        """
-                
-            else:
-                text = f"""
-                        **{upgrade_name} [Level {current_upgrade_level}/{max_level}]** - {next_upgrade_level_cost} {currency_emoji}
-                        {upgrade_description}
-                        (Purchase with `/buy {upgrade_id}`)
-                        """
-
-            text = inspect.cleandoc(text)
-            embed.add_field(name='', value=text, inline=False)
+    async def render_shop_fields(self, osu_id: int) -> list[EmbedField]:
+        user_currency = await other.utility.get_user_currency(osu_id=osu_id)
+        user_upgrade_levels = await other.utility.get_user_upgrade_levels(osu_id=osu_id)
+        
+        fields: list[EmbedField] = [("Purse:", other.utility.create_str_of_user_currency(user_currency), False)]
+        
+        # Everything but the levels and costs is rendered once, when the game data is built
+        for upgrade_id, upgrade_listing in get_game_data().upgrade_listings.items():
+            fields.append(('', upgrade_listing.render(user_upgrade_levels[upgrade_id]), False))
+        return fields
     
     @app_commands.command(name="buy", description="Use this to buy upgrades and items!")
     @app_commands.describe(times_to_purchase="How many times you want to buy it. Enter a high number to buy max.")
     @other.utility.is_verified()
-    @other.utility.prevent_command_from_running_when_submitting()
     async def buy(self, interaction: discord.Interaction, thing_to_purchase_id: str, times_to_purchase: int):
+        # Can run during /submit, since purchases and rewards only ever add to or deduct from what's in the database
         if upgrade_manager.get_upgrade(thing_to_purchase_id) is None:
             await interaction.response.send_message("The thing you're trying to buy can't be found!")
         else:
@@ -68,5 +53,11 @@ class ShopCog(commands.Cog):
         embed = await self.create_shop_embed(interaction)
         await interaction.followup.send(embed=embed)
     
+    @buy.autocomplete("thing_to_purchase_id")
+    async def thing_to_purchase_id_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        game_data = get_game_data()
+        return [app_commands.Choice(name=f"{game_data.upgrades[upgrade_id].name} ({upgrade_id})", value=upgrade_id)
+                for upgrade_id in game_data.upgrade_index.search(current)]
+    
 async def setup(bot: commands.Bot):
     await bot.add_cog(ShopCog(bot))
\ No newline at end of file
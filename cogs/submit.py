@@ -1,35 +1,193 @@
+import asyncio
+import datetime
 import os
 import re
-import typing
-from typing import Any
+from typing import Any, Optional
 
 import aiosqlite
 import discord
 import other.utility
+from classes.beatmap import Beatmap, Beatmapset
+from classes.beatmap_store import beatmap_store
 from classes.currency import CurrencyManager
 from classes.exp import ExpManager
-from classes.http_session import http_session
+from classes.http_session import OSU_WEBSITE_URL, http_session
+from classes.message_dispatcher import message_trigger
+from classes.metrics import metrics
+from classes.process_pool import process_pool
+from classes.replay import TAIKO_MODE, Replay, parse_replay
 from classes.score import Score
+from classes.score_archive import score_archive
+from classes.score_trace import score_trace_store
+from classes.submit_workers import submit_worker_pool
+from classes.user_lock import user_lock_manager
 from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import commands
 from other.global_constants import *
 
+MAX_REPLAY_FILE_SIZE = 5_000_000  # Bytes. Taiko replays are well under this, even for long maps.
+MAX_REPLAY_AGE = datetime.timedelta(hours=24)  # The same window as the osu! API's recent scores
+REPLAY_FILENAME_PATTERN = r"\.osr"
 
 class SubmitCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
-    @commands.Cog.listener(name="on_message")
+    @message_trigger(attachment_pattern=REPLAY_FILENAME_PATTERN)
     async def old_submit(self, message: discord.Message):
-        """When replay file is posted, redirect user to use /submit."""
+        """When replay files are posted, submit them if replay submission is enabled. Otherwise, redirect user to use /submit."""
         
-        # Skip attachment if it's not a replay (doesn't contain ".osr" at the end)
-        # https://regex-vis.com/?r=.*%3F%5C.osr
-        for attachment in message.attachments:
-            if re.match(r".*?\.osr", attachment.filename) is not None:
-                await message.channel.send("We've switched to using `/submit`!")
+        # Skip attachment if it's not a replay (doesn't contain ".osr")
+        replay_attachments = [attachment for attachment in message.attachments if re.search(REPLAY_FILENAME_PATTERN, attachment.filename) is not None]
+        
+        if not REPLAY_SUBMISSION_ENABLED:
+            await message.channel.send("We've switched to using `/submit`!")
+            return
+        
+        await self.submit_replays(message, replay_attachments)
+    
+    async def submit_replays(self, message: discord.Message, replay_attachments: list[discord.Attachment]):
+        """Submits the posted replays' scores through the same pipeline as /submit, looking up only those scores instead of the user's recent ones."""
+        
+        osu_id = await other.utility.get_osu_id(discord_id=message.author.id)
+        if osu_id is None:
+            await message.channel.send("You aren't verified yet! Use `/verify` first.")
+            return
+        
+        # Prevent user from submitting replays while /submit is running, and vice versa
+        async with user_lock_manager.hold(message.author.id) as acquired:
+            if not acquired:
+                await message.channel.send("Wait for your current submission to finish first!")
+                return
+            
+            retry_after = other.utility.take_submit_cooldown(message.author.id)
+            if retry_after is not None:
+                await message.channel.send(f"You are on cooldown. Try again in {retry_after:.2f}s")
                 return
+            
+            await message.channel.send(f"Reading {len(replay_attachments)} replay(s)...")
+            
+            user_exp_bars_before_submission = await other.utility.get_user_exp_bars(osu_id=osu_id)
+            user_currency_before_submission = await other.utility.get_user_currency(osu_id=osu_id)
+            user_upgrade_levels = await other.utility.get_user_upgrade_levels(osu_id=osu_id)
+            
+            exp_manager = ExpManager(user_exp_bars_before_submission, user_upgrade_levels)
+            currency_manager = CurrencyManager(user_currency_before_submission, user_upgrade_levels)
+            display_each_score = Choice(name="Yes", value=1)
+            
+            all_scores = await self.create_scores_from_replays(message.channel, osu_id, replay_attachments)
+            await self.process_and_display_score_impl(message.channel, display_each_score, all_scores, exp_manager, currency_manager)
+            await self.display_total_exp_and_currency_change(message.author.id, message.channel, exp_manager, currency_manager)
+            
+            await self.process_and_display_levelup_bonus(message.channel, exp_manager, currency_manager, osu_id)
+    
+    async def create_scores_from_replays(self, channel: discord.abc.Messageable, osu_id: int, replay_attachments: list[discord.Attachment]) -> list[Score]:
+        """
+        Downloads and parses all replays at once, then turns the valid ones into scores, oldest first.
+        Every replay becomes the osu! API's score under its online score ID, so they are deduplicated with /submit's scores.
+        """
+        
+        osu_username = await other.utility.get_osu_username(osu_id=osu_id)
+        assert osu_username is not None
+        
+        replay_attachments = [attachment for attachment in replay_attachments if attachment.size <= MAX_REPLAY_FILE_SIZE]
+        replay_files = await asyncio.gather(*(attachment.read() for attachment in replay_attachments))
+        
+        # Parsing decompresses every replay's frames, which is too slow to do on the event loop
+        parsed_replays = await asyncio.gather(*(process_pool.run(parse_replay, replay_file) for replay_file in replay_files), return_exceptions=True)
+        
+        all_scores: list[Score] = []
+        for attachment, replay in zip(replay_attachments, parsed_replays):
+            if isinstance(replay, BaseException):
+                await channel.send(f"Ignoring **{attachment.filename}**\nReason: Replay can't be read")
+                continue
+            
+            beatmap_and_beatmapset = None
+            if replay.mode == TAIKO_MODE:
+                beatmap_and_beatmapset = await beatmap_store.get_beatmap_by_checksum(replay.beatmap_checksum)
+            
+            validation_failed_reason = self.replay_validation_failed_reason(replay, osu_username, beatmap_and_beatmapset)
+            if validation_failed_reason:
+                await channel.send(f"Ignoring **{attachment.filename}**\nReason: {validation_failed_reason}")
+                continue
+            
+            assert beatmap_and_beatmapset is not None
+            beatmap, _ = beatmap_and_beatmapset
+            
+            # The header can be edited, so the score is only taken from osu!, which has to agree with the header
+            score_info = await self.fetch_score_info(replay.online_score_id)
+            if score_info is None or not self.replay_matches_score_info(replay, osu_id, beatmap, score_info):
+                await channel.send(f"Ignoring **{attachment.filename}**\nReason: Replay doesn't match its score on osu!")
+                continue
+            
+            score = await Score.create_score_object(score_info)
+            # The replay's timestamp was checked already, but the score's is the one submitted_scores deduplicates by until it's cleaned up
+            if datetime.datetime.now(datetime.timezone.utc) - score.timestamp > MAX_REPLAY_AGE:
+                await channel.send(f"Ignoring **{attachment.filename}**\nReason: Replay is too old. Only replays from the last 24 hours can be submitted")
+                continue
+            all_scores.append(score)
+        
+        # Scores from the API are processed from newest to oldest, but the order of replays depends on how they were uploaded
+        all_scores.sort(key=lambda score: score.timestamp, reverse=True)
+        return all_scores
+    
+    def replay_validation_failed_reason(self, replay: Replay, osu_username: str, beatmap_and_beatmapset: Optional[tuple[Beatmap, Beatmapset]]) -> str:
+        """
+        Replays can be edited, so only replays of online scores are accepted, and their header is checked against the beatmap and the inputs
+        before their score is looked up on osu!. Returns an empty string if the replay is valid.
+        Checks that apply to API scores as well (mods, AFK, already submitted) are done afterwards in score_is_valid.
+        """
+        
+        if replay.mode != TAIKO_MODE:
+            return "Replay isn't an osu!taiko replay"
+        
+        # Nothing about an offline replay can be checked against osu!, so a made up one would be rewarded as if it was played
+        if replay.online_score_id == 0:
+            return "Replay wasn't submitted to osu!. Only replays of online scores can be submitted"
+        
+        if replay.player_name.casefold() != osu_username.casefold():
+            return f"Replay was set by {replay.player_name}, not you"
+        
+        if datetime.datetime.now(datetime.timezone.utc) - replay.timestamp > MAX_REPLAY_AGE:
+            return "Replay is too old. Only replays from the last 24 hours can be submitted"
+        
+        if beatmap_and_beatmapset is None:
+            return "Beatmap can't be found on osu!"
+        
+        beatmap, _ = beatmap_and_beatmapset
+        if replay.num_50s != 0 or replay.num_300s + replay.num_100s + replay.num_misses > beatmap.num_notes:
+            return "Replay's hit counts don't match the beatmap"
+        
+        if replay.num_frames == 0 or replay.num_key_presses < replay.num_300s + replay.num_100s:
+            return "Replay's inputs don't match its hit counts"
+        
+        return ""
+    
+    def replay_matches_score_info(self, replay: Replay, osu_id: int, beatmap: Beatmap, score_info: dict[str, Any]) -> bool:
+        """Whether the replay's header is the one of the score the osu! API has under the replay's online score ID."""
+        
+        score_statistics: dict[str, int] = score_info['statistics']
+        return (score_info['user']['id'] == osu_id and score_info['beatmap']['id'] == beatmap.id
+                and score_statistics.get('great', 0) == replay.num_300s
+                and score_statistics.get('ok', 0) == replay.num_100s
+                and score_statistics.get('miss', 0) == replay.num_misses)
+    
+    async def fetch_score_info(self, score_id: int) -> Optional[dict[str, Any]]:
+        """The osu! API's score info of an online score, in the same format as fetch_user_scores. None if it doesn't exist."""
+        
+        headers = {
+            'Accept': "application/json",
+            'Content-Type': "application/json",
+            'x-api-version': "20220705",  # get modern score return info
+            'Authorization': f"Bearer {os.getenv('OSU_API_ACCESS_TOKEN')}",
+        }
+        
+        url = f"{OSU_WEBSITE_URL}/api/v2/scores/taiko/{score_id}"
+        async with http_session.interface.get(url, headers=headers) as resp:
+            if resp.status != 200:
+                return None
+            return await resp.json()
     
     @app_commands.command(name="submit", description="Submit recent scores that you've made, including failed scores.")
     @app_commands.describe(display_each_score="Whether you want to display the details of each score.")
@@ -38,11 +196,27 @@ class SubmitCog(commands.Cog):
         Choice(name="No", value=0)
     ])
     @app_commands.describe(number_of_scores_to_submit="How many recent scores you want to submit (capped at 100). Leave blank to submit up to 100.")
-    @app_commands.checks.dynamic_cooldown(other.utility.command_cooldown_for_live_bot)
+    @other.utility.submit_cooldown()
     @other.utility.is_verified()
     async def submit(self, interaction: discord.Interaction, display_each_score: Choice[int], number_of_scores_to_submit: int = 100):
-        # Slash commands time out after 3 seconds, so we send a response first in case the command takes too long to execute
-        await interaction.response.send_message("Finding scores...")
+        # Taken here rather than in a check, so that it's released however the command ends, including errors before the command runs
+        async with user_lock_manager.hold(interaction.user.id) as acquired:
+            if not acquired:
+                await interaction.response.send_message("Wait for /submit to finish running!")
+                return
+            
+            # Slash commands time out after 3 seconds, so we send a response first in case the command takes too long to execute
+            await interaction.response.send_message("Finding scores...")
+            
+            if submit_worker_pool.is_running():
+                osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
+                assert osu_id is not None
+                await submit_worker_pool.submit(interaction, osu_id, display_each_score.value, number_of_scores_to_submit)
+            else:
+                await self.submit_scores(interaction, display_each_score, number_of_scores_to_submit)
+
+    async def submit_scores(self, interaction: discord.Interaction, display_each_score: Choice[int], number_of_scores_to_submit: int):
+        """Everything /submit does after its initial response. Runs in a submit worker when they are enabled, with a stand-in for the interaction."""
         
         osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
         assert osu_id is not None
@@ -55,15 +229,13 @@ class SubmitCog(commands.Cog):
         currency_manager = CurrencyManager(user_currency_before_submission, user_upgrade_levels)
         webhook = interaction.followup
         
-        all_scores = await self.fetch_user_scores(interaction, number_of_scores_to_submit)
-        await self.display_num_scores_fetched(interaction, display_each_score, all_scores)
+        all_scores_info = await self.fetch_user_scores(interaction, number_of_scores_to_submit)
+        await self.display_num_scores_fetched(interaction, display_each_score, all_scores_info)
+        all_scores = [await Score.create_score_object(score_info) for score_info in all_scores_info]
         await self.process_and_display_score_impl(webhook, display_each_score, all_scores, exp_manager, currency_manager)
-        await self.display_total_exp_and_currency_change(interaction, webhook, exp_manager, currency_manager)
+        await self.display_total_exp_and_currency_change(interaction.user.id, webhook, exp_manager, currency_manager)
         
         await self.process_and_display_levelup_bonus(webhook, exp_manager, currency_manager, osu_id)
-        
-        # Prevent user from running /submit and /shop or /buy simultaneously
-        users_currently_running_submit_command.remove(interaction.user.id)
 
     async def fetch_user_scores(self, interaction: discord.Interaction, number_of_scores_to_submit: int):
         headers = {
@@ -74,7 +246,7 @@ class SubmitCog(commands.Cog):
         }
         
         user_osu_id = await other.utility.get_osu_id(discord_id=interaction.user.id)
-        url = f"https://osu.ppy.sh/api/v2/users/{user_osu_id}/scores/recent?include_fails=1&mode=taiko&limit={number_of_scores_to_submit}"
+        url = f"{OSU_WEBSITE_URL}/api/v2/users/{user_osu_id}/scores/recent?include_fails=1&mode=taiko&limit={number_of_scores_to_submit}"
         
         async with http_session.interface.get(url, headers=headers) as resp:
             parsed_response = await resp.json()
@@ -89,13 +261,9 @@ class SubmitCog(commands.Cog):
         original_response = await interaction.original_response()
         await original_response.edit(content=message_content)
 
-    async def process_and_display_score_impl(self, webhook: discord.Webhook, display_each_score: Choice[int], all_scores: list[dict[str, Any]], 
+    async def process_and_display_score_impl(self, webhook: discord.Webhook | discord.abc.Messageable, display_each_score: Choice[int], all_scores: list[Score], 
                                              exp_manager: ExpManager, currency_manager: CurrencyManager):
-        debug_file = open("./data/scores.txt", "w", encoding="utf-8")
-        
-        for score_info in all_scores:
-                
-            score = await Score.create_score_object(score_info)
+        for score in all_scores:
 
             if not await self.score_is_valid(webhook, score, display_each_score):
                 continue
@@ -103,19 +271,23 @@ class SubmitCog(commands.Cog):
             exp_gained_from_score = await exp_manager.process_one_score(score)
             currency_gained_from_score = await currency_manager.process_one_score(score)
             
-            self.write_to_debug_file(debug_file, score, exp_manager, currency_manager)
+            if SCORE_TRACES_ENABLED:
+                score_trace_store.record(score, exp_manager, currency_manager, exp_gained_from_score, currency_gained_from_score)
+            
+            if SCORE_ARCHIVE_ENABLED:
+                score_archive.record(score, exp_gained_from_score, currency_gained_from_score)
             
             await self.add_score_to_database(score)
             
             if display_each_score.value:
                 await self.display_one_score(webhook, score, exp_gained_from_score, currency_gained_from_score, exp_manager, currency_manager)    
         
-        debug_file.close()
+        await beatmap_store.save_new_metadata()
         await webhook.send("All done!")
 
-    async def display_total_exp_and_currency_change(self, interaction: discord.Interaction, webhook: discord.Webhook, 
+    async def display_total_exp_and_currency_change(self, discord_id: int, webhook: discord.Webhook | discord.abc.Messageable, 
                                                     exp_manager: ExpManager, currency_manager: CurrencyManager):
-        osu_username = await other.utility.get_osu_username(discord_id=interaction.user.id)
+        osu_username = await other.utility.get_osu_username(discord_id=discord_id)
         embed = discord.Embed(title=f"{osu_username}'s EXP and currency changes:")
         embed.colour = discord.Color.from_rgb(255,255,255)  # white
         
@@ -142,42 +314,10 @@ class SubmitCog(commands.Cog):
     def add_total_currency_change_to_embed(self, embed: discord.Embed, currency_manager: CurrencyManager):
         for (currency_id, currency_amount_before), currency_amount_after in zip(currency_manager.initial_user_currency.items(), currency_manager.current_user_currency.values()):
             if currency_amount_after > currency_amount_before:
-                value_info = f"{currency_manager.all_currencies[currency_id].animated_discord_emoji}: {currency_amount_before} → {currency_amount_after} (+{currency_amount_after - currency_amount_before})"
+                value_info = f"{currency_manager.game_data.currency_emojis[currency_id]}: {currency_amount_before} → {currency_amount_after} (+{currency_amount_after - currency_amount_before})"
                 embed.add_field(name='', value=value_info, inline=False)
                 
-    def write_to_debug_file(self, file: typing.TextIO, score: Score, exp_manager: ExpManager, currency_manager: CurrencyManager):
-        """For debugging purposes."""
-        
-        file.write(f"OVERALL:\n")
-        attributes = vars(score)
-        for key, value in attributes.items():
-            file.write(f"{key}: {value}\n")
-
-        file.write("\nMODS:\n")
-        for mod in score.mods:
-            file.write(f"{mod.acronym}: {mod.settings}\n")
-                    
-        file.write("\nBEATMAP\n")
-        attributes = vars(score.beatmap)
-        for key, value in attributes.items():
-            file.write(f"{key}: {value}\n")
-                    
-        file.write("\nBEATMAPSET\n")
-        attributes = vars(score.beatmapset)
-        for key, value in attributes.items():
-            file.write(f"{key}: {value}\n")
-            
-        file.write("\nEXP\n")
-        for item in exp_manager.debug_log:
-            file.write(f"{item}\n")
-        
-        file.write("\nCURRENCY\n")
-        for item in currency_manager.debug_log:
-            file.write(f"{item}\n")
-        
-        file.write("\n"*5)
-
-    async def score_is_valid(self, webhook: discord.Webhook, score: Score, display_each_score: Choice[int]) -> bool:
+    async def score_is_valid(self, webhook: discord.Webhook | discord.abc.Messageable, score: Score, display_each_score: Choice[int]) -> bool:
         validation_failed_message = f"Ignoring **{score.beatmapset.artist} - {score.beatmapset.title} [{score.beatmap.difficulty_name}]**\n"
         validation_failed_message += "Reason: "
         
@@ -209,13 +349,14 @@ class SubmitCog(commands.Cog):
         
         return True
 
+    @metrics.timed("database")
     async def add_score_to_database(self, score: Score):
         async with aiosqlite.connect("./data/database.db") as conn:
             query = "INSERT INTO submitted_scores VALUES (?, ?, ?, ?)"
             await conn.execute(query, (score.user_osu_id, score.beatmap.id, score.beatmapset.id, score.timestamp))
             await conn.commit()
     
-    async def display_one_score(self, webhook: discord.Webhook, score: Score, exp_gained_from_score: dict[str, int], currency_gained_from_score: dict[str, int], 
+    async def display_one_score(self, webhook: discord.Webhook | discord.abc.Messageable, score: Score, exp_gained_from_score: dict[str, int], currency_gained_from_score: dict[str, int], 
                                 exp_manager: ExpManager, currency_manager: CurrencyManager):
         embed = discord.Embed()
         embed.title = f"{score.username} submitted a new score:"
@@ -226,7 +367,7 @@ class SubmitCog(commands.Cog):
     
     async def add_metadata_and_score_stats_to_embed(self, embed: discord.Embed, score: Score):
         metadata = f"**[{score.beatmapset.artist} - {score.beatmapset.title} [{score.beatmap.difficulty_name}]]({score.beatmap.url})**"
-        score_stats = f"{score.beatmap.sr:.2f}* ▸ "
+        score_stats = f"{score.beatmap_attributes.sr:.2f}* ▸ "
         score_stats += f"{score.accuracy:.2f}% ▸ "
         score_stats += f"`[{score.num_300s} • {score.num_100s} • {score.num_misses}]` ▸ "
         score_stats += f"{score.mods_human_readable}"
@@ -258,11 +399,11 @@ class SubmitCog(commands.Cog):
     async def add_updated_currency_to_embed(self, embed: discord.Embed, currency_gained_from_score: dict[str, int], currency_manager: CurrencyManager):
         for currency_name, currency_gain in currency_gained_from_score.items():
             if currency_gain > 0:
-                currency_emoji = currency_manager.all_currencies[currency_name].animated_discord_emoji
+                currency_emoji = currency_manager.game_data.currency_emojis[currency_name]
                 currency_amount = currency_manager.current_user_currency[currency_name]
                 embed.add_field(name='', value=f"{currency_emoji}: {currency_amount} (+{currency_gain})", inline=False)
     
-    async def process_and_display_levelup_bonus(self, webhook: discord.Webhook, exp_manager: ExpManager, currency_manager: CurrencyManager, osu_id: int):
+    async def process_and_display_levelup_bonus(self, webhook: discord.Webhook | discord.abc.Messageable, exp_manager: ExpManager, currency_manager: CurrencyManager, osu_id: int):
         currency_gain = await currency_manager.process_levelup_bonus(exp_manager, osu_id)
         
         if currency_gain is not None:
@@ -273,7 +414,7 @@ class SubmitCog(commands.Cog):
             level_change = level_after - level_before
             name = f"Overall Level {level_before} → {level_after} (+{level_change})"
             
-            currency_emoji = currency_manager.all_currencies['taiko_tokens'].animated_discord_emoji
+            currency_emoji = currency_manager.game_data.currency_emojis['taiko_tokens']
             currency_change = currency_gain['taiko_tokens']
             
             # We can't just use the value from currency manager, since it's the currency before the entire submission
@@ -5,6 +5,7 @@ from typing import Optional
 import aiosqlite
 import ossapi
 import other.utility
+from classes.prefix_index import username_index
 from discord import app_commands
 from discord.ext import commands
 from ossapi import UserLookupKey
@@ -26,6 +27,7 @@ class VerificationCog(commands.Cog):
             return
         
         try:
+            osu_api = await get_osu_api()
             osu_user = await osu_api.user(osu_id, key=UserLookupKey.ID)
         except ValueError:
             await interaction.response.send_message("User does not exist!")
@@ -54,6 +56,7 @@ class VerificationCog(commands.Cog):
         
             await self.add_user_to_database(interaction, osu_user, cursor)
             await conn.commit()
+        username_index.set_username(osu_user.id, osu_user.username)
         
         await interaction.response.send_message("Verification successful! Use the `/help` command to see where to start!")
 
@@ -92,6 +95,7 @@ class VerificationCog(commands.Cog):
         assert osu_id is not None
         
         try:
+            osu_api = await get_osu_api()
             osu_user = await osu_api.user(osu_id, key=UserLookupKey.ID)
         except ValueError:
             await interaction.response.send_message("User does not exist!")
@@ -103,6 +107,7 @@ class VerificationCog(commands.Cog):
         async with aiosqlite.connect("./data/database.db") as conn:
             await conn.execute("UPDATE exp_table SET osu_username=? WHERE discord_id=?", (osu_user.username, interaction.user.id))
             await conn.commit()
+        username_index.set_username(osu_id, osu_user.username)
         
         await interaction.response.send_message("Username updated successfully!")
 
@@ -114,6 +119,7 @@ class VerificationCog(commands.Cog):
             return
         
         try:
+            osu_api = await get_osu_api()
             osu_user = await osu_api.user(osu_id, key=UserLookupKey.ID)
         except ValueError:
             await interaction.response.send_message("User does not exist!")
@@ -15,7 +15,7 @@ def init_upgrades() -> dict[str, Upgrade]:
         
     def exp_length_bonus_effect(upgrade_level: int, score: "Score", exp_bar_exp_gain: dict[str, int]):
         if score.is_complete_runthrough_of_map():
-            drain_time_minutes = score.beatmap.drain_time // 60
+            drain_time_minutes = score.beatmap_attributes.drain_time // 60
             exp_bar_exp_gain['Overall'] += (upgrade_level * drain_time_minutes)
     
     all_upgrades['exp_length_bonus'] = (Upgrade(
@@ -1,26 +1,25 @@
-import datetime
+import logging
 import os
-import traceback
+import time
+from typing import Optional
 
+from classes.metrics import metrics
 from discord import app_commands
 from discord.ext import commands
 from other.global_constants import *
 
+logger = logging.getLogger(__name__)
+
 
 @bot.event
 async def on_interaction(interaction: discord.Interaction):
-    """If user is running /submit, add the user in users_currently_running_submit_command."""
-    assert interaction.command is not None
-    if interaction.command.name == "submit":
-        users_currently_running_submit_command.add(interaction.user.id)
+    interaction.extras['start_time'] = time.perf_counter()  # For command_latency_seconds
 
 @bot.event
 async def on_app_command_completion(interaction: discord.Interaction, command: app_commands.Command):
-    """When /submit finishes, remove the user from users_currently_running_submit_command."""
-    if command.name == "submit":
-        users_currently_running_submit_command.discard(interaction.user.id)
+    record_command_completion(interaction, "success")
 
-# Activate error handling only for live version
+# Activate text command error handling only for live version
 if not os.getcwd().endswith("test"):
     @bot.event
     async def on_command_error(ctx: commands.Context, error: commands.errors.CommandInvokeError):
@@ -39,45 +38,60 @@ if not os.getcwd().endswith("test"):
         
         await ctx.send(f"An exception occurred: {error}")
         
-        write_error_to_log(error)
+        write_error_to_log(error, ctx.command.qualified_name if ctx.command is not None else None, ctx.author.id)
 
-    @bot.tree.error
-    async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
-        """
-        Generic error handler for all slash commands.
-        Note that both command-specific and cog-specific error handlers are called before this generic handler.
-        """
-        
-        if isinstance(error, app_commands.CommandOnCooldown):
-            await interaction.response.send_message(error)
-            return
-        
-        # Checks like is_verified are already handled
-        if isinstance(error, app_commands.CheckFailure):
-            return
-        
-        # Remove user from users_currently_running_submit_command if /submit exited early
-        assert interaction.command is not None
-        if interaction.command.name == "submit":
-            users_currently_running_submit_command.remove(interaction.user.id)
-        
-        # Send error message
-        if interaction.response.is_done():
-            original_response = await interaction.original_response()
-            await original_response.edit(content=f"An exception occurred: {error}")
-            
-        else:
-            await interaction.response.send_message(f"An exception occurred: {error}")
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    """
+    Generic error handler for all slash commands.
+    Note that both command-specific and cog-specific error handlers are called before this generic handler.
+    """
+    
+    if isinstance(error, app_commands.CommandOnCooldown):
+        record_command_completion(interaction, "cooldown")
+    
+    elif isinstance(error, app_commands.CheckFailure):
+        record_command_completion(interaction, "check_failed")
+    
+    else:
+        record_command_completion(interaction, "error")
+    
+    # Activate error handling only for live version. The test version keeps discord.py's default handler, which prints the traceback.
+    if os.getcwd().endswith("test"):
+        await app_commands.CommandTree.on_error(bot.tree, interaction, error)
+        return
+    
+    if isinstance(error, app_commands.CommandOnCooldown):
+        await interaction.response.send_message(error)
+        return
+    
+    # Checks like is_verified are already handled
+    if isinstance(error, app_commands.CheckFailure):
+        return
+    
+    # Send error message
+    if interaction.response.is_done():
+        original_response = await interaction.original_response()
+        await original_response.edit(content=f"An exception occurred: {error}")
         
-        write_error_to_log(error)
+    else:
+        await interaction.response.send_message(f"An exception occurred: {error}")
+    
+    assert interaction.command is not None
+    write_error_to_log(error, interaction.command.qualified_name, interaction.user.id)
+
+def record_command_completion(interaction: discord.Interaction, status: str):
+    """Records the time since on_interaction in command_latency_seconds and the log, labelled with the command and how it ended."""
+    
+    start_time = interaction.extras.get('start_time', None)
+    if start_time is None or interaction.command is None:
+        return
+    
+    duration = time.perf_counter() - start_time
+    metrics.histogram("command_latency_seconds", command=interaction.command.qualified_name, status=status).observe(duration)
+    logger.info("App command finished", extra={'command': interaction.command.qualified_name, 'user_id': interaction.user.id, 'status': status, 'duration': round(duration, 3)})
 
-def write_error_to_log(error: commands.errors.CommandInvokeError | app_commands.AppCommandError):
+def write_error_to_log(error: commands.errors.CommandInvokeError | app_commands.AppCommandError, command_name: Optional[str], user_id: int):
     """Errors caught by on_command_error and on_app_command_error are not written to logs, so it has to be done manually."""
     
-    with open("./logs.log", "a", encoding="utf-8") as file:
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%Y-%m-%d %H:%M:%S')
-        file.write(f"[{formatted_time}] [ERROR]\n")
-        traceback.print_tb(tb=error.__traceback__, file=file)
-        file.write(str(error))
-        file.write("\n")
+    logger.error(str(error), exc_info=error, extra={'command': command_name, 'user_id': user_id})
@@ -1,11 +1,16 @@
+import asyncio
+import functools
 import os
+from typing import TYPE_CHECKING, Optional
 
 import discord
+from classes.metrics import metrics
 from discord.ext import commands
 from dotenv import load_dotenv
 from ossapi import OssapiAsync
-from pydrive2.auth import GoogleAuth
-from pydrive2.drive import GoogleDrive
+
+if TYPE_CHECKING:
+    from pydrive2.drive import GoogleDrive
 
 load_dotenv(dotenv_path="./data/sensitive.env", verbose=True, override=True)  # This line applies to the whole process, not just the current script
 
@@ -17,13 +22,52 @@ OSU_API_KEY: str = os.environ['OSU_API_KEY']  # Legacy API
 
 NOTE_HITS_REQUIRED_PER_TAIKO_TOKEN: int = 50
 
-osu_api = OssapiAsync(OSU_CLIENT_ID, OSU_CLIENT_SECRET)
-bot = commands.Bot(command_prefix="rpg!", intents=discord.Intents.all(), activity=discord.CustomActivity(name="🥁 banging your mother 🥁"), help_command=None)
+# Local port of the Prometheus metrics endpoint (see classes/metrics.py). 0 disables the endpoint, but metrics are still collected for rpg!stats.
+METRICS_PORT: int = int(os.getenv('METRICS_PORT', "9464"))
+
+# Opt-in: when enabled, how every submitted score was rewarded is recorded (see classes/score_trace.py) and can be queried with rpg!traces
+SCORE_TRACES_ENABLED: bool = os.getenv('SCORE_TRACES_ENABLED', "0") == "1"
+
+# Every processed score and its rewards are kept in the score archive (see classes/score_archive.py). Set to 0 to stop archiving.
+SCORE_ARCHIVE_ENABLED: bool = os.getenv('SCORE_ARCHIVE_ENABLED', "1") == "1"
+
+# Opt-in: when enabled, .osr files posted in chat are submitted instead of redirecting the user to /submit
+REPLAY_SUBMISSION_ENABLED: bool = os.getenv('REPLAY_SUBMISSION_ENABLED', "0") == "1"
+
+# Opt-in: number of worker processes that /submit runs in (see classes/submit_workers.py). 0 runs it on the bot's own event loop.
+SUBMIT_WORKERS: int = int(os.getenv('SUBMIT_WORKERS', "0"))
+
+# Channels whose messages are checked for message triggers (see classes/message_dispatcher.py), comma separated. Empty checks every channel.
+MESSAGE_TRIGGER_CHANNEL_IDS: frozenset[int] = frozenset(int(channel_id) for channel_id in os.getenv('MESSAGE_TRIGGER_CHANNEL_IDS', "").split(",") if channel_id)
+
+# Most osu! API requests each hourly username refresh makes (see classes/username_refresh.py). Each request looks up 50 users. 0 disables the refresh.
+USERNAME_REFRESH_API_BUDGET: int = int(os.getenv('USERNAME_REFRESH_API_BUDGET', "20"))
+
+bot = commands.Bot(command_prefix="rpg!", intents=discord.Intents.all(), activity=discord.CustomActivity(name="🥁 banging your mother 🥁"), help_command=None,
+                   http_trace=metrics.trace_config("discord"))
+
+# External clients are created when first used rather than on import, since creating them authenticates over the network
+
+_osu_api: Optional[OssapiAsync] = None
+_osu_api_lock = asyncio.Lock()  # So that commands run while the client is being created wait for it instead of creating their own
 
-# Google Cloud (Google Drive)
-google_auth = GoogleAuth(settings_file="data/google_cloud_settings.yaml")
-google_auth.LocalWebserverAuth(launch_browser=False)  # Creates local webserver and auto handles authentication
-google_drive = GoogleDrive(google_auth)
+async def get_osu_api() -> OssapiAsync:
+    """Creating the client fetches a token with a blocking request, so it is done in a thread."""
+    
+    global _osu_api
+    if _osu_api is None:
+        async with _osu_api_lock:
+            if _osu_api is None:
+                _osu_api = await asyncio.to_thread(OssapiAsync, OSU_CLIENT_ID, OSU_CLIENT_SECRET)
+    return _osu_api
 
-# Stores the Discord IDs of people currently running /submit
-users_currently_running_submit_command: set[int] = set()
\ No newline at end of file
+@functools.cache
+def get_google_drive() -> 'GoogleDrive':
+    """Google Cloud (Google Drive). Blocks until authenticated, so only call it outside the event loop."""
+    
+    from pydrive2.auth import GoogleAuth
+    from pydrive2.drive import GoogleDrive
+    
+    google_auth = GoogleAuth(settings_file="data/google_cloud_settings.yaml")
+    google_auth.LocalWebserverAuth(launch_browser=False)  # Creates local webserver and auto handles authentication
+    return GoogleDrive(google_auth)
\ No newline at end of file
@@ -0,0 +1,177 @@
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+LOG_FILE_PATH = os.getenv('LOG_FILE_PATH', "./logs.log")
+LOG_LEVEL = os.getenv('LOG_LEVEL', "INFO")
+LOG_MAX_BYTES = 10 * 1024 * 1024  # The log is also rotated at midnight, whichever comes first
+LOG_BACKUP_COUNT = 30  # Rotated logs kept, as logs.log.1.gz (newest) to logs.log.30.gz
+
+# Per message, records after the first LOG_SAMPLING_BURST in a LOG_SAMPLING_WINDOW are only kept 1 in LOG_SAMPLING_RATE times.
+# Errors are never sampled.
+LOG_SAMPLING_WINDOW = 60.0  # Seconds
+LOG_SAMPLING_BURST = 100
+LOG_SAMPLING_RATE = 20
+
+# Attributes every LogRecord has. Anything else was passed through extra= and is written as its own field.
+STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+queue_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger and message, followed by the fields passed through extra=
+    (eg command, user_id, duration) and the traceback, if any.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for attribute, value in vars(record).items():
+            if attribute not in STANDARD_RECORD_ATTRIBUTES:
+                entry[attribute] = value
+
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Puts records in a queue for the writer thread, so that logging never waits on the disk."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The traceback is formatted now, since its frames (and everything they reference) shouldn't be kept alive until the writer gets to it.
+        # The message is kept apart from the traceback, unlike QueueHandler's default, so that the JSON has them as separate fields.
+        record = logging.makeLogRecord(vars(record))
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Thins out messages that are logged over and over, eg rate limit warnings during a burst of /submits. Kept records count what was dropped."""
+
+    windows: dict[tuple[str, Any], list[float | int]]  # (logger, unformatted message): [window start, records in window, dropped since last kept]
+    lock: threading.Lock
+
+    def __init__(self):
+        super().__init__()
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key, None)
+            if window is None or now - window[0] >= LOG_SAMPLING_WINDOW:
+                window = self.windows[key] = [now, 0, 0]
+            window[1] += 1
+
+            if window[1] <= LOG_SAMPLING_BURST or window[1] % LOG_SAMPLING_RATE == 0:
+                if window[2]:
+                    record.dropped_similar_records = window[2]
+                    window[2] = 0
+                return True
+
+            window[2] += 1
+            return False
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates the log when it reaches LOG_MAX_BYTES or at midnight, and gzips rotated logs."""
+
+    next_midnight: float
+
+    def __init__(self, path: str):
+        super().__init__(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True)
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = compress_log_file
+        self.next_midnight = get_next_midnight()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.next_midnight:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.next_midnight = get_next_midnight()
+
+def compress_log_file(source: str, destination: str):
+    with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:
+        shutil.copyfileobj(source_file, destination_file)
+    os.remove(source)
+
+def get_next_midnight() -> float:
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time()).timestamp()
+
+def setup_logging(log_file_path: str = LOG_FILE_PATH):
+    """
+    Sends every log record (the bot's and discord.py's) through a queue to a writer thread, which appends JSON lines to <log_file_path>.
+    Logging from the event loop is then only a queue put. Uncaught exceptions and warnings are logged as well.
+    """
+
+    global queue_listener
+    if queue_listener is not None:
+        return
+
+    file_handler = CompressingRotatingFileHandler(log_file_path)
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.addHandler(queue_handler)
+
+    queue_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    queue_listener.start()
+    atexit.register(stop_logging)
+
+    logging.captureWarnings(True)
+    sys.excepthook = log_uncaught_exception
+    threading.excepthook = lambda args: log_uncaught_exception(args.exc_type, args.exc_value, args.exc_traceback)  # type: ignore
+
+def stop_logging():
+    """Writes out every record still in the queue. Called at exit."""
+
+    global queue_listener
+    if queue_listener is not None:
+        queue_listener.stop()
+        queue_listener = None
+
+def log_uncaught_exception(exception_type: type[BaseException], exception: BaseException, traceback: Any):
+    if issubclass(exception_type, KeyboardInterrupt):
+        sys.__excepthook__(exception_type, exception, traceback)
+        return
+    logging.getLogger("uncaught").critical("Uncaught exception", exc_info=(exception_type, exception, traceback))
@@ -0,0 +1,158 @@
+import logging
+import sqlite3
+from typing import Callable
+
+from classes.exp import ExpBarName
+from classes.upgrade import upgrade_manager
+from init.currency_init import init_currency
+
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = "./data/database.db"
+
+# Tables read with SELECT *, where every column but osu_id is taken to be a currency / an upgrade.
+# A column the code doesn't know about would break them, so it stops the bot from starting instead of being ignored.
+STRICT_TABLES = ("currency", "upgrades")
+
+
+class MigrationError(Exception):
+    pass
+
+
+def create_user_tables(conn: sqlite3.Connection):
+    """Create the user and score tables."""
+
+    # Only the fixed columns. The exp bar, currency and upgrade columns are added by sync_columns.
+    conn.execute("CREATE TABLE IF NOT EXISTS exp_table (discord_id INTEGER, osu_id INTEGER PRIMARY KEY, osu_username TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS currency (osu_id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TABLE IF NOT EXISTS upgrades (osu_id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TABLE IF NOT EXISTS submitted_scores (osu_id INTEGER, beatmap_id INTEGER, beatmapset_id INTEGER, timestamp TEXT)")
+
+def create_beatmap_tables(conn: sqlite3.Connection):
+    """Create the beatmap store's tables."""
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS beatmaps (
+            id INTEGER PRIMARY KEY, beatmapset_id INTEGER, url TEXT, mode TEXT, difficulty_name TEXT, od REAL, hp REAL,
+            num_notes INTEGER, num_sliders INTEGER, num_spinners INTEGER, drain_time INTEGER, status TEXT, checksum TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS beatmapsets (
+            id INTEGER PRIMARY KEY, artist TEXT, artist_unicode TEXT, title TEXT, title_unicode TEXT, creator TEXT
+        )""")
+
+def create_lookup_indexes(conn: sqlite3.Connection):
+    """Index the columns users and scores are looked up by."""
+
+    conn.execute("CREATE INDEX IF NOT EXISTS exp_table_discord_id ON exp_table (discord_id)")  # is_verified, on every command
+    conn.execute("CREATE INDEX IF NOT EXISTS exp_table_osu_username ON exp_table (osu_username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS submitted_scores_osu_id ON submitted_scores (osu_id, beatmap_id, timestamp)")  # Score.is_already_submitted
+    conn.execute("CREATE INDEX IF NOT EXISTS submitted_scores_timestamp ON submitted_scores (timestamp)")  # regularly_clean_score_database
+    conn.execute("CREATE INDEX IF NOT EXISTS beatmaps_checksum ON beatmaps (checksum)")  # Finding the beatmap of a replay
+
+def create_user_locks_table(conn: sqlite3.Connection):
+    """Create the table of per-user lock leases (see classes/user_lock.py)."""
+
+    conn.execute("CREATE TABLE IF NOT EXISTS user_locks (discord_id INTEGER PRIMARY KEY, owner_id TEXT, expires_at REAL)")
+
+def create_media_uploads_table(conn: sqlite3.Connection):
+    """Create the table of Discord URLs of uploaded /secret media (see classes/media_catalog.py)."""
+
+    conn.execute("CREATE TABLE IF NOT EXISTS media_uploads (content_hash TEXT PRIMARY KEY, url TEXT, expires_at REAL)")
+
+def create_username_nocase_index(conn: sqlite3.Connection):
+    """Index usernames case-insensitively, since users are looked up by username regardless of its case. Replaces the case-sensitive index."""
+
+    conn.execute("CREATE INDEX IF NOT EXISTS exp_table_osu_username_nocase ON exp_table (osu_username COLLATE NOCASE)")
+    conn.execute("DROP INDEX IF EXISTS exp_table_osu_username")
+
+# In the order they are applied. A migration's version is its position in the list, starting from 1.
+# Applied migrations are never edited or reordered, changes go in a new migration at the end.
+MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    create_user_tables,
+    create_beatmap_tables,
+    create_lookup_indexes,
+    create_user_locks_table,
+    create_media_uploads_table,
+    create_username_nocase_index,
+]
+
+def get_expected_columns() -> dict[str, dict[str, str]]:
+    """The columns that come from the code, as table: {column: definition}. New exp bars, currencies and upgrades only need to be added in the code."""
+
+    exp_columns: dict[str, str] = {}
+    for exp_bar_name in ExpBarName.list_as_str():
+        exp_columns[f"{exp_bar_name.lower()}_exp"] = "INTEGER DEFAULT 0"
+        exp_columns[f"{exp_bar_name.lower()}_level"] = "INTEGER DEFAULT 1"
+
+    return {
+        'exp_table': exp_columns,
+        'currency': {currency_name: "INTEGER DEFAULT 0" for currency_name in init_currency().keys()},
+        'upgrades': {upgrade_id: "INTEGER DEFAULT 0" for upgrade_id in upgrade_manager.upgrades.keys()},
+    }
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at TEXT DEFAULT CURRENT_TIMESTAMP)")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def sync_columns(conn: sqlite3.Connection) -> list[str]:
+    """Adds the columns that are in the code but not in the database. Returns the added columns, as table.column."""
+
+    added_columns = []
+    error_message = ""
+    for table, expected_columns in get_expected_columns().items():
+        database_columns = [row[0] for row in conn.execute(f"SELECT name FROM pragma_table_info('{table}')")]
+
+        for column, definition in expected_columns.items():
+            if column not in database_columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                added_columns.append(f"{table}.{column}")
+
+        excess_columns = set(database_columns) - set(expected_columns) - {"osu_id"}
+        if table in STRICT_TABLES and excess_columns:
+            error_message += f"{table} has columns that aren't in the code: {excess_columns}\n"
+
+    if error_message:
+        raise MigrationError(f"Database isn't synced with the code! Removed columns have to be dropped by a migration.\n{error_message}")
+
+    return added_columns
+
+def migrate_database(conn: sqlite3.Connection):
+    """
+    Applies every migration the database hasn't had yet, then adds the columns of new exp bars, currencies and upgrades.
+    Everything happens in one transaction, so if anything fails, the database is left as it was.
+    """
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Transactions are managed manually
+    conn.execute("BEGIN IMMEDIATE")  # Takes the write lock right away, so that nothing can write in between reading the version and migrating
+    try:
+        schema_version = get_schema_version(conn)
+        if schema_version > len(MIGRATIONS):
+            raise MigrationError(f"Database is at schema version {schema_version}, but the code only knows up to {len(MIGRATIONS)}!")
+
+        for version, migration in enumerate(MIGRATIONS[schema_version:], start=schema_version + 1):
+            migration(conn)
+            description = (migration.__doc__ or migration.__name__).strip()
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            logger.info(f"Applied migration {version}: {description}")
+
+        added_columns = sync_columns(conn)
+        if added_columns:
+            logger.info(f"Added columns: {', '.join(added_columns)}")
+
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+
+def migrate_database_file(database_path: str = DATABASE_PATH):
+    """Blocking, run it in a thread from the event loop."""
+
+    conn = sqlite3.connect(database_path)
+    try:
+        migrate_database(conn)
+    finally:
+        conn.close()
@@ -1,20 +1,29 @@
+import asyncio
 import datetime
+import hashlib
+import json
+import logging
 import os
-import sys
-from typing import Optional
+from typing import Any, Optional
 
 import aiosqlite
 import dotenv
 from classes.exp import ExpBar, ExpBarName
-from classes.http_session import http_session
-from classes.mod import AllowedMods
-from classes.upgrade import upgrade_manager
+from classes.game_data import get_game_data
+from classes.http_session import OSU_WEBSITE_URL, http_session
+from classes.metrics import metrics
 from data.channel_list import APPROVED_CHANNEL_ID_LIST
 from discord import app_commands
 from discord.ext import tasks
-from init.currency_init import init_currency
 from other.global_constants import *
 
+logger = logging.getLogger(__name__)
+
+COMMAND_TREE_HASH_PATH = "./data/command_tree_hash.txt"  # Hash of the app commands as of the last sync
+SUBMIT_COOLDOWN = 300.0  # Seconds between submissions of the same user
+
+submit_cooldowns: dict[int, app_commands.Cooldown] = {}  # discord_id: submit cooldown, see take_submit_cooldown
+
 
 @tasks.loop(hours=3)
 async def regularly_clean_score_database():
@@ -43,15 +52,20 @@ async def regularly_refresh_osu_api_access_token():
         'scope': "public",
     }
     
-    async with http_session.interface.post("https://osu.ppy.sh/oauth/token", headers=headers, data=data) as resp:
+    async with http_session.interface.post(f"{OSU_WEBSITE_URL}/oauth/token", headers=headers, data=data) as resp:
         json_file = await resp.json()
         os.environ["OSU_API_ACCESS_TOKEN"] = json_file['access_token']  # Updates local environment variable
         dotenv.set_key(dotenv_path="./data/sensitive.env", key_to_set="OSU_API_ACCESS_TOKEN", value_to_set=json_file['access_token'])  # Global
-        print(f"{datetime.datetime.now()}: Access token refreshed", flush=True)
+        logger.info("Access token refreshed")
 
 @tasks.loop(hours=3)
 async def regularly_backup_database():
-    google_auth.Refresh()  # Refreshes access token, which expires after 1 hour
+    # Google Drive's client is synchronous, so it runs in a thread to keep the event loop responsive
+    await asyncio.to_thread(backup_database_to_google_drive)
+
+def backup_database_to_google_drive():
+    google_drive = get_google_drive()
+    google_drive.auth.Refresh()  # Refreshes access token, which expires after 1 hour
 
     TAIKO_RPG_FOLDER_ID = "1UIregYRQZzmNmPcJdwJBtK9Y7N187fDh"
     current_datetime = datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S")
@@ -66,51 +80,36 @@ async def regularly_backup_database():
     file.SetContentFile("./data/database.db")
     file.Upload()
 
-async def database_sanity_check():
+def get_command_tree_hash() -> str:
+    """Hash of every app command's signature, as sent to Discord when syncing."""
+    
+    command_payloads = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(command_payloads, sort_keys=True).encode()).hexdigest()
+
+async def sync_command_tree(force: bool = False) -> Optional[int]:
     """
-    Checks if all the buffs and currencies are present in the database.
-    Force exits program if there are things missing in the database, or if there are excess items in the database.
+    Syncs app commands to Discord if their signatures changed since the last sync, or if <force> is set.
+    Syncing is slow and rate limited, so restarts that don't change any command skip it. Returns the number of synced commands, or None if skipped.
     """
     
-    error_message: str = ""
+    command_tree_hash = get_command_tree_hash()
+    if not force and os.path.isfile(COMMAND_TREE_HASH_PATH):
+        with open(COMMAND_TREE_HASH_PATH, encoding="utf-8") as file:
+            if file.read().strip() == command_tree_hash:
+                return None
     
-    async with aiosqlite.connect("./data/database.db") as conn:
-        cursor = await conn.cursor()
-        
-        # Checking upgrades
-        upgrades_in_code = [upgrade_id for upgrade_id in upgrade_manager.upgrades.keys()]
-        
-        await cursor.execute("SELECT name FROM pragma_table_info('upgrades') WHERE name != 'osu_id'")
-        data = await cursor.fetchall()
-        upgrades_in_database = [row[0] for row in data]
-            
-        if sorted(upgrades_in_code) != sorted(upgrades_in_database):
-            error_message += "WARNING: Upgrades aren't synced in database!\n"
-            error_message += f"Outlier in code: {set(upgrades_in_code) - set(upgrades_in_database)}\n"
-            error_message += f"Outlier in database: {set(upgrades_in_database) - set(upgrades_in_code)}\n"
-        
-        # Checking currency
-        currency_in_code = init_currency().keys()
-        
-        await cursor.execute("SELECT name FROM pragma_table_info('currency') WHERE name != 'osu_id'")
-        data = await cursor.fetchall()
-        currency_in_database = [row[0] for row in data]
-
-        if sorted(currency_in_code) != sorted(currency_in_database):
-            error_message += "WARNING: Currency isn't synced in database!\n"
-            error_message += f"Outlier in code: {set(currency_in_code) - set(currency_in_database)}\n"
-            error_message += f"Outlier in database: {set(currency_in_database) - set(currency_in_code)}\n"
-        
-    if error_message:
-        print(error_message)
-        sys.exit(-1)
-        
+    synced = await bot.tree.sync()
+    with open(COMMAND_TREE_HASH_PATH, "w", encoding="utf-8") as file:
+        file.write(command_tree_hash)
+    return len(synced)
+
 def is_verified():
     """
     Decorator. Checks if user is verified.
     If user isn't an admin, sends a message and returns False. Returns True otherwise.
     """
 
+    @metrics.timed("check", "is_verified")
     async def predicate(interaction: discord.Interaction) -> bool:
         async with aiosqlite.connect("./data/database.db") as conn:
             cursor = await conn.cursor()
@@ -128,45 +127,82 @@ def is_verified():
     # Adds the check
     return app_commands.check(predicate)
 
-def prevent_command_from_running_when_submitting():
+async def send_in_all_channels(message: str):
+    """Sends <message> in all approved channels."""
+    
+    for channel_id in APPROVED_CHANNEL_ID_LIST:
+        channel = bot.get_channel(channel_id)
+        await channel.send(message)  # type: ignore
+
+def submit_cooldown():
     """
-    Decorator. Prevents the user from running a command with this decorator if /submit is still being run.
-    This is important for commands that depend on perfectly up-to-date currency / exp.
+    Decorator. Gives /submit a cooldown on the live version of the bot, while disabling it for the test version.
+    The cooldown is shared with replay submission (see take_submit_cooldown).
     """
     
+    @metrics.timed("check", "submit_cooldown")
     async def predicate(interaction: discord.Interaction) -> bool:
-        if interaction.user.id in users_currently_running_submit_command:
-            await interaction.response.send_message("Wait for /submit to finish running!")
-            return False
+        retry_after = take_submit_cooldown(interaction.user.id)
+        if retry_after is not None:
+            raise app_commands.CommandOnCooldown(submit_cooldowns[interaction.user.id], retry_after)
         return True
     
     # Adds the check
     return app_commands.check(predicate)
 
-async def send_in_all_channels(message: str):
-    """Sends <message> in all approved channels."""
+def take_submit_cooldown(discord_id: int) -> Optional[float]:
+    """
+    Starts the user's submit cooldown, shared by /submit and replay submission so that switching between them doesn't get around it.
+    Returns the seconds left if the user is still on cooldown, or None if they can submit. Never on cooldown in the test version.
+    """
     
-    for channel_id in APPROVED_CHANNEL_ID_LIST:
-        channel = bot.get_channel(channel_id)
-        await channel.send(message)  # type: ignore
-
-def command_cooldown_for_live_bot(interaction: discord.Interaction) -> Optional[app_commands.Cooldown]:
-    """Makes certain commands (eg submit) have a cooldown on the live version of the bot, while disabling it for the test version."""
     if os.getcwd().endswith("test"):
         return None
-    return app_commands.Cooldown(rate=1, per=300.0)
     
-def create_str_of_allowed_mods() -> str:
-    """Creates a string listing all currently accepted mods."""
+    cooldown = submit_cooldowns.get(discord_id, None)
+    if cooldown is None:
+        cooldown = submit_cooldowns[discord_id] = app_commands.Cooldown(rate=1, per=SUBMIT_COOLDOWN)
+    return cooldown.update_rate_limit()
+    
+async def get_beatmap_attributes_from_api(beatmap_id: int, mods: int) -> dict[str, Any]:
+    """Fetches the difficulty attributes of a beatmap from the osu! API. <mods> is the bitwise enum of the mod combination."""
+    
+    headers = {
+        'Accept': "application/json",
+        'Content-Type': "application/json",
+        'Authorization': f"Bearer {os.getenv('OSU_API_ACCESS_TOKEN')}",
+    }
     
-    new_message = ""
+    params = {
+        'ruleset': "taiko",
+        'mods': mods
+    }
+    
+    url = f"{OSU_WEBSITE_URL}/api/v2/beatmaps/{beatmap_id}/attributes"
+    async with http_session.interface.post(url, headers=headers, params=params) as resp:
+        parsed_response = await resp.json()
+        return parsed_response['attributes']
+
+async def lookup_beatmap_from_api(checksum: str) -> Optional[dict[str, Any]]:
+    """Finds a beatmap (including its beatmapset) from the MD5 of its .osu file. Returns None if there is no such beatmap."""
     
-    # Adds all allowed mods to the message
-    for mod in AllowedMods.list_as_str():
-        new_message += f"{mod} "
+    headers = {
+        'Accept': "application/json",
+        'Content-Type': "application/json",
+        'Authorization': f"Bearer {os.getenv('OSU_API_ACCESS_TOKEN')}",
+    }
     
-    return new_message.strip()  # Removes trailing space
+    url = f"{OSU_WEBSITE_URL}/api/v2/beatmaps/lookup"
+    async with http_session.interface.get(url, headers=headers, params={'checksum': checksum}) as resp:
+        if resp.status != 200:
+            return None
+        return await resp.json()
+
+def create_str_of_allowed_mods() -> str:
+    """Creates a string listing all currently accepted mods."""
+    return get_game_data().allowed_mods_str
 
+@metrics.timed("database")
 async def user_is_in_database(osu_id: Optional[int] = None, discord_id: Optional[int] = None, osu_username: Optional[str] = None) -> bool:
     """Checks if user is in the database."""
     
@@ -181,10 +217,11 @@ async def user_is_in_database(osu_id: Optional[int] = None, discord_id: Optional
             await cursor.execute("SELECT 1 FROM exp_table WHERE discord_id=?", (discord_id,))
             
         elif osu_username is not None:
-            await cursor.execute("SELECT 1 FROM exp_table WHERE osu_username=?", (osu_username,))
+            await cursor.execute("SELECT 1 FROM exp_table WHERE osu_username=? COLLATE NOCASE", (osu_username,))
         
         return await cursor.fetchone() is not None
 
+@metrics.timed("database")
 async def get_osu_id(discord_id: Optional[int] = None, osu_username: Optional[str] = None) -> Optional[int]:
     """Returns None if not found in database."""
     
@@ -195,13 +232,14 @@ async def get_osu_id(discord_id: Optional[int] = None, osu_username: Optional[st
             await cursor.execute("SELECT osu_id FROM exp_table WHERE discord_id=?", (discord_id,))
             
         elif osu_username is not None:
-            await cursor.execute("SELECT osu_id FROM exp_table WHERE osu_username=?", (osu_username,))
+            await cursor.execute("SELECT osu_id FROM exp_table WHERE osu_username=? COLLATE NOCASE", (osu_username,))
         
         data = await cursor.fetchone()
         if data is not None:
             return data[0]
         return None
 
+@metrics.timed("database")
 async def get_discord_id(osu_id: Optional[int] = None, osu_username: Optional[str] = None) -> Optional[int]:
     """Returns None if not found in database."""
     
@@ -212,13 +250,14 @@ async def get_discord_id(osu_id: Optional[int] = None, osu_username: Optional[st
             await cursor.execute("SELECT discord_id FROM exp_table WHERE osu_id=?", (osu_id,))
         
         elif osu_username is not None:
-            await cursor.execute("SELECT discord_id FROM exp_table WHERE osu_username=?", (osu_username,))
+            await cursor.execute("SELECT discord_id FROM exp_table WHERE osu_username=? COLLATE NOCASE", (osu_username,))
         
         data = await cursor.fetchone()
         if data is not None:
             return data[0]
         return None
 
+@metrics.timed("database")
 async def get_osu_username(discord_id: Optional[int] = None, osu_id: Optional[int] = None) -> Optional[str]:
     """Returns None if not found in database."""
     
@@ -236,6 +275,7 @@ async def get_osu_username(discord_id: Optional[int] = None, osu_id: Optional[in
             return data[0]
         return None
  
+@metrics.timed("database")
 async def get_user_exp_bars(discord_id: Optional[int] = None, osu_id: Optional[int] = None, osu_username: Optional[str] = None) -> dict[str, ExpBar]:
     
     user_exp_bars = {}
@@ -250,7 +290,7 @@ async def get_user_exp_bars(discord_id: Optional[int] = None, osu_id: Optional[i
             elif osu_id is not None:
                 await cursor.execute(f"SELECT {exp_bar_name.lower()}_exp FROM exp_table WHERE osu_id=?", (osu_id,))
             elif osu_username is not None:
-                await cursor.execute(f"SELECT {exp_bar_name.lower()}_exp FROM exp_table WHERE osu_username=?", (osu_username,))
+                await cursor.execute(f"SELECT {exp_bar_name.lower()}_exp FROM exp_table WHERE osu_username=? COLLATE NOCASE", (osu_username,))
             
             data = await cursor.fetchone()
             
@@ -262,6 +302,7 @@ async def get_user_exp_bars(discord_id: Optional[int] = None, osu_id: Optional[i
     
     return user_exp_bars
 
+@metrics.timed("database")
 async def get_user_currency(discord_id: Optional[int] = None, osu_id: Optional[int] = None, osu_username: Optional[str] = None) -> dict[str, int]:
     
     if discord_id is not None:
@@ -283,10 +324,10 @@ async def get_user_currency(discord_id: Optional[int] = None, osu_id: Optional[i
     return user_currency
 
 def create_str_of_user_currency(user_currency: dict[str, int]) -> str:
+    currency_emojis = get_game_data().currency_emojis
     output = ""
     for currency_id, currency_amount in user_currency.items():
-        all_currencies = init_currency()
-        output += f"{currency_amount} {all_currencies[currency_id].animated_discord_emoji}  "
+        output += f"{currency_amount} {currency_emojis[currency_id]}  "
     return output
 
 def prettify_currency_db_name(currency_name: str) -> str:
@@ -295,6 +336,7 @@ def prettify_currency_db_name(currency_name: str) -> str:
     }
     return pretty_currency_name[currency_name]
 
+@metrics.timed("database")
 async def get_user_upgrade_levels(discord_id: Optional[int] = None, osu_id: Optional[int] = None, osu_username: Optional[str] = None) -> dict[str, int]:
     if discord_id is not None:
         osu_id = await get_osu_id(discord_id=discord_id)
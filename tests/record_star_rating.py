@@ -0,0 +1,63 @@
+"""
+Adds a ranked beatmap to the star rating corpus of tests/test_star_rating.py: downloads its .osu file and records the star rating
+the osu! API gives it with the given mods. Needs OSU_API_ACCESS_TOKEN.
+Usage: python -m tests.record_star_rating <beatmap_id> [mod acronyms...], eg python -m tests.record_star_rating 75 HD DT
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import sys
+
+import aiohttp
+from classes.mod import mods_to_bitmask
+
+OSU_WEBSITE_URL = os.getenv('OSU_WEBSITE_URL', "https://osu.ppy.sh")
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(__file__), "star_rating_corpus")
+
+
+async def record_star_rating(beatmap_id: int, mod_acronyms: list[str]):
+    headers = {
+        'Accept': "application/json",
+        'Content-Type': "application/json",
+        'Authorization': f"Bearer {os.environ['OSU_API_ACCESS_TOKEN']}",
+    }
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{OSU_WEBSITE_URL}/osu/{beatmap_id}") as resp:
+            resp.raise_for_status()
+            content = await resp.read()
+        if not content:
+            raise ValueError(f"Beatmap {beatmap_id} has no .osu file")
+
+        params = {'ruleset': "taiko", 'mods': mods_to_bitmask(mod_acronyms)}
+        async with session.post(f"{OSU_WEBSITE_URL}/api/v2/beatmaps/{beatmap_id}/attributes", headers=headers, params=params) as resp:
+            resp.raise_for_status()
+            star_rating = (await resp.json())['attributes']['star_rating']
+
+    file_name = f"{beatmap_id}.osu"
+    with open(os.path.join(CORPUS_DIRECTORY, file_name), "wb") as osu_file:
+        osu_file.write(content)
+
+    corpus_path = os.path.join(CORPUS_DIRECTORY, "corpus.json")
+    with open(corpus_path, "r") as corpus_file:
+        corpus = json.load(corpus_file)
+
+    # Re-recording a beatmap with the same mods replaces its entry, eg after the beatmap was updated
+    corpus = [entry for entry in corpus if (entry['file'], entry['mods']) != (file_name, mod_acronyms)]
+    corpus.append({
+        'file': file_name,
+        'mods': mod_acronyms,
+        'star_rating': star_rating,
+        'source': f"osu! API, recorded on {datetime.date.today().isoformat()}",
+    })
+
+    with open(corpus_path, "w") as corpus_file:
+        json.dump(corpus, corpus_file, indent=4)
+        corpus_file.write("\n")
+
+    print(f"Beatmap {beatmap_id} +{''.join(mod_acronyms) or 'NM'}: {star_rating:.2f}*")
+
+if __name__ == "__main__":
+    asyncio.run(record_star_rating(int(sys.argv[1]), [mod_acronym.upper() for mod_acronym in sys.argv[2:]]))
@@ -0,0 +1,55 @@
+import benchmarks.offline  # noqa: F401, sets up the environment classes/ needs, so it has to be imported first
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from classes.message_dispatcher import MessageDispatcher, message_trigger
+
+
+class TriggerCog:
+    def __init__(self):
+        self.called = []
+
+    @message_trigger(content_pattern=r"727")
+    async def wysi(self, message):
+        self.called.append("wysi")
+
+    @message_trigger(content_pattern=r"\d{3}")
+    async def three_digits(self, message):
+        self.called.append("three_digits")
+
+    @message_trigger(content_pattern=r"(\w)\1{2}")
+    async def repeated_letter(self, message):
+        self.called.append("repeated_letter")
+
+    @message_trigger(attachment_pattern=r"\.osr")
+    async def replay(self, message):
+        self.called.append("replay")
+
+
+def dispatch(content: str, filenames: tuple[str, ...] = ()) -> list[str]:
+    cog = TriggerCog()
+    dispatcher = MessageDispatcher()
+    dispatcher.build([cog])
+    message = SimpleNamespace(
+        content=content,
+        attachments=[SimpleNamespace(filename=filename) for filename in filenames],
+        author=SimpleNamespace(bot=False, id=1),
+        channel=SimpleNamespace(id=1),
+    )
+    asyncio.run(dispatcher.dispatch(message))  # type: ignore
+    return sorted(cog.called)
+
+
+@pytest.mark.parametrize("content, filenames, expected", [
+    ("727", (), ["three_digits", "wysi"]),  # Overlapping matches both fire
+    ("123", (), ["three_digits"]),
+    ("aaa", (), ["repeated_letter"]),  # Backreferences still refer to the trigger's own group
+    ("abc", (), []),
+    ("7<@1>27", (), ["three_digits", "wysi"]),  # Markup is removed before matching
+    ("hi", ("score.osr",), ["replay"]),
+    ("hi", ("score.png",), []),
+])
+def test_dispatch(content: str, filenames: tuple[str, ...], expected: list[str]):
+    assert dispatch(content, filenames) == expected
@@ -0,0 +1,26 @@
+import json
+import os
+
+import pytest
+from classes.taiko_difficulty import STAR_RATING_TOLERANCE, calculate_difficulty_attributes
+
+# .osu files with the star rating osu! gives them, added with tests/record_star_rating.py
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(__file__), "star_rating_corpus")
+
+with open(os.path.join(CORPUS_DIRECTORY, "corpus.json"), "r") as corpus_file:
+    CORPUS: list[dict] = json.load(corpus_file)
+
+if not CORPUS:
+    pytest.skip("No beatmaps recorded yet, see tests/record_star_rating.py", allow_module_level=True)
+
+
+@pytest.mark.parametrize("entry", CORPUS, ids=[f"{entry['file']}+{''.join(entry['mods']) or 'NM'}" for entry in CORPUS])
+def test_star_rating_matches_osu(entry: dict):
+    clock_rate = 1.0
+    if any(mod_acronym in ["DT", "NC"] for mod_acronym in entry['mods']):
+        clock_rate = 1.5
+    elif any(mod_acronym in ["HT", "DC"] for mod_acronym in entry['mods']):
+        clock_rate = 0.75
+
+    attributes = calculate_difficulty_attributes(os.path.join(CORPUS_DIRECTORY, entry['file']), clock_rate)
+    assert abs(attributes['star_rating'] - entry['star_rating']) <= STAR_RATING_TOLERANCE, entry['source']